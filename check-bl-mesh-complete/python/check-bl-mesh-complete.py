@@ -1,9 +1,43 @@
 #!/usr/bin/env python
 
-from collections import defaultdict
+'''
+This script is used to check the mesh-complete files of boundary layer mesh domains.
+
+Usage:
+
+    check-bl-mesh-complete.py VOLUME_MESH DOMAIN_DIR [DOMAIN_DIR ...] 
+        [ --num-workers NUM_WORKERS ] 
+        [ --tolerance TOLERANCE ]
+        [ --report-file REPORT_FILE ]
+
+  where
+
+      VOLUME_MESH - The complete volume mesh (.vtu) file.
+
+      DOMAIN_DIR - A mesh-complete directory for a domain of the volume mesh.
+
+      NUM_WORKERS - The number of processes used to check mesh files (default 1).
+
+      TOLERANCE - The distance within which nodes are matched (default 0.0, exact match).
+
+      REPORT_FILE - The JSON file the failures are written to (default check-bl-mesh-complete.json).
+
+The nodes of the volume mesh, exterior surface, walls and face mesh files of each domain are checked to 
+match nodes of the volume mesh with the same GlobalNodeID. 
+'''
+
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
 import os
 import sys
+import numpy as np
 import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+
+# The node matching module is in the node-matching directory of this repository.
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "node-matching", "python"))
+from node_matching import NodeMatcher
 
 def add_geom(geom, renderer):
     mapper = vtk.vtkPolyDataMapper()
@@ -22,8 +56,27 @@ def add_sphere(center, renderer):
     poly_data = sphere.GetOutput()
     return add_geom(poly_data, renderer)
 
+def get_points(mesh):
+    '''Get the points of a mesh as a NumPy array.
+    '''
+    if mesh.GetNumberOfPoints() == 0:
+        return np.zeros((0,3))
+    return vtk_to_numpy(mesh.GetPoints().GetData())
+
+def match_points(matcher, point_ids, num_points, points, check_point_ids):
+    '''Match points to the nodes of a mesh.
+
+       Returns the node matches and the points whose IDs are different from the IDs of the 
+       nodes they match.
+    '''
+    points = vtk_to_numpy(points.GetData())[:num_points]
+    check_point_ids = vtk_to_numpy(check_point_ids)[:num_points]
+    matches = matcher.match(points)
+    diff_ids = matches.pairs[point_ids[matches.pairs[:,0]] != check_point_ids[matches.pairs[:,1]]]
+    return matches, diff_ids, points
+
 class SurfaceMesh(object):
-    def __init__(self, file_name):
+    def __init__(self, file_name, tolerance=0.0):
       self.mesh = self.read_mesh(file_name)
       num_points = self.mesh.GetNumberOfPoints()
       points = self.mesh.GetPoints()
@@ -33,143 +86,20 @@ class SurfaceMesh(object):
       self.point_ids = point_ids
       print("[SurfaceMesh] num_points: {0:d}".format(num_points))
 
-      pt = 3*[0.0]
-      max_x = -1e9
-      max_y = -1e9
-      max_z = -1e9
-      min_x = 1e9
-      min_y = 1e9
-      min_z = 1e9
-
-      for i in range(num_points):
-          point = points.GetPoint(i, pt)
-          x = pt[0]
-          y = pt[1]
-          z = pt[2]
-          if x < min_x:
-              min_x = x
-          elif x > max_x:
-              max_x = x
-          if y < min_y:
-              min_y = y
-          elif y > max_y:
-              max_y = y
-          if z < min_z:
-              min_z = z
-          elif z > max_z:
-              max_z = z
-      #_for i in range(num_points)
-
-      self.nodal_coords = {}
-      point_hash = defaultdict(list)
-      num_dupe_points = 0
-
-      dx = (max_x - min_x)
-      if dx != 0.0:
-        self.dx = dx 
-      else: 
-        self.dx = 1.0
-
-      dy = (max_y - min_y)
-      if dy != 0.0:
-        self.dy = dy 
-      else: 
-        self.dy = 1.0
-
-      dz = (max_z - min_z)
-      if dz != 0.0:
-        self.dz = dz 
-      else: 
-        self.dz = 1.0
-
-      for i in range(num_points):
-          point = points.GetPoint(i, pt)
-          pid = point_ids.GetValue(i)
-          x = pt[0]
-          y = pt[1]
-          z = pt[2]
-          print("{0:d} {1:s}".format(pid, str(pt)))
-          self.nodal_coords[pid] = [x, y, z]
-
-          xs = (x - min_x) / self.dx 
-          ys = (y - min_y) / self.dy 
-          zs = (z - min_z) / self.dz 
-          ih = xs * num_points
-          jh = ys * num_points
-          kh = zs * num_points
-          index = int(ih + jh + kh) % self.num_points
-          pts = point_hash[index]
-          if len(pts) == 0:
-              point_hash[index].append([x, y, z, pid])
-          else:
-              found_pt = False
-              for hpt in pts:
-                  ddx = hpt[0] - pt[0]
-                  ddy = hpt[1] - pt[1]
-                  ddz = hpt[2] - pt[2]
-                  d = ddx*ddx + ddy*ddy + ddz*ddz
-                  if d == 0.0:
-                      found_pt = True
-                      num_dupe_points += 1
-                      break
-              #_for hpt in pts
-              if not found_pt:
-                  point_hash[index].append([x, y, z, pid])
-      #_for i in range(num_points)
-      print("[SurfaceMesh] num_hash_points: {0:d}".format(len(point_hash)))
-      print("[SurfaceMesh] num_dupe_points: {0:d}".format(num_dupe_points))
-
-      self.point_hash = point_hash 
-      self.max_x = max_x 
-      self.max_y = max_y 
-      self.max_z = max_z 
-      self.min_x = min_x 
-      self.min_y = min_y 
-      self.min_z = min_z
+      # Create a matcher to find nodes by coordinates.
+      self.matcher = NodeMatcher(get_points(self.mesh), tolerance)
+      print("[SurfaceMesh] num_dupe_points: {0:d}".format(self.matcher.num_duplicates))
 
     def check_points(self, num_points, points, point_ids, renderer):
         print("[SurfaceMesh:check_points] ")
         print("[SurfaceMesh:check_points] num_points: {0:d}".format(num_points))
-        pt = 3*[0.0]
-        num_matched_points = 0
-        for i in range(num_points):
-            pid = point_ids.GetValue(i)
-            points.GetPoint(i, pt)
-            x = pt[0]
-            y = pt[1]
-            z = pt[2]
-            xs = (x - self.min_x) / self.dx 
-            ys = (y - self.min_y) / self.dy
-            zs = (z - self.min_z) / self.dz
-            ih = xs * self.num_points
-            jh = ys * self.num_points
-            kh = zs * self.num_points
-            index = int(ih + jh + kh) % self.num_points
-            pts = self.point_hash[index]
-            if len(pts) == 0:
-                #actor = add_sphere(pt, renderer)
-                continue
-            else:
-                found_pt = False
-                for hpt in pts:
-                    dx = hpt[0] - pt[0]
-                    dy = hpt[1] - pt[1]
-                    dz = hpt[2] - pt[2]
-                    d = dx*dx + dy*dy + dz*dz
-                    if d == 0.0:
-                        found_pt = True
-                        found_id = hpt[3]
-                        num_matched_points += 1
-                        break
-                #_for hpt in pts
-                if found_pt:
-                    if (pid != found_id):
-                      #print("[SurfaceMesh:check_points] IDs don't match: {0:d} != {1:d}".format(pid, found_id))
-                      actor = add_sphere(pt, renderer)
-        #_for i in range(num_points):
-
-        print("[SurfaceMesh:check_points] num_matched_points: {0:d} ".format(num_matched_points))
+        matches, diff_ids, points = match_points(self.matcher, vtk_to_numpy(self.point_ids), num_points, points, point_ids)
 
+        for pair in diff_ids:
+            actor = add_sphere(points[pair[1]], renderer)
+
+        print("[SurfaceMesh:check_points] num_matched_points: {0:d} ".format(matches.pairs.shape[0]))
+        print("[SurfaceMesh:check_points] num_diff_id_points: {0:d} ".format(diff_ids.shape[0]))
 
     def read_mesh(self, file_name):
         print("[SurfaceMesh] file_name: " + file_name)
@@ -180,7 +110,7 @@ class SurfaceMesh(object):
         return reader.GetOutput()
 
 class VolumeMesh(object):
-    def __init__(self, file_name):
+    def __init__(self, file_name, tolerance=0.0):
       self.mesh = self.read_mesh(file_name)
 
       geom_filter = vtk.vtkGeometryFilter()
@@ -196,123 +126,24 @@ class VolumeMesh(object):
       self.point_ids = point_ids 
       print("[VolumeMesh] num_points: {0:d}".format(num_points))
 
-      pt = 3*[0.0]
-      max_x = -1e9
-      max_y = -1e9
-      max_z = -1e9
-      min_x = 1e9
-      min_y = 1e9
-      min_z = 1e9
-
-      for i in range(num_points):
-          point = points.GetPoint(i, pt)
-          x = pt[0]
-          y = pt[1]
-          z = pt[2]
-          if x < min_x:
-              min_x = x
-          elif x > max_x:
-              max_x = x
-          if y < min_y:
-              min_y = y
-          elif y > max_y:
-              max_y = y
-          if z < min_z:
-              min_z = z
-          elif z > max_z:
-              max_z = z
-
-      self.nodal_coords = {}
-      point_hash = defaultdict(list)
-      num_dupe_points = 0
-
-      for i in range(num_points):
-          point = points.GetPoint(i, pt)
-          pid = point_ids.GetValue(i)
-          x = pt[0]
-          y = pt[1]
-          z = pt[2]
-          #print("{0:d} {1:s}".format(pid, str(pt)))
-          self.nodal_coords[pid] = [x, y, z]
-
-          xs = (x - min_x) / (max_x - min_x)
-          ys = (y - min_y) / (max_y - min_y)
-          zs = (z - min_z) / (max_z - min_z)
-          ih = xs * num_points
-          jh = ys * num_points
-          kh = zs * num_points
-          index = int(ih + jh + kh) % self.num_points
-          pts = point_hash[index]
-          if len(pts) == 0:
-              point_hash[index].append([x, y, z, pid])
-          else:
-              found_pt = False
-              for hpt in pts:
-                  dx = hpt[0] - pt[0]
-                  dy = hpt[1] - pt[1]
-                  dz = hpt[2] - pt[2]
-                  d = dx*dx + dy*dy + dz*dz
-                  if d == 0.0:
-                      found_pt = True
-                      num_dupe_points += 1
-                      break
-              #_for hpt in pts
-              if not found_pt:
-                  point_hash[index].append([x, y, z, pid])
-      #_for i in range(num_points)
-      print("[VolumeMesh] num_hash_points: {0:d}".format(len(point_hash)))
-      print("[VolumeMesh] num_dupe_points: {0:d}".format(num_dupe_points))
-
-      self.point_hash = point_hash 
-      self.max_x = max_x 
-      self.max_y = max_y 
-      self.max_z = max_z 
-      self.min_x = min_x 
-      self.min_y = min_y 
-      self.min_z = min_z
+      # Create a matcher to find nodes by coordinates.
+      self.matcher = NodeMatcher(get_points(self.mesh), tolerance)
+      print("[VolumeMesh] num_dupe_points: {0:d}".format(self.matcher.num_duplicates))
 
     def check_points(self, num_points, points, point_ids, renderer):
         print("[check_points] ")
         print("[check_points] num_points: {0:d}".format(num_points))
-        pt = 3*[0.0]
-        num_matched_points = 0
-
-        for i in range(num_points):
-            pid = point_ids.GetValue(i)
-            points.GetPoint(i, pt)
-            x = pt[0]
-            y = pt[1]
-            z = pt[2]
-            xs = (x - self.min_x) / (self.max_x - self.min_x)
-            ys = (y - self.min_y) / (self.max_y - self.min_y)
-            zs = (z - self.min_z) / (self.max_z - self.min_z)
-            ih = xs * self.num_points
-            jh = ys * self.num_points
-            kh = zs * self.num_points
-            index = int(ih + jh + kh) % self.num_points
-            pts = self.point_hash[index]
-            if len(pts) == 0:
-                actor = add_sphere(pt, renderer)
-                continue
-            else:
-                found_pt = False
-                for hpt in pts:
-                    dx = hpt[0] - pt[0]
-                    dy = hpt[1] - pt[1]
-                    dz = hpt[2] - pt[2]
-                    d = dx*dx + dy*dy + dz*dz
-                    if d == 0.0:
-                        found_pt = True
-                        found_id = hpt[3]
-                        num_matched_points += 1
-                        break
-                #_for hpt in pts
-                if found_pt:
-                    if (pid != found_id): 
-                      print("[check_points] IDs don't match: {0:d} != {1:d}".format(pid, found_id))
-        #_for i in range(num_points):
+        matches, diff_ids, points = match_points(self.matcher, vtk_to_numpy(self.point_ids), num_points, points, point_ids)
+
+        for i in matches.unmatched:
+            actor = add_sphere(points[i], renderer)
+
+        node_ids = vtk_to_numpy(self.point_ids)
+        check_ids = vtk_to_numpy(point_ids)
+        for i, j in diff_ids:
+            print("[check_points] IDs don't match: {0:d} != {1:d}".format(int(check_ids[j]), int(node_ids[i])))
   
-        print("[check_points] num_matched_points: {0:d} ".format(num_matched_points))
+        print("[check_points] num_matched_points: {0:d} ".format(matches.pairs.shape[0]))
     
     def read_mesh(self, file_name):
         print("[read_volume_mesh] file_name: " + file_name)
@@ -324,14 +155,31 @@ class VolumeMesh(object):
 
 
 class MeshDomain(object):
-    def __init__(self, domain_dir):
+    def __init__(self, domain_dir, read=True):
         self.domain_dir = domain_dir + "/"
         self.mesh_complete_mesh_vtu = None
         self.mesh_complete_exterior_vtp  = None
         self.walls_combined_vtp = None
         self.surface_meshes = None
 
-        self.read_meshes()
+        if read:
+            self.read_meshes()
+
+    def get_file_names(self):
+        '''Get the names of the mesh files in the domain directory.
+        '''
+        file_names = [ self.domain_dir + "mesh-complete.mesh.vtu", self.domain_dir + "mesh-complete.exterior.vtp" ]
+
+        file_name = self.domain_dir + "walls_combined.vtp"
+        if os.path.exists(file_name):
+            file_names.append(file_name)
+
+        surfaces_dir = os.path.join(self.domain_dir, "mesh-surfaces")
+        for surf_file in sorted(os.listdir(surfaces_dir)):
+            if os.path.splitext(surf_file)[1] == ".vtp":
+                file_names.append(os.path.join(surfaces_dir, surf_file))
+
+        return file_names
 
     def read_meshes(self):
         file_name = self.domain_dir + "mesh-complete.mesh.vtu"
@@ -351,9 +199,150 @@ class MeshDomain(object):
           file_name = surfaces_dir + surf_file 
           self.surface_meshes.append((surf_file, SurfaceMesh(file_name)))
 
+class Args(object):
+    '''This class defines the command line arguments to the script.
+    '''
+    PREFIX = "--"
+    VOLUME_MESH = "volume_mesh"
+    DOMAIN_DIRS = "domain_dirs"
+    NUM_WORKERS = "num_workers"
+    TOLERANCE = "tolerance"
+    REPORT_FILE = "report_file"
+
+def cmd(name):
+    '''Create an argparse command argument.
+    '''
+    return Args.PREFIX + name.replace("_", "-")
+
+def parse_args():
+    '''Parse command-line arguments.
+    '''
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(Args.VOLUME_MESH, help="The complete volume mesh (.vtu) file.")
+    parser.add_argument(Args.DOMAIN_DIRS, help="The mesh-complete directories of the domains.", nargs="+")
+    parser.add_argument(cmd(Args.NUM_WORKERS), help="The number of processes used to check mesh files.", type=int, default=1)
+    parser.add_argument(cmd(Args.TOLERANCE),   help="The distance within which nodes are matched.", type=float, default=0.0)
+    parser.add_argument(cmd(Args.REPORT_FILE), help="The JSON file the failures are written to.", 
+      default="check-bl-mesh-complete.json")
+
+    return parser.parse_args()
+
+def read_mesh_arrays(file_name):
+    '''Read the points and GlobalNodeID arrays of a .vtu or .vtp file.
+    '''
+    if os.path.splitext(file_name)[1] == ".vtu":
+        reader = vtk.vtkXMLUnstructuredGridReader()
+    else:
+        reader = vtk.vtkXMLPolyDataReader()
+    reader.SetFileName(file_name)
+    reader.Update()
+    mesh = reader.GetOutput()
+
+    point_ids = mesh.GetPointData().GetArray("GlobalNodeID")
+    if point_ids is not None:
+        point_ids = vtk_to_numpy(point_ids)
+    return get_points(mesh), point_ids
+
+## The volume mesh matcher and node IDs used by a validation process.
+validation_matcher = None
+validation_node_ids = None
+
+def init_validation(points, node_ids, tolerance):
+    '''Create the volume mesh matcher used to check mesh files in a process.
+    '''
+    global validation_matcher, validation_node_ids
+    validation_matcher = NodeMatcher(points, tolerance)
+    validation_node_ids = node_ids
+
+def check_mesh_file(file_name, max_failures=100):
+    '''Check that the nodes of a mesh file match volume mesh nodes with the same GlobalNodeID.
+
+       Returns a dict of the results, the first max_failures failed nodes are listed.
+    '''
+    result = { "file": file_name, "num_points": 0, "num_unmatched": 0, "num_id_mismatches": 0, 
+      "unmatched": [], "id_mismatches": [], "error": None }
+
+    try:
+        points, point_ids = read_mesh_arrays(file_name)
+    except Exception as e:
+        result["error"] = "Unable to read the file: " + str(e)
+        return result
+
+    result["num_points"] = points.shape[0]
+    if point_ids is None:
+        result["error"] = "No GlobalNodeID data."
+        return result
+
+    matches = validation_matcher.match(points)
+    pairs = matches.pairs
+    diff_ids = pairs[validation_node_ids[pairs[:,0]] != point_ids[pairs[:,1]]]
+    result["num_unmatched"] = int(matches.unmatched.shape[0])
+    result["num_id_mismatches"] = int(diff_ids.shape[0])
+
+    for i in matches.unmatched[:max_failures]:
+        result["unmatched"].append({ "index": int(i), "node_id": int(point_ids[i]), "point": points[i].tolist() })
+
+    for i, j in diff_ids[:max_failures]:
+        result["id_mismatches"].append({ "index": int(j), "node_id": int(point_ids[j]), 
+          "volume_node_id": int(validation_node_ids[i]), "point": points[j].tolist() })
+
+    return result
+
+def validate_domains(args):
+    '''Check the mesh files of the domains and write a JSON report of the failures.
+
+       Mesh files are checked concurrently by a pool of num_workers processes. Returns the
+       number of files that failed.
+    '''
+    print("[validate_domains] Volume mesh: " + args.volume_mesh)
+    points, node_ids = read_mesh_arrays(args.volume_mesh)
+    if node_ids is None:
+        raise Exception("The volume mesh has no GlobalNodeID data.")
+    print("[validate_domains] Number of volume mesh nodes: {0:d}".format(points.shape[0]))
+
+    file_names = []
+    for domain_dir in args.domain_dirs:
+        file_names.extend(MeshDomain(domain_dir, read=False).get_file_names())
+    print("[validate_domains] Number of mesh files: {0:d}".format(len(file_names)))
+
+    if args.num_workers > 1:
+        with ProcessPoolExecutor(max_workers=args.num_workers, initializer=init_validation, 
+          initargs=(points, node_ids, args.tolerance)) as executor:
+            results = list(executor.map(check_mesh_file, file_names))
+    else:
+        init_validation(points, node_ids, args.tolerance)
+        results = [check_mesh_file(file_name) for file_name in file_names]
+
+    failures = []
+    for result in results:
+        failed = (result["error"] != None) or (result["num_unmatched"] != 0) or (result["num_id_mismatches"] != 0)
+        status = "FAILED" if failed else "OK"
+        print("[validate_domains] {0:s}  points: {1:d}  unmatched: {2:d}  id mismatches: {3:d}  {4:s}".format(
+          result["file"], result["num_points"], result["num_unmatched"], result["num_id_mismatches"], status))
+        if result["error"] != None:
+            print("[validate_domains]   " + result["error"])
+        if failed:
+            failures.append(result)
+
+    report = { "volume_mesh": args.volume_mesh, "domain_dirs": args.domain_dirs, "tolerance": args.tolerance,
+      "num_files": len(results), "num_failed": len(failures), "failures": failures }
+
+    with open(args.report_file, "w") as file:
+        json.dump(report, file, indent=2)
+
+    print("[validate_domains] Number of failed files: {0:d}".format(len(failures)))
+    print("[validate_domains] Report file: " + args.report_file)
+    return len(failures)
 
 if __name__ == '__main__':
 
+    # Check mesh-complete domains.
+    if len(sys.argv) > 1:
+        args = parse_args()
+        num_failed = validate_domains(args)
+        sys.exit(1 if num_failed != 0 else 0)
+
     # Create renderer and graphics window.
     renderer = vtk.vtkRenderer()
     renderer_win = vtk.vtkRenderWindow()
@@ -444,7 +433,3 @@ if __name__ == '__main__':
     interactor.SetInteractorStyle(vtk.vtkInteractorStyleTrackballCamera())
     interactor.SetRenderWindow(renderer_win)
     interactor.Start()
-
-
-
-
@@ -1,93 +1,255 @@
 #!/usr/bin/env python
 
-'''This script converts the GlobalNodeID and GlobalElementID data arrys of a 
-   .vtp or .vtu file to Int32 data arrays need by SV.  The new int arrays are 
-   created and the modified mesh is written to a new file.
+'''This script converts the data arrays of .vtp or .vtu files to the data types needed by SV,
+   by default the GlobalNodeID and GlobalElementID arrays are converted to Int32 arrays. The
+   modified mesh is written to a new file.
+
+Usage:
+
+    convert-mesh.py MESH_FILE | MESH_COMPLETE_DIR
+        [ --arrays NAME[:TYPE] [NAME[:TYPE] ...] ]
+        [ --type TYPE ]
+        [ --num-workers NUM_WORKERS ]
+        [ --output-dir OUTPUT_DIR ]
+
+  where
+
+      MESH_FILE - A .vtp or .vtu file. The converted mesh is written to MESH_FILE-modified.vtp/.vtu.
+
+      MESH_COMPLETE_DIR - A mesh-complete directory. All of the .vtp and .vtu files in the directory
+          and its sub-directories are converted.
+
+      NAME[:TYPE] - The name of a point or cell data array to convert and optionally the VTK XML type
+          (e.g. Int32, Int64, Float32) to convert it to (default GlobalNodeID GlobalElementID).
+
+      TYPE - The VTK XML type arrays are converted to if no type is given with their name (default Int32).
+
+      NUM_WORKERS - The number of processes used to convert the files of a directory (default 1).
+
+      OUTPUT_DIR - The directory the files of MESH_COMPLETE_DIR are written to (default MESH_COMPLETE_DIR-modified).
+          The sub-directories of MESH_COMPLETE_DIR are kept. Files that do not need converting are copied.
+
+The data types of the arrays are read from the XML header of a file, files whose arrays already have
+the target types are not read. Arrays are converted using NumPy casts.
 '''
 
+from concurrent.futures import ProcessPoolExecutor
 from os import path
-import vtk
+import argparse
 import os
+import re
+import shutil
 import sys
-import xml.etree.ElementTree as et
-
-if __name__ == '__main__':
-
-    file_name = sys.argv[1]
+import numpy as np
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy, numpy_to_vtk
+
+## Map VTK XML data type names to NumPy data types.
+data_type_names = {
+  "Int8": np.int8,
+  "UInt8": np.uint8,
+  "Int16": np.int16,
+  "UInt16": np.uint16,
+  "Int32": np.int32,
+  "UInt32": np.uint32,
+  "Int64": np.int64,
+  "UInt64": np.uint64,
+  "Float32": np.float32,
+  "Float64": np.float64
+}
+
+class Args(object):
+    '''This class defines the command line arguments.
+    '''
+    MESH = "mesh"
+    ARRAYS = "arrays"
+    TYPE = "type"
+    NUM_WORKERS = "num_workers"
+    OUTPUT_DIR = "output_dir"
+
+def cmd(name):
+    '''Create an argparse command argument.
+    '''
+    return "--" + name.replace("_", "-")
+
+def parse_args():
+    '''Parse command-line arguments.
+    '''
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(Args.MESH, help="A .vtp or .vtu file or a mesh-complete directory.")
+    parser.add_argument(cmd(Args.ARRAYS), help="The names of the arrays to convert, NAME or NAME:TYPE.", nargs="+",
+      default=["GlobalNodeID", "GlobalElementID"])
+    parser.add_argument(cmd(Args.TYPE), help="The VTK XML type arrays are converted to.", default="Int32")
+    parser.add_argument(cmd(Args.NUM_WORKERS), help="The number of processes used to convert files.", type=int, default=1)
+    parser.add_argument(cmd(Args.OUTPUT_DIR), help="The directory the files of a mesh-complete directory are written to.")
+
+    return parser.parse_args()
+
+def get_conversions(args):
+    '''Get the VTK XML type each array is converted to.
+    '''
+    conversions = {}
+    for array in args.arrays:
+        name, _, type_name = array.partition(":")
+        if type_name == "":
+            type_name = args.type
+        if type_name not in data_type_names:
+            raise Exception("Unknown data type '{0:s}' for array '{1:s}', types are: {2:s}.".format(type_name,
+              name, ", ".join(data_type_names.keys())))
+        conversions[name] = type_name
+    return conversions
+
+def get_data_types(file_name, block_size=1048576):
+    '''Get the VTK XML data types of the point and cell data arrays of a file.
+
+       Only the XML header is read for files with appended data.
+    '''
+    header = b""
+    with open(file_name, "rb") as file:
+        while True:
+            block = file.read(block_size)
+            header += block
+            if (block == b"") or (header.find(b"<AppendedData", max(0, len(header)-len(block)-13)) != -1):
+                break
+    header = header.split(b"<AppendedData")[0].decode("utf-8", "replace")
 
-    # Get data types.
-    #
     data_types = {}
-    doc = et.parse(file_name)
-    for element in doc.iter('PolyData'):
-        for data_element_t in element.iter('DataArray'):
-            name = data_element_t.attrib['Name'] 
-            dtype = data_element_t.attrib['type'] 
-            #print("Name: {0:s}  type: {1:s}".format(str(name), dtype))
-            data_types[name] = dtype
-      
-    # Read the mesh 
-    #
-    file_base_name, file_extension = path.splitext(file_name)
-    reader = None
-
-    if file_extension == ".vtp":
-        reader = vtk.vtkXMLPolyDataReader()
-    elif file_extension == ".vtu":
-        reader = vtk.vtkXMLUnstructuredGridReader()
-
-    reader.SetFileName(file_name)
-    reader.Update()
-    mesh = reader.GetOutput()
-    num_points = mesh.GetNumberOfPoints()
-    num_cells = mesh.GetNumberOfCells()
-
-    # Check mesh GlobalNodeID data.
-    #
-    if data_types['GlobalNodeID'] != 'Int32':
-        print("GlobalNodeID is a {0:s} array: convert to Int32.".format(data_types['GlobalNodeID']))
-        node_ids = mesh.GetPointData().GetArray("GlobalNodeID")
-        node_id = node_ids.GetValue(0)
-        int_node_ids = vtk.vtkIntArray()
-        int_node_ids.SetNumberOfValues(num_points)
-        int_node_ids.SetName('GlobalNodeID')
-
-        for i in range(num_points):
-            node_id = int(node_ids.GetValue(i))
-            int_node_ids.SetValue(i, node_id)
-
-        mesh.GetPointData().RemoveArray('GlobalNodeID')
-        mesh.GetPointData().AddArray(int_node_ids)
-        mesh.Modified()
-        mesh_modified = True
-
-    # Check mesh GlobalElementID data.
-    #
-    if data_types['GlobalElementID'] != 'Int32':
-        print("GlobalElementIDis a {0:s} array: convert to Int32.".format(data_types['GlobalElementID']))
-        elem_ids = mesh.GetCellData().GetArray("GlobalElementID")
-        int_elem_ids = vtk.vtkIntArray()
-        int_elem_ids.SetNumberOfValues(num_cells)
-        int_elem_ids.SetName('GlobalElementID')
-
-        for i in range(num_cells):
-            elem_id = int(elem_ids.GetValue(i))
-            int_elem_ids.SetValue(i, elem_id)
-
-        mesh.GetCellData().RemoveArray('GlobalElementID')
-        mesh.GetCellData().AddArray(int_elem_ids)
-        mesh.Modified()
-        mesh_modified = True
-
-    # Write a new mesh if that data has been modified.
-    #
-    if mesh_modified:
+    section = None
+    for tag in re.finditer(r'<(/?)(PointData|CellData|Points|Cells|Verts|Lines|Strips|Polys|DataArray)\b([^>]*)>', header):
+        closing, name, attributes = tag.groups()
+        if name != "DataArray":
+            section = None if (closing or attributes.endswith("/")) else name
+        elif (not closing) and (section in ("PointData", "CellData")):
+            attributes = dict(re.findall(r'(\w+)="([^"]*)"', attributes))
+            data_types[attributes["Name"]] = attributes["type"]
+    return data_types
+
+def convert_array(array, type_name):
+    '''Convert a VTK data array to a NumPy array of the given VTK XML type.
+    '''
+    values = vtk_to_numpy(array)
+    dtype = np.dtype(data_type_names[type_name])
+
+    if (dtype.kind in "iu") and (values.shape[0] != 0):
+        info = np.iinfo(dtype)
+        if (values.min() < info.min) or (values.max() > info.max):
+            raise Exception("The values of the '{0:s}' array are out of range for {1:s}.".format(array.GetName(), type_name))
+
+    return values.astype(dtype)
+
+def convert_file(file_name, output_file, conversions):
+    '''Convert the data arrays of a .vtp or .vtu file.
+
+       The file is copied to output_file if its arrays already have the target types. Returns a dict
+       of the results.
+    '''
+    result = { "file": file_name, "converted": [], "error": None }
+
+    try:
+        data_types = get_data_types(file_name)
+        convert = [ (name, type_name) for name, type_name in conversions.items()
+          if (name in data_types) and (data_types[name] != type_name) ]
+
+        if len(convert) == 0:
+            if output_file != None:
+                shutil.copyfile(file_name, output_file)
+            return result
+
+        file_base_name, file_extension = path.splitext(file_name)
         if file_extension == ".vtp":
+            reader = vtk.vtkXMLPolyDataReader()
             writer = vtk.vtkXMLPolyDataWriter()
         elif file_extension == ".vtu":
-            writer = vtk.vtkXMLUnstructuredGridWriter() 
+            reader = vtk.vtkXMLUnstructuredGridReader()
+            writer = vtk.vtkXMLUnstructuredGridWriter()
+
+        reader.SetFileName(file_name)
+        reader.Update()
+        mesh = reader.GetOutput()
+
+        # The converted NumPy arrays are kept until the mesh is written, the VTK arrays use their memory.
+        new_values = []
+
+        for name, type_name in convert:
+            for data in (mesh.GetPointData(), mesh.GetCellData()):
+                array = data.GetArray(name)
+                if array is None:
+                    continue
+                values = convert_array(array, type_name)
+                new_array = numpy_to_vtk(values, deep=False)
+                new_array.SetName(name)
+                new_values.append(values)
+                data.RemoveArray(name)
+                data.AddArray(new_array)
+                result["converted"].append((name, data_types[name], type_name))
+                break
 
-        writer.SetFileName(file_base_name + "-modified" + file_extension)
+        mesh.Modified()
+        writer.SetFileName(output_file if output_file != None else file_base_name + "-modified" + file_extension)
         writer.SetInputData(mesh)
         writer.Write()
 
+    except Exception as e:
+        result["error"] = str(e)
+
+    return result
+
+def get_mesh_files(mesh_dir, output_dir):
+    '''Get the .vtp and .vtu files of a directory and the names of the files they are written to.
+    '''
+    file_names = []
+    output_files = []
+    for dir_name, sub_dirs, files in os.walk(mesh_dir):
+        sub_dirs.sort()
+        for file_name in sorted(files):
+            if path.splitext(file_name)[1] in (".vtp", ".vtu"):
+                file_names.append(path.join(dir_name, file_name))
+                output_files.append(path.join(output_dir, path.relpath(file_names[-1], mesh_dir)))
+    return file_names, output_files
+
+def convert_files(args):
+    '''Convert a mesh file or the mesh files of a directory.
+
+       The files of a directory are converted concurrently by a pool of num_workers processes.
+       Returns the number of files that could not be converted.
+    '''
+    conversions = get_conversions(args)
+
+    if path.isdir(args.mesh):
+        mesh_dir = path.normpath(args.mesh)
+        output_dir = args.output_dir if args.output_dir != None else mesh_dir + "-modified"
+        file_names, output_files = get_mesh_files(mesh_dir, output_dir)
+        for output_file in output_files:
+            os.makedirs(path.dirname(output_file), exist_ok=True)
+        print("Number of mesh files: {0:d}".format(len(file_names)))
+        print("Output directory: " + output_dir)
+    else:
+        file_names = [args.mesh]
+        output_files = [None]
+
+    all_conversions = [conversions] * len(file_names)
+
+    if args.num_workers > 1:
+        with ProcessPoolExecutor(max_workers=args.num_workers) as executor:
+            results = list(executor.map(convert_file, file_names, output_files, all_conversions))
+    else:
+        results = list(map(convert_file, file_names, output_files, all_conversions))
+
+    num_failed = 0
+    for result in results:
+        if result["error"] != None:
+            print("{0:s}: FAILED: {1:s}".format(result["file"], result["error"]))
+            num_failed += 1
+        elif len(result["converted"]) == 0:
+            print("{0:s}: arrays already have the target types.".format(result["file"]))
+        else:
+            for name, from_type, to_type in result["converted"]:
+                print("{0:s}: {1:s} is a {2:s} array: convert to {3:s}.".format(result["file"], name, from_type, to_type))
+
+    return num_failed
+
+if __name__ == '__main__':
+    args = parse_args()
+    num_failed = convert_files(args)
+    sys.exit(1 if num_failed != 0 else 0)
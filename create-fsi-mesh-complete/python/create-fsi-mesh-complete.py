@@ -42,6 +42,9 @@ Usage:
       --solid-region-id SOLID_REGION_ID 
       --surface-mesh SURFACE_MESH 
       --volume-mesh VOLUME_MESH
+      [ --node-tolerance NODE_TOLERANCE ]
+      [ --num-threads NUM_THREADS ]
+      [ --no-graphics ]
 
   where
 
@@ -55,15 +58,35 @@ Usage:
 
       VOLUME_MESH - The volume mesh (.vtu) file.
 
+      NODE_TOLERANCE - The distance within which face and volume mesh nodes are matched (default 0.0, exact match).
+
+      NUM_THREADS - The number of threads used to extract the face meshes (default 1).
+
+      --no-graphics - Run without graphics, e.g. on a cluster node without a display. The fluid and 
+                      solid meshes are processed in parallel in separate processes.
+
 '''
 
-from collections import defaultdict 
+from collections import defaultdict, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import argparse
+import multiprocessing
 import os
+import shutil
 import sys
+import tempfile
+import time
+import numpy as np
 import vtk
+from vtk.util.numpy_support import vtk_to_numpy, numpy_to_vtk
 import xml.etree.ElementTree as et
 
+# The node matching and VTK array modules are in the node-matching directory of this repository.
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "node-matching", "python"))
+from node_matching import NodeMatcher
+from vtk_array_utils import get_cell_point_ids, create_cell_array, take_array
+
 class MeshPhysics(object):
     Fluid = "fluid"
     Solid = "solid"
@@ -107,47 +130,136 @@ class Extent(object):
         self.dy = dy
         self.dz = dz
 
+class IdMap(object):
+    '''This class is used to map IDs to their index in an array of IDs.
+
+       If an ID appears more than once then it is mapped to its last index.
+    '''
+    def __init__(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        self.order = np.argsort(ids, kind='stable')
+        self.ids = ids[self.order]
+
+    def find(self, ids):
+        '''Find the indices of IDs, raises a KeyError if an ID is not found.
+        '''
+        ids = np.asarray(ids, dtype=np.int64)
+        if ids.shape[0] == 0:
+            return np.zeros(0, dtype=np.int64)
+        pos = np.searchsorted(self.ids, ids, side='right') - 1
+        missing = (pos < 0) | (self.ids[np.maximum(pos,0)] != ids)
+        if np.any(missing):
+            raise KeyError(int(ids[np.argmax(missing)]))
+        return self.order[pos]
+
+    def __len__(self):
+        return self.ids.shape[0]
+
+class FacePartition(object):
+    '''This class is used to partition the cells of a surface mesh by face and region IDs.
+
+       The surface mesh cells are sorted by (ModelFaceID, ModelRegionID) once so that the cells of a 
+       face, or of a face within a region, are a contiguous range of the sorted cells. The polydata 
+       for a set of cells is created directly from NumPy arrays; points are numbered in the order 
+       they are first used by the cells and all point and cell data arrays are copied.
+    '''
+    def __init__(self, surface_mesh):
+        self.surface_mesh = surface_mesh
+        num_cells = surface_mesh.GetNumberOfCells()
+        cell_data = surface_mesh.GetCellData()
+        self.face_ids = vtk_to_numpy(cell_data.GetArray(VtkDataNames.ModelFaceID)).astype(np.int64)
+
+        if cell_data.GetArray(VtkDataNames.ModelRegionID) is not None:
+            self.region_ids = vtk_to_numpy(cell_data.GetArray(VtkDataNames.ModelRegionID)).astype(np.int64)
+        else:
+            self.region_ids = np.full(num_cells, -1, dtype=np.int64)
+
+        # Sort cells by face ID and then by region ID, a stable sort keeps cells in increasing order.
+        self.order = np.lexsort((self.region_ids, self.face_ids))
+        self.sorted_face_ids = self.face_ids[self.order]
+        self.sorted_region_ids = self.region_ids[self.order]
+
+        self.offsets, self.connectivity = get_cell_point_ids(surface_mesh.GetPolys())
+        self.points = vtk_to_numpy(surface_mesh.GetPoints().GetData())
+
+    def get_cells(self, face_id, region_id=None):
+        '''Get the IDs of the cells of a face, optionally only those in a region.
+        '''
+        start = np.searchsorted(self.sorted_face_ids, face_id, side='left')
+        end = np.searchsorted(self.sorted_face_ids, face_id, side='right')
+        if region_id is None:
+            return np.sort(self.order[start:end])
+        region_ids = self.sorted_region_ids[start:end]
+        region_start = start + np.searchsorted(region_ids, region_id, side='left')
+        region_end = start + np.searchsorted(region_ids, region_id, side='right')
+        return self.order[region_start:region_end]
+
+    def extract(self, cell_ids):
+        '''Create polydata from a set of surface mesh cells.
+        '''
+        polydata = vtk.vtkPolyData()
+        if cell_ids.shape[0] == 0:
+            return polydata
+
+        ## Get the points used by the cells in the order they are first used.
+        offsets = self.offsets
+        sizes = offsets[cell_ids+1] - offsets[cell_ids]
+        new_offsets = np.zeros(cell_ids.shape[0]+1, dtype=np.int64)
+        new_offsets[1:] = np.cumsum(sizes)
+        starts = np.repeat(offsets[cell_ids] - new_offsets[:-1], sizes)
+        conn = self.connectivity[starts + np.arange(new_offsets[-1])]
+
+        unique_ids, first = np.unique(conn, return_index=True)
+        point_ids = unique_ids[np.argsort(first, kind='stable')]
+        point_map = np.empty(self.points.shape[0], dtype=np.int64)
+        point_map[point_ids] = np.arange(point_ids.shape[0])
+
+        points = vtk.vtkPoints()
+        points.SetData(take_array(self.surface_mesh.GetPoints().GetData(), point_ids))
+        polydata.SetPoints(points)
+        polydata.SetPolys(create_cell_array(new_offsets, point_map[conn], id_type=False))
+
+        for data, new_data, ids in [(self.surface_mesh.GetPointData(), polydata.GetPointData(), point_ids), 
+                                    (self.surface_mesh.GetCellData(), polydata.GetCellData(), cell_ids)]:
+            for i in range(data.GetNumberOfArrays()):
+                array = data.GetArray(i)
+                if array is not None:
+                    new_data.AddArray(take_array(array, ids))
+
+        return polydata
+
 class BcFace(object):
     '''This class stores BC face data for a mesh. 
     '''
-    def __init__(self, face_name, face_id, face_type, mesh=None): 
+    def __init__(self, face_name, face_id, face_type, mesh=None, tolerance=0.0): 
         self.name = face_name
         self.id = face_id
         self.type = face_type
         self.mesh = None 
         self.num_points = None 
-        self.nodal_coords = None
         self.extent = None
+        self.point_index = None
 
         if mesh != None:
-            self.set_mesh(mesh) 
+            self.set_mesh(mesh, tolerance) 
 
-    def set_mesh(self, mesh): 
+    def set_mesh(self, mesh, tolerance=0.0): 
         '''Set mesh data.
         '''
         self.mesh = mesh
+        self.num_points = self.mesh.GetNumberOfPoints()
+        points = get_points(self.mesh)
+        self.extent = get_extent(points)
 
-        node_ids = self.mesh.GetPointData().GetArray(VtkDataNames.GlobalNodeID)
-        num_points = self.mesh.GetNumberOfPoints()
-        self.num_points = num_points 
-        points = self.mesh.GetPoints()
-
-        # Create node ID to node coord map.
-        nodal_coords, extent = create_node_coord_map(num_points, node_ids, points)
-        self.nodal_coords = nodal_coords
-        self.extent = extent
-
-        # Create a map hashing node coords to IDs..
-        #
-        point_hash = create_node_coord_hash(nodal_coords, extent)
-        self.point_hash = point_hash
+        # Create an index to find nodes by coordinates.
+        self.point_index = NodeMatcher(points, tolerance)
 
 class Mesh(object):
     '''This class stores volume and surface (facee) mesh data for a given region ID. 
 
        The mesh is assumed to be a subset of 'sv_volume_mesh' determined by its region ID.
     '''
-    def __init__(self, sv_volume_mesh, region_id, physics):
+    def __init__(self, sv_volume_mesh, region_id, physics, tolerance=0.0):
         self.file_name = None 
         self.volume_mesh = None 
         self.sv_volume_mesh = sv_volume_mesh 
@@ -159,48 +271,34 @@ class Mesh(object):
         self.num_points = None
         self.node_ids = None
         self.extent = None 
-        self.point_hash = None 
-        self.nodal_coords = None 
+        self.tolerance = tolerance
+        self.point_index = None 
         self.elem_map = None 
 
         # Extract the volume mesh for the given region ID.
         self.volume_mesh = get_region_mesh(sv_volume_mesh.mesh, region_id)
 
-        # Create a nodal coordinate map and coordinate hash table.
+        # Create a coordinate index and renumber node and element IDs.
         self.set_node_coords()
 
     def set_node_coords(self):
-        '''Create a nodal coordinate map and coordinate hash table.
+        '''Create a coordinate index and renumber node and element IDs.
         '''
         print("\n========== Mesh.set_node_coords: {0:s} ==========".format(self.physics))
         print("[Mesh.set_node_coords] Region ID: {0:d}".format(self.region_id))
         self.node_ids = self.volume_mesh.GetPointData().GetArray(VtkDataNames.GlobalNodeID)
         self.num_points = self.volume_mesh.GetNumberOfPoints()
         self.points = self.volume_mesh.GetPoints()
+        points = get_points(self.volume_mesh)
+        self.extent = get_extent(points)
 
-        # Create nodal IDs to coordinates map.
-        #
-        print("[Mesh.set_node_coords] Create nodal IDs to coordinates map ...")
-        nodal_coords, extent = create_node_coord_map(self.num_points, self.node_ids, self.points)
-        self.nodal_coords = nodal_coords
-        self.extent = extent 
-        '''
-        print("[Mesh.set_node_coords] Number of nodes: {0:d}".format(len(nodal_coords)))
-        for nid, point in nodal_coords.items():
-          print("[Mesh.set_node_coords] {0:d}] {1:s}".format(nid, str(point)))
-        '''
-
-        # Create nodal coordinates hash table.
-        point_hash = create_node_coord_hash(nodal_coords, extent)
-        self.point_hash = point_hash
+        # Create an index to find nodes by coordinates.
+        print("[Mesh.set_node_coords] Create nodal coordinates index ...")
+        self.point_index = NodeMatcher(points, self.tolerance)
 
         # Create map from element ID to index into GlobalElementID array. 
-        num_cells = self.volume_mesh.GetNumberOfCells()
         elem_ids = self.volume_mesh.GetCellData().GetArray(VtkDataNames.GlobalElementID)
-        self.elem_map = {}
-        for i in range(num_cells):
-            elem_id = elem_ids.GetValue(i)
-            self.elem_map[elem_id] = i
+        self.elem_map = IdMap(vtk_to_numpy(elem_ids))
 
         # Reset mesh node IDs.
         #
@@ -208,14 +306,7 @@ class Mesh(object):
         #
         print("[Mesh.set_node_coords] Reset mesh node IDs ...")
         print("[Mesh.set_node_coords] num_points: {0:d}] ".format(self.num_points))
-        node_ids_data = vtk.vtkIntArray()
-        node_ids_data.SetNumberOfValues(self.num_points)
-        node_ids_data.SetName(VtkDataNames.GlobalNodeID)
-        n = 0
-        for nid, point in self.nodal_coords.items():
-            #print("[Mesh.set_node_coords] n: {0:d} nid: {1:d}]".format(n, nid))
-            node_ids_data.SetValue(n, n+1)
-            n += 1
+        node_ids_data = create_id_array(VtkDataNames.GlobalNodeID, np.arange(1, self.num_points+1))
         self.volume_mesh.GetPointData().RemoveArray(VtkDataNames.GlobalNodeID)
         self.volume_mesh.GetPointData().AddArray(node_ids_data)
 
@@ -224,37 +315,30 @@ class Mesh(object):
         # GlobalElementID are not used in svFSI.
         #
         num_cells = self.volume_mesh.GetNumberOfCells()
-        elemn_ids_data = vtk.vtkIntArray()
-        elemn_ids_data.SetNumberOfValues(num_cells)
-        elemn_ids_data.SetName(VtkDataNames.GlobalElementID)
-        for i in range(num_cells):
-            #print("[Mesh.set_node_coords] self.nodal_coords[{0:d}]: {1:s}".format(nid, str(point)))
-            elemn_ids_data.SetValue(i, i+1)
+        elemn_ids_data = create_id_array(VtkDataNames.GlobalElementID, np.arange(1, num_cells+1))
         self.volume_mesh.GetCellData().RemoveArray(VtkDataNames.GlobalElementID)
         self.volume_mesh.GetCellData().AddArray(elemn_ids_data)
 
-    def extract_faces(self, bc_faces):
+    def extract_faces(self, bc_faces, partition, num_threads=1):
         '''Extract face surface geometry for this object's region ID.
+
+           The face cells for the region are sliced from the surface mesh partition, 
+           using a pool of threads if num_threads > 1.
         '''
         print("\n========== Mesh.extract_faces {0:s} ==========".format(self.physics))
         print("[Mesh.extract_faces] Region ID: {0:d}".format(self.region_id))
         self.bc_faces = defaultdict(list)
 
-        for face_id, bc_face in bc_faces.items():
+        def extract_face(face_id):
+            return partition.extract(partition.get_cells(face_id, self.region_id))
+
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            surfaces = list(executor.map(extract_face, bc_faces.keys()))
+
+        for (face_id, bc_face), surface in zip(bc_faces.items(), surfaces):
             face_type = bc_face.type
             face_name = bc_face.name
-            mesh = bc_face.mesh 
             print("[Mesh.extract_faces] ----- Face ID {0:s} {1:d}: {2:s} -----".format(face_name, face_id, face_type))
-            threshold = vtk.vtkThreshold()
-            threshold.SetInputData(mesh)
-            threshold.SetInputArrayToProcess(0,0,0,1,VtkDataNames.ModelRegionID)
-            threshold.ThresholdBetween(self.region_id,self.region_id)
-            threshold.Update();
-
-            surfacer = vtk.vtkDataSetSurfaceFilter()
-            surfacer.SetInputData(threshold.GetOutput())
-            surfacer.Update()
-            surface = surfacer.GetOutput()
             print("[Mesh.extract_faces] Surface number of points: %d" % surface.GetNumberOfPoints())
             print("[Mesh.extract_faces] Surface number of cells: %d" % surface.GetNumberOfCells())
 
@@ -266,35 +350,18 @@ class Mesh(object):
             # Create a new GlobalNodeID data for the face that matches
             # the volume mesh node IDs.
             #
-            node_ids = surface.GetPointData().GetArray(VtkDataNames.GlobalNodeID)
-            num_points = surface.GetNumberOfPoints()
-            points = surface.GetPoints()
-
-            node_ids_data = vtk.vtkIntArray()
-            node_ids_data.SetNumberOfValues(num_points)
-            node_ids_data.SetName(VtkDataNames.GlobalNodeID)
-            pt = 3*[0.0]
-
             print("[Mesh.extract_faces] Nodes and coordinates ...")
-            for i in range(num_points):
-                points.GetPoint(i, pt)
-                nid, index = find_node_id(self.point_hash, self.num_points, self.extent, pt)
-                node_ids_data.SetValue(i, index+1)
+            index = self.point_index.find(get_points(surface))
+            node_ids_data = create_id_array(VtkDataNames.GlobalNodeID, index+1)
             surface.GetPointData().RemoveArray(VtkDataNames.GlobalNodeID)
             surface.GetPointData().AddArray(node_ids_data)
 
             # Create a new GlobalElementID data array for the face that matches
             # the volume mesh element IDs. 
             #
-            num_cells = surface.GetNumberOfCells()
-            elemn_ids_data = vtk.vtkIntArray()
-            elemn_ids_data.SetNumberOfValues(num_cells)
-            elemn_ids_data.SetName(VtkDataNames.GlobalElementID)
             elem_ids = surface.GetCellData().GetArray(VtkDataNames.GlobalElementID)
-            for i in range(num_cells):
-                elem_id = elem_ids.GetValue(i)
-                vol_elem_id = self.elem_map[elem_id]
-                elemn_ids_data.SetValue(i, vol_elem_id+1)
+            vol_elem_ids = self.elem_map.find(vtk_to_numpy(elem_ids))
+            elemn_ids_data = create_id_array(VtkDataNames.GlobalElementID, vol_elem_ids+1)
             surface.GetCellData().RemoveArray(VtkDataNames.GlobalElementID)
             surface.GetCellData().AddArray(elemn_ids_data)
 
@@ -329,9 +396,9 @@ class Mesh(object):
                     wall_num += 1
                     wall_face_name = face_name 
                     #wall_face_name = face_name + "_" + str(wall_num)
-                    self.bc_faces[face_id].append( BcFace(wall_face_name, face_id, face_type, component) )
+                    self.bc_faces[face_id].append( BcFace(wall_face_name, face_id, face_type, component, self.tolerance) )
             else:
-                self.bc_faces[face_id].append( BcFace(face_name, face_id, face_type, surface) )
+                self.bc_faces[face_id].append( BcFace(face_name, face_id, face_type, surface, self.tolerance) )
         #_for fid, face in surface_faces.items()
 
     def get_wall_faces(self):
@@ -351,12 +418,9 @@ class Mesh(object):
         '''Check is a face is an inner solid wall faces.
         '''
         for wall_face in fluid_wall_faces:
-            for nid, point in wall_face.nodal_coords.items():
-                node_id, index = find_node_id(bc_face.point_hash, bc_face.num_points, bc_face.extent, point)
-                if node_id != -1:
-                    #print("[is_inner_solid_face] ")
-                    #print("[is_inner_solid_face] Found: node_id: {0:d},  point: {1:s}".format(node_id, str(point)))
-                    return True
+            index = bc_face.point_index.find(wall_face.point_index.points)
+            if np.any(index != -1):
+                return True
         return False
 
     def write_faces(self, fluid_wall_faces=[]):
@@ -393,7 +457,7 @@ class Mesh(object):
 class VolumeMesh(object):
     '''This class stores data for the complete volume mesh.
     '''
-    def __init__(self, file_name):
+    def __init__(self, file_name, tolerance=0.0):
         self.mesh = self.read_mesh(file_name)
 
         geom_filter = vtk.vtkGeometryFilter()
@@ -409,43 +473,18 @@ class VolumeMesh(object):
         self.node_ids = node_ids 
         print("[VolumeMesh] num_points: {0:d}".format(num_points))
 
-        # Create nodal IDs to coordinates map.
-        #
-        nodal_coords, extent  = create_node_coord_map(num_points, node_ids, points)
-        self.nodal_coords = nodal_coords
-        self.extent = extent
-
-        # Create nodal coordinates hash table.
-        point_hash = create_node_coord_hash(nodal_coords, extent) 
-        self.point_hash = point_hash
+        # Create an index to find nodes by coordinates.
+        mesh_points = get_points(self.mesh)
+        self.extent = get_extent(mesh_points)
+        self.point_index = NodeMatcher(mesh_points, tolerance)
 
     def get_node_id(self, point):
-        node_id = -1
-        num_points = self.mesh.GetNumberOfPoints()
-        x = point[0]
-        y = point[1]
-        z = point[2]
-        xs = (x - self.extent.min_x) / self.extent.dx
-        ys = (y - self.extent.min_y) / self.extent.dy
-        zs = (z - self.extent.min_z) / self.extent.dz
-        ih = xs * num_points
-        jh = ys * num_points
-        kh = zs * num_points
-        index = int(ih + jh + kh)
-
-        pts = self.point_hash[index]
-        found_pt = False
-        for hpt in pts:
-            dx = hpt[0] - x
-            dy = hpt[1] - y
-            dz = hpt[2] - z
-            d = dx*dx + dy*dy + dz*dz
-            if d == 0.0:
-                node_id = hpt[3]
-                break
-        #_for hpt in pts
-
-        return node_id
+        '''Get the ID of the node at the given point, -1 if there is no node there.
+        '''
+        index = self.point_index.find(point)[0]
+        if index == -1:
+            return -1
+        return self.node_ids.GetValue(int(index))
 
     def read_mesh(self, file_name):
         print("[Volume.read_mesh] file_name: " + file_name)
@@ -455,6 +494,172 @@ class VolumeMesh(object):
         reader.Update()
         return reader.GetOutput()
 
+class Phases(object):
+    '''This class defines the names of the phases timed for each region.
+    '''
+    CreateMesh = "create region mesh"
+    ExtractFaces = "extract faces"
+    SendWalls = "send fluid wall faces"
+    WaitWalls = "wait for fluid wall faces"
+    WriteFaces = "write faces"
+    WriteVolume = "write volume"
+    Region = [CreateMesh, ExtractFaces, SendWalls, WaitWalls, WriteFaces, WriteVolume]
+
+class PhaseTimer(object):
+    '''This class records the wall time of the phases of mesh-complete generation.
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.times = OrderedDict()
+
+    @contextmanager
+    def phase(self, name):
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.times[name] = self.times.get(name, 0.0) + time.time() - start_time
+
+    def save(self, file_name):
+        '''Save the region phase times to a memory-mapped array.
+        '''
+        times = np.load(file_name, mmap_mode="r+")
+        for i, name in enumerate(Phases.Region):
+            if name in self.times:
+                times[i] = self.times[name]
+        times.flush()
+
+    def load(self, file_name):
+        '''Load the region phase times from a memory-mapped array.
+        '''
+        times = np.load(file_name, mmap_mode="r")
+        for name, phase_time in zip(Phases.Region, times):
+            if not np.isnan(phase_time):
+                self.times[name] = float(phase_time)
+
+    def print_times(self):
+        print("[PhaseTimer] ----- {0:s} -----".format(self.name))
+        for name, phase_time in self.times.items():
+            print("[PhaseTimer] {0:28s} {1:10.3f} s".format(name, phase_time))
+
+class WallPointsChannel(object):
+    '''This class is used to pass fluid wall face points to the solid process.
+
+       The solid needs the fluid wall faces to identify its inner wall faces. The fluid process
+       writes the points of its wall faces to memory-mapped arrays in 'directory' and then sets
+       the 'ready' event; the solid process waits on the event and maps the arrays.
+    '''
+    def __init__(self, directory, context):
+        self.points_file = os.path.join(directory, "fluid-wall-points.npy")
+        self.offsets_file = os.path.join(directory, "fluid-wall-offsets.npy")
+        self.ready = context.Event()
+
+    def put(self, wall_faces):
+        '''Write the points of the fluid wall faces.
+        '''
+        num_points = [face.point_index.num_points for face in wall_faces]
+        offsets = np.lib.format.open_memmap(self.offsets_file, mode="w+", dtype=np.int64, shape=(len(wall_faces)+1,))
+        offsets[0] = 0
+        offsets[1:] = np.cumsum(num_points)
+        points = np.lib.format.open_memmap(self.points_file, mode="w+", dtype=np.float64, shape=(int(offsets[-1]),3))
+        for i, face in enumerate(wall_faces):
+            points[offsets[i]:offsets[i+1]] = face.point_index.points
+        offsets.flush()
+        points.flush()
+        self.ready.set()
+
+    def get(self, tolerance=0.0):
+        '''Wait for the fluid wall face points and return them as BcFace objects.
+        '''
+        self.ready.wait()
+        offsets = np.load(self.offsets_file, mmap_mode="r")
+        points = np.load(self.points_file, mmap_mode="r")
+        wall_faces = []
+        for i in range(offsets.shape[0]-1):
+            wall_face = BcFace("fluid-wall-" + str(i), i, FaceTypes.Wall)
+            wall_face.point_index = NodeMatcher(points[offsets[i]:offsets[i+1]], tolerance)
+            wall_faces.append(wall_face)
+        return wall_faces
+
+def process_region(volume_mesh, bc_faces, partition, region_id, physics, args, timings_file, channel):
+    '''Create the mesh and write the files for a region in a separate process.
+
+       The fluid wall face points are passed to the solid process using 'channel' and
+       the phase times are passed back in the memory-mapped array 'timings_file'.
+    '''
+    timer = PhaseTimer(physics)
+
+    with timer.phase(Phases.CreateMesh):
+        mesh = Mesh(volume_mesh, region_id, physics, args.node_tolerance)
+
+    with timer.phase(Phases.ExtractFaces):
+        mesh.extract_faces(bc_faces, partition, args.num_threads)
+
+    if physics == MeshPhysics.Fluid:
+        with timer.phase(Phases.SendWalls):
+            channel.put(mesh.get_wall_faces())
+        fluid_walls = []
+    else:
+        with timer.phase(Phases.WaitWalls):
+            fluid_walls = channel.get(args.node_tolerance)
+
+    with timer.phase(Phases.WriteFaces):
+        mesh.write_faces(fluid_walls)
+
+    with timer.phase(Phases.WriteVolume):
+        mesh.write_volume()
+
+    timer.save(timings_file)
+
+def process_regions_parallel(volume_mesh, bc_faces, partition, args):
+    '''Process the fluid and solid regions concurrently in separate processes.
+
+       The processes are forked so they share the meshes read by this process.
+    '''
+    print("\n========== process_regions_parallel ==========")
+    context = multiprocessing.get_context("fork")
+    work_dir = tempfile.mkdtemp(prefix="fsi-mesh-complete-")
+    timers = []
+
+    try:
+        channel = WallPointsChannel(work_dir, context)
+        processes = []
+        regions = [ (args.fluid_region_id, MeshPhysics.Fluid), (args.solid_region_id, MeshPhysics.Solid) ]
+
+        for region_id, physics in regions:
+            timings_file = os.path.join(work_dir, physics + "-timings.npy")
+            timings = np.lib.format.open_memmap(timings_file, mode="w+", dtype=np.float64, shape=(len(Phases.Region),))
+            timings[:] = np.nan
+            timings.flush()
+            del timings
+
+            # Flush output so it is not duplicated in the forked process.
+            sys.stdout.flush()
+            process = context.Process(target=process_region, name=physics,
+              args=(volume_mesh, bc_faces, partition, region_id, physics, args, timings_file, channel))
+            process.start()
+            processes.append((process, timings_file))
+
+        fluid_process = processes[0][0]
+        fluid_process.join()
+
+        # Don't leave the solid waiting for the fluid wall faces.
+        if fluid_process.exitcode != 0:
+            processes[1][0].terminate()
+
+        for process, timings_file in processes:
+            process.join()
+            if process.exitcode != 0:
+                raise Exception("Processing the " + process.name + " mesh failed with exit code " + str(process.exitcode) + ".")
+            timer = PhaseTimer(process.name)
+            timer.load(timings_file)
+            timers.append(timer)
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return timers
+
 class Args(object):
     '''This class defines the command line arguments to the script.
     '''
@@ -467,6 +672,9 @@ class Args(object):
     SURFACE_MESH = "surface_mesh"
     VOLUME_MESH = "volume_mesh"
     WALL_FACES = "wall_faces"
+    NODE_TOLERANCE = "node_tolerance"
+    NUM_THREADS = "num_threads"
+    NO_GRAPHICS = "no_graphics"
 
 def cmd(name):
     '''Create an argparse command argument.
@@ -483,17 +691,33 @@ def parse_args():
     parser.add_argument(cmd(Args.SOLID_REGION_ID), help="The solid region ID.", type=int, required=True)
     parser.add_argument(cmd(Args.SURFACE_MESH),    help="The surface mesh (.vtp) file.", required=True)
     parser.add_argument(cmd(Args.VOLUME_MESH),     help="The volume mesh (.vtu) file.", required=True)
+    parser.add_argument(cmd(Args.NODE_TOLERANCE),  help="The distance within which face and volume mesh nodes are matched.", 
+      type=float, default=0.0)
+    parser.add_argument(cmd(Args.NUM_THREADS),     help="The number of threads used to extract faces.", type=int, default=1)
+    parser.add_argument(cmd(Args.NO_GRAPHICS),     help="Don't create graphics, process the fluid and solid meshes in parallel.", 
+      action="store_true", default=False)
 
     return parser.parse_args(), parser.print_help
 
+def get_points(mesh):
+    '''Get the points of a mesh as a NumPy array.
+    '''
+    if mesh.GetNumberOfPoints() == 0:
+        return np.zeros((0,3))
+    return vtk_to_numpy(mesh.GetPoints().GetData())
+
 def get_node_ids(polydata):
-        node_ids = polydata.GetPointData().GetArray(VtkDataNames.GlobalNodeID)
-        num_points = polydata.GetNumberOfPoints()
-        id_set = set()
-        for i in range(num_points):
-            nid = node_ids.GetValue(i)
-            id_set.add(nid)
-        return id_set
+    '''Get the set of node IDs of a mesh.
+    '''
+    node_ids = polydata.GetPointData().GetArray(VtkDataNames.GlobalNodeID)
+    return set(np.unique(vtk_to_numpy(node_ids)).tolist())
+
+def create_id_array(name, ids):
+    '''Create a vtkIntArray of IDs from a NumPy array.
+    '''
+    id_array = numpy_to_vtk(np.asarray(ids, dtype=np.int32), deep=True, array_type=vtk.VTK_INT)
+    id_array.SetName(name)
+    return id_array
 
 def add_geom(geom, renderer):
     mapper = vtk.vtkPolyDataMapper()
@@ -514,39 +738,37 @@ def add_sphere(center, renderer):
     poly_data = sphere.GetOutput()
     return add_geom(poly_data, renderer)
 
-def get_surface_faces(surface_mesh, bc_faces):
+def get_surface_faces(surface_mesh, bc_faces, tolerance=0.0, num_threads=1):
     '''Get the faces from the surface mesh.
  
-       The faces are vtkPolyData objects with cell data arrays.
+       The faces are vtkPolyData objects with cell data arrays. The surface mesh cells
+       are partitioned by face and region IDs in a single pass and the partition is 
+       returned to extract the faces for each region.
     '''
     print("\n========== get_surface_faces ==========")
-    face_ids = surface_mesh.GetCellData().GetArray(VtkDataNames.ModelFaceID)
-    face_ids_range = 2*[0]
-    face_ids.GetRange(face_ids_range, 0)
-    min_id = int(face_ids_range[0])
-    max_id = int(face_ids_range[1])
+    partition = FacePartition(surface_mesh)
+    min_id = int(partition.sorted_face_ids[0])
+    max_id = int(partition.sorted_face_ids[-1])
     print("[get_surface_faces] Face IDs range: {0:d} {1:d}".format(min_id, max_id))
 
     ## Extract face geometry.
     #
-    for i in range(min_id, max_id+1):
-        if i not in bc_faces:
-            continue
+    face_ids = [i for i in range(min_id, max_id+1) if i in bc_faces]
+
+    def set_face_mesh(face_id):
+        bc_faces[face_id].set_mesh( partition.extract(partition.get_cells(face_id)), tolerance )
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        list(executor.map(set_face_mesh, face_ids))
+
+    for i in face_ids:
         print("[get_surface_faces] ----- Face ID {0:d} ----".format(i))
         print("[get_surface_faces] Face name: {0:s} ".format(bc_faces[i].name))
-        threshold = vtk.vtkThreshold()
-        threshold.SetInputData(surface_mesh)
-        threshold.SetInputArrayToProcess(0,0,0,1,VtkDataNames.ModelFaceID)
-        threshold.ThresholdBetween(i,i)
-        threshold.Update();
-
-        surfacer = vtk.vtkDataSetSurfaceFilter()
-        surfacer.SetInputData(threshold.GetOutput())
-        surfacer.Update()
-        bc_faces[i].set_mesh( surfacer.GetOutput() )
         print("[get_surface_faces] Face number of points: %d" % bc_faces[i].mesh.GetNumberOfPoints())
         print("[get_surface_faces] Face number of cells: %d" % bc_faces[i].mesh.GetNumberOfCells())
-    #_for i in range(min_id, max_id+1)
+    #_for i in face_ids
+
+    return partition
 
 def add_mesh_geom(mesh, renderer, color=[1,1,1]):
     '''Add mesh to renderer.
@@ -629,115 +851,14 @@ def read_mdl_file(file_name):
 
     return bc_faces 
 
-def create_node_coord_map(num_points, node_ids, points):
-    '''Create nodal IDs to coordinates map.
-    '''
-    max_x = -1e9
-    max_y = -1e9
-    max_z = -1e9
-    min_x = 1e9
-    min_y = 1e9
-    min_z = 1e9
-    pt = 3*[0.0]
-    nodal_coords = {}
-
-    #nid = 1
-    for i in range(num_points):
-        nid = node_ids.GetValue(i)
-        points.GetPoint(i, pt)
-        x = pt[0]
-        y = pt[1]
-        z = pt[2]
-        nodal_coords[nid] = [x, y, z, i]
-
-        if x < min_x:
-          min_x = x
-        elif x > max_x:
-          max_x = x
-
-        if y < min_y:
-          min_y = y
-        elif y > max_y:
-          max_y = y
-
-        if z < min_z:
-          min_z = z
-        elif z > max_z:
-          max_z = z
-
-        #nid += 1
-
-    return nodal_coords, Extent(max_x, min_x, max_y, min_y, max_z, min_z)
-
-def create_node_coord_hash(nodal_coords, extent):
-    ''' Create nodal coordinates hash table.
-    '''
-    point_hash = defaultdict(list)
-    num_points = len(nodal_coords)
-    #print("[create_node_coord_hash] num_points: {0:d}".format(num_points)
-
-    n = 0
-    for nid, point in nodal_coords.items():
-        x = point[0]
-        y = point[1]
-        z = point[2]
-
-        xs = (x - extent.min_x) / extent.dx
-        ys = (y - extent.min_y) / extent.dy
-        zs = (z - extent.min_z) / extent.dz
-        ih = xs * num_points
-        jh = ys * num_points
-        kh = zs * num_points
-        index = int(ih + jh + kh) 
-        pts = point_hash[index]
-
-        if len(pts) == 0:
-            point_hash[index].append([x, y, z, nid, n])
-        else:
-            found_pt = False
-            for hpt in pts:
-                ddx = hpt[0] - x
-                ddy = hpt[1] - y 
-                ddz = hpt[2] - z
-                d = ddx*ddx + ddy*ddy + ddz*ddz
-                if d == 0.0:
-                    found_pt = True
-                    break
-            if not found_pt:
-                point_hash[index].append([x, y, z, nid, n])
-        n += 1
-
-    return point_hash
-
-def find_node_id(point_hash, num_points, extent, point):
-    '''Find the given point in a hash table.
+def get_extent(points):
+    '''Get the coordinate extent of an array of points.
     '''
-    node_id = -1
-    index = -1
-    x = point[0]
-    y = point[1]
-    z = point[2]
-    xs = (x - extent.min_x) / extent.dx
-    ys = (y - extent.min_y) / extent.dy
-    zs = (z - extent.min_z) / extent.dz
-    ih = xs * num_points
-    jh = ys * num_points
-    kh = zs * num_points
-    index = int(ih + jh + kh)
-
-    pts = point_hash[index]
-    found_pt = False
-    for hpt in pts:
-      dx = hpt[0] - x
-      dy = hpt[1] - y
-      dz = hpt[2] - z
-      d = dx*dx + dy*dy + dz*dz
-      if d == 0.0:
-          node_id = hpt[3]
-          index = hpt[4]
-          break
-
-    return node_id, index
+    if points.shape[0] == 0:
+        return Extent(0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+    max_pt = points.max(axis=0)
+    min_pt = points.min(axis=0)
+    return Extent(max_pt[0], min_pt[0], max_pt[1], min_pt[1], max_pt[2], min_pt[2])
 
 def write_volume_mesh(file_base_name, mesh): 
     file_name = file_base_name + "-mesh.vtu"
@@ -758,45 +879,78 @@ def write_surface_mesh(file_base_name, name, mesh):
 if __name__ == '__main__':
 
     args, print_help = parse_args()
+    timer = PhaseTimer("main")
+
+    # Processes are forked to share the meshes, fall back to serial processing without fork.
+    parallel = args.no_graphics and ("fork" in multiprocessing.get_all_start_methods())
 
     ## Create renderer and graphics window.
-    renderer = vtk.vtkRenderer()
-    renderer_win = vtk.vtkRenderWindow()
-    renderer_win.AddRenderer(renderer)
-    renderer.SetBackground(0.6, 0.6, 0.6)
-    renderer_win.SetSize(800, 800)
+    if not args.no_graphics:
+        renderer = vtk.vtkRenderer()
+        renderer_win = vtk.vtkRenderWindow()
+        renderer_win.AddRenderer(renderer)
+        renderer.SetBackground(0.6, 0.6, 0.6)
+        renderer_win.SetSize(800, 800)
 
     ## Read SV modeling .mdl file.
-    file_name = args.mdl_file
-    bc_faces = read_mdl_file(file_name)
+    with timer.phase("read mdl file"):
+        file_name = args.mdl_file
+        bc_faces = read_mdl_file(file_name)
   
     ## Read SV volume mesh.
-    file_name = args.volume_mesh
-    volume_mesh = VolumeMesh(file_name)
+    with timer.phase("read volume mesh"):
+        file_name = args.volume_mesh
+        volume_mesh = VolumeMesh(file_name, args.node_tolerance)
 
     ## Read SV surface mesh.
-    file_name = args.surface_mesh
-    file_base_name, ext = os.path.splitext(file_name)
-    reader = vtk.vtkXMLPolyDataReader()
-    reader.SetFileName(file_name)
-    reader.Update()
-    surface_mesh = reader.GetOutput()
+    with timer.phase("read surface mesh"):
+        file_name = args.surface_mesh
+        file_base_name, ext = os.path.splitext(file_name)
+        reader = vtk.vtkXMLPolyDataReader()
+        reader.SetFileName(file_name)
+        reader.Update()
+        surface_mesh = reader.GetOutput()
 
     ## Get the surface mesh faces and inlet, outlet and wall face IDs.
-    get_surface_faces(surface_mesh, bc_faces)
-
-    ## Get the fluid mesh.
-    fluid = Mesh(volume_mesh, args.fluid_region_id, MeshPhysics.Fluid)
-    fluid.extract_faces(bc_faces)
-    fluid.write_faces()
-    fluid.write_volume()
-    fluid_walls = fluid.get_wall_faces()
-
-    ## Get the solid mesh.
-    solid = Mesh(volume_mesh, args.solid_region_id, MeshPhysics.Solid)
-    solid.extract_faces(bc_faces)
-    solid.write_faces(fluid_walls)
-    solid.write_volume()
+    with timer.phase("get surface faces"):
+        partition = get_surface_faces(surface_mesh, bc_faces, args.node_tolerance, args.num_threads)
+
+    if parallel:
+        with timer.phase("process regions"):
+            region_timers = process_regions_parallel(volume_mesh, bc_faces, partition, args)
+
+    else:
+        region_timers = [ PhaseTimer(MeshPhysics.Fluid), PhaseTimer(MeshPhysics.Solid) ]
+        fluid_timer, solid_timer = region_timers
+
+        ## Get the fluid mesh.
+        with fluid_timer.phase(Phases.CreateMesh):
+            fluid = Mesh(volume_mesh, args.fluid_region_id, MeshPhysics.Fluid, args.node_tolerance)
+        with fluid_timer.phase(Phases.ExtractFaces):
+            fluid.extract_faces(bc_faces, partition, args.num_threads)
+        with fluid_timer.phase(Phases.WriteFaces):
+            fluid.write_faces()
+        with fluid_timer.phase(Phases.WriteVolume):
+            fluid.write_volume()
+        fluid_walls = fluid.get_wall_faces()
+
+        ## Get the solid mesh.
+        with solid_timer.phase(Phases.CreateMesh):
+            solid = Mesh(volume_mesh, args.solid_region_id, MeshPhysics.Solid, args.node_tolerance)
+        with solid_timer.phase(Phases.ExtractFaces):
+            solid.extract_faces(bc_faces, partition, args.num_threads)
+        with solid_timer.phase(Phases.WriteFaces):
+            solid.write_faces(fluid_walls)
+        with solid_timer.phase(Phases.WriteVolume):
+            solid.write_volume()
+
+    ## Print phase timings.
+    print("\n========== Timings ==========")
+    for phase_timer in [timer] + region_timers:
+        phase_timer.print_times()
+
+    if args.no_graphics:
+        sys.exit(0)
 
     ## Check node ids.
     # volume_mesh.check_points("fluid", fluid.num_points, fluid.points, fluid.node_ids, renderer)
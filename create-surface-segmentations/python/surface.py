@@ -8,8 +8,10 @@ from math import acos
 from math import pi
 from math import degrees
 from os import path
+import numpy as np
 import sv
 import vtk
+from surface_slicer import SurfaceSlicer
 
 class Surface(object):
     '''The surface class is used to store surface data.
@@ -113,18 +115,40 @@ class Surface(object):
            Centerline normals are averaged over the sampling distance to give
            provide a better representation of the slice orientation wrt to
            the surface.
+
+           The surface is cut using a SurfaceSlicer, only the surface triangles
+           near a centerline point are cut.
         '''
         print("[surface] ========== extract_slices ==========")
         print(f"[surface] Sample distance: {self.sample_distance}")
         print(f"[surface] Average normals: {self.average_normals}")
 
-        # Turn off INFO messages from vtk.vtkCutter.
-        vtk.vtkLogger.SetStderrVerbosity(vtk.vtkLogger.VERBOSITY_OFF)
+        plane_ids, plane_points, plane_normals = self.get_slice_planes()
+        print(f"[surface] Number of slices: {len(plane_ids)}")
+
+        slicer = SurfaceSlicer(self.geometry, self.centerlines)
+        self.slices = []
+
+        for plane_id, plane_pt, plane_normal in zip(plane_ids, plane_points, plane_normals):
+            self.show_plane(plane_pt, plane_normal, color=[1,0,0])
+            slice = slicer.extract_slice(plane_id, plane_pt, plane_normal)
+            if slice.points is None:
+                print(f"[surface] Centerline point {plane_id}: the slice plane does not cut the surface.")
+                continue
+            if not slice.closed:
+                print(f"[surface] Centerline point {plane_id}: the slice contour is not closed.")
+            if self.renderer:
+                self.graphics.add_geometry(self.renderer, slice.geometry, [1,0,0], line_width=3)
+            self.slices.append(slice)
+
+        self.write_slices()
 
+    def get_slice_planes(self):
+        '''Get the centerline point IDs, points and normals of the slice planes.
+        '''
         points = self.centerlines.GetPoints()
         num_points = self.centerlines.GetNumberOfPoints()
         normal_data = self.centerlines.GetPointData().GetArray("CenterlineSectionNormal")
-        max_radius_data = self.centerlines.GetPointData().GetArray('MaximumInscribedSphereRadius')
         print(f"[surface] Number of centerline points: {num_points}")
 
         start_id = 1
@@ -136,6 +160,9 @@ class Surface(object):
         plane_pt = 3*[0.0]
         last_plane_pt = 3*[0.0]
         avg_normal = 3*[0.0]
+        plane_ids = []
+        plane_points = []
+        plane_normals = []
 
         for i in range(start_id, end_id, id_offset):
             plane_pt = points.GetPoint(i)
@@ -160,19 +187,9 @@ class Surface(object):
                 for j in range(3):
                     avg_normal[j] /= length 
 
-                slice_plane = vtk.vtkPlane()
-                slice_plane.SetOrigin(plane_pt[0], plane_pt[1], plane_pt[2])
-                slice_plane.SetNormal(avg_normal[0], avg_normal[1], avg_normal[2])
-                self.show_plane(plane_pt, avg_normal, color=[1,0,0])
-
-                cutter = vtk.vtkCutter()
-                cutter.SetCutFunction(slice_plane)
-                cutter.SetInputData(self.geometry);
-                cutter.Update()
-                slice_geom = cutter.GetOutput()
-
-                self.graphics.add_geometry(self.renderer, slice_geom, [1,0,0], line_width=3)
-                self.slices.append(slice_geom)
+                plane_ids.append(i)
+                plane_points.append(plane_pt)
+                plane_normals.append(list(avg_normal))
                 last_plane_pt = plane_pt
 
                 for j in range(3):
@@ -180,23 +197,57 @@ class Surface(object):
 
             first_slice = False
 
-        self.write_slices()
+        return plane_ids, plane_points, plane_normals
 
     def write_slices(self):
-        '''Write slice geometry to a text file.
-        '''
-        slices_file = self.file_prefix + '-slices.txt'
-
-        with open(slices_file, 'w') as file:
-            for slice in self.slices:
-                file.write("<contour_points>\n")
-                num_points = slice.GetNumberOfPoints()
-                points = slice.GetPoints()
-                for i in range(num_points):
-                    pt = points.GetPoint(i)
-                    file.write(f'<point id="{i}" x="{pt[0]}"    y="{pt[1]}"  z="{pt[2]}" /> \n')
-                file.write("</contour_points>\n")
+        '''Write slice contours to a SimVascular .ctgr contour group file.
 
+           The lines of each contour are formatted and written together using a buffered file.
+        '''
+        slices_file = self.file_prefix + '-slices.ctgr'
+        path_name = path.basename(self.file_prefix)
+
+        with open(slices_file, 'w', buffering=1048576) as file:
+            file.write('<?xml version="1.0" encoding="UTF-8" ?>\n')
+            file.write('<format version="1.0" />\n')
+            file.write(f'<contourgroup path_name="{path_name}" path_id="1">\n')
+            file.write('    <timestep id="0">\n')
+            file.write('        <lofting_parameters sampling="60" sample_per_seg="12" use_linear_sample="1" ' + 
+                'linear_multiplier="10" use_fft="0" num_modes="20" />\n')
+
+            for cid, slice in enumerate(self.slices):
+                # The rotation vector is in the slice plane, pointing to the first contour point.
+                pos = slice.point
+                tangent = slice.normal
+                rotation = slice.points[0] - pos
+                rotation -= rotation.dot(tangent) * tangent
+                rotation /= np.linalg.norm(rotation)
+                closed = "true" if slice.closed else "false"
+
+                lines = [
+                  f'        <contour id="{cid}" type="Contour" method="Manual" closed="{closed}" min_control_number="2" ' + 
+                    'max_control_number="2" subdivision_type="0" subdivision_number="0" subdivision_spacing="0">',
+                  f'            <path_point id="{slice.index}">',
+                  '                <pos x="%r" y="%r" z="%r" />' % tuple(pos.tolist()),
+                  '                <tangent x="%r" y="%r" z="%r" />' % tuple(tangent.tolist()),
+                  '                <rotation x="%r" y="%r" z="%r" />' % tuple(rotation.tolist()),
+                  '            </path_point>',
+                  '            <control_points>',
+                  '                <point id="0" x="%r" y="%r" z="%r" />' % tuple(slice.center.tolist()),
+                  '                <point id="1" x="%r" y="%r" z="%r" />' % tuple(slice.points[0].tolist()),
+                  '            </control_points>',
+                  '            <contour_points>'
+                ]
+                lines.extend([ '                <point id="%d" x="%r" y="%r" z="%r" />' % (i, pt[0], pt[1], pt[2])
+                  for i, pt in enumerate(slice.points.tolist()) ])
+                lines.append('            </contour_points>')
+                lines.append('        </contour>\n')
+                file.write("\n".join(lines))
+
+            file.write('    </timestep>\n')
+            file.write('</contourgroup>\n')
+
+        print(f"[surface] Slices have been written to '{slices_file}'")
 
     def show_plane(self, origin, normal, color):
         if not self.renderer:
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+
+'''
+This module is used to cut a surface with slice planes defined by centerline points and normals.
+
+Only the surface triangles that may intersect a plane are cut. The arc length of the centerline points
+is measured along each centerline polyline from its first point, each surface point is given the arc
+length of its nearest centerline point and the triangles are sorted by the minimum arc length of their
+points. The candidate triangles for a plane are those that may have an arc length range overlapping a
+window around the arc length of the plane point, they are a contiguous range of the sorted triangles
+found using a binary search. The window is window_scale times the MaximumInscribedSphereRadius at the
+plane point.
+
+The candidate triangles are cut using NumPy. The cut points are joined into ordered loops using the
+triangle edges they are on, the slice is the loop with the center nearest the plane point. If the loop
+is not closed it may have been cut short by the arc length window, or if no triangles are cut the 
+window may have missed the surface near the plane, so the window is doubled and the plane cut again 
+until it includes all of the triangles.
+
+Example:
+
+    from surface_slicer import SurfaceSlicer
+
+    slicer = SurfaceSlicer(surface, centerlines)
+    slice = slicer.extract_slice(index, point, normal)
+    print(slice.points, slice.closed)
+'''
+
+import os
+import sys
+import numpy as np
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy, numpy_to_vtk
+
+# The node matching and VTK array modules are in the node-matching directory of this repository.
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "node-matching", "python"))
+from node_matching import find_nearest
+from vtk_array_utils import get_cell_point_ids
+
+def get_arc_lengths(points, offsets, connectivity):
+    '''Get the arc length of the points of polylines measured from the first point of each polyline.
+
+       A point on several polylines is given its arc length on the first one. The arc length of points
+       not on a polyline is NaN.
+    '''
+    lengths = np.zeros(connectivity.shape[0])
+    lengths[1:] = np.linalg.norm(np.diff(points[connectivity], axis=0), axis=1)
+    sizes = offsets[1:] - offsets[:-1]
+    starts = offsets[:-1][sizes != 0]
+    lengths[starts] = 0.0
+    cell_arc_lengths = np.cumsum(lengths)
+    cell_arc_lengths -= np.repeat(cell_arc_lengths[starts], sizes[sizes != 0])
+
+    arc_lengths = np.full(points.shape[0], np.nan)
+    point_ids, first = np.unique(connectivity, return_index=True)
+    arc_lengths[point_ids] = cell_arc_lengths[first]
+    return arc_lengths
+
+def get_loops(num_nodes, segments):
+    '''Join the segments between nodes into ordered loops.
+
+       A node is on at most two segments. Returns a list of (node IDs, closed) tuples.
+    '''
+    ends = segments.ravel()
+    others = segments[:,::-1].ravel()
+    order = np.argsort(ends, kind='stable')
+    ends = ends[order]
+    others = others[order]
+    first = np.searchsorted(ends, ends, side='left')
+    position = np.arange(ends.shape[0]) - first
+    neighbors = np.full((num_nodes,2), -1, dtype=np.int64)
+    neighbors[ends[position < 2], position[position < 2]] = others[position < 2]
+    degree = np.bincount(segments.ravel(), minlength=num_nodes)
+
+    ## Follow the neighbors of each node.
+    #
+    # Open loops are started at their end nodes.
+    #
+    loops = []
+    visited = np.zeros(num_nodes, dtype=bool)
+    for start in np.concatenate((np.nonzero(degree == 1)[0], np.nonzero(degree > 1)[0])):
+        if visited[start]:
+            continue
+        visited[start] = True
+        loop = [start]
+        prev_node = -1
+        node = start
+        while True:
+            next_node = neighbors[node,1] if neighbors[node,0] == prev_node else neighbors[node,0]
+            if (next_node == -1) or visited[next_node]:
+                break
+            visited[next_node] = True
+            loop.append(next_node)
+            prev_node = node
+            node = next_node
+        loops.append((np.array(loop), (next_node == start) and (len(loop) > 2)))
+
+    return loops
+
+class SurfaceSlice(object):
+    '''This class stores the slice of a surface at a centerline point.
+
+    Attributes:
+        index (int): The index of the centerline point.
+        point (np.ndarray): The centerline point.
+        normal (np.ndarray): The unit normal of the slice plane.
+        points (np.ndarray): The ordered contour points, counterclockwise about the normal. None if
+            the plane does not cut the surface.
+        closed (bool): If True then the contour is closed.
+        center (np.ndarray): The average of the contour points.
+        geometry (vtkPolyData): The contour as a polyline.
+    '''
+    def __init__(self, index, point, normal):
+        self.index = index
+        self.point = point
+        self.normal = normal
+        self.points = None
+        self.closed = False
+        self.center = None
+        self.geometry = None
+
+    def set_points(self, points, closed):
+        '''Set the contour points and create the contour geometry.
+        '''
+        # Orient the contour counterclockwise about the plane normal using its area vector.
+        area_normal = np.sum(np.cross(points, np.roll(points, -1, axis=0)), axis=0)
+        if area_normal.dot(self.normal) < 0.0:
+            points = points[::-1]
+
+        self.points = points
+        self.closed = closed
+        self.center = points.mean(axis=0)
+
+        num_points = points.shape[0]
+        line_ids = list(range(num_points)) + ([0] if closed else [])
+        polyline = vtk.vtkPolyLine()
+        polyline.GetPointIds().SetNumberOfIds(len(line_ids))
+        for i, pid in enumerate(line_ids):
+            polyline.GetPointIds().SetId(i, pid)
+        lines = vtk.vtkCellArray()
+        lines.InsertNextCell(polyline)
+
+        self.geometry = vtk.vtkPolyData()
+        self.geometry.SetPoints(vtk.vtkPoints())
+        self.geometry.GetPoints().SetData(numpy_to_vtk(points, deep=True))
+        self.geometry.SetLines(lines)
+
+class SurfaceSlicer(object):
+    '''This class is used to extract slices of a surface along centerlines.
+    '''
+    def __init__(self, surface, centerlines, window_scale=2.0):
+        self.window_scale = window_scale
+
+        # The surface polygons are cut as triangles.
+        triangle_filter = vtk.vtkTriangleFilter()
+        triangle_filter.SetInputData(surface)
+        triangle_filter.PassVertsOff()
+        triangle_filter.PassLinesOff()
+        triangle_filter.Update()
+        triangles = triangle_filter.GetOutput()
+
+        self.points = vtk_to_numpy(triangles.GetPoints().GetData()).astype(np.float64)
+        polys = triangles.GetPolys()
+        if hasattr(polys, "GetConnectivityArray"):
+            self.triangles = vtk_to_numpy(polys.GetConnectivityArray()).astype(np.int64).reshape(-1,3)
+        else:
+            self.triangles = vtk_to_numpy(polys.GetData()).astype(np.int64).reshape(-1,4)[:,1:]
+        self.num_triangles = self.triangles.shape[0]
+
+        ## Compute the arc length of the centerline points along each centerline polyline.
+        #
+        # Centerlines for several paths repeat the points of their shared vessels, each copy 
+        # has the same arc length. 
+        #
+        cl_points = vtk_to_numpy(centerlines.GetPoints().GetData()).astype(np.float64)
+        offsets, connectivity = get_cell_point_ids(centerlines.GetLines())
+        if connectivity.shape[0] != 0:
+            self.arc_lengths = get_arc_lengths(cl_points, offsets, connectivity)
+        else:
+            self.arc_lengths = np.zeros(cl_points.shape[0])
+            np.cumsum(np.linalg.norm(np.diff(cl_points, axis=0), axis=1), out=self.arc_lengths[1:])
+        on_lines = np.nonzero(~np.isnan(self.arc_lengths))[0]
+        radius_data = centerlines.GetPointData().GetArray("MaximumInscribedSphereRadius")
+        self.radii = None if radius_data is None else vtk_to_numpy(radius_data).astype(np.float64)
+
+        ## Sort the triangles by the arc length range of their points.
+        #
+        # The triangle point coordinates are stored in this order so the candidate triangles
+        # for a plane are a contiguous range.
+        #
+        point_arc_lengths = self.arc_lengths[on_lines[find_nearest(cl_points[on_lines], self.points)]]
+        triangle_arc_lengths = point_arc_lengths[self.triangles]
+        min_arc_lengths = triangle_arc_lengths.min(axis=1)
+        order = np.argsort(min_arc_lengths, kind='stable')
+        self.triangles = self.triangles[order]
+        self.triangle_points = self.points[self.triangles]
+        self.min_arc_lengths = min_arc_lengths[order]
+        self.max_arc_length_span = np.max(triangle_arc_lengths.max(axis=1) - min_arc_lengths) if self.num_triangles != 0 else 0.0
+
+    def get_candidate_triangles(self, arc_length, window):
+        '''Get the range of sorted triangles that may have an arc length range overlapping 
+           [arc_length-window, arc_length+window].
+        '''
+        start = np.searchsorted(self.min_arc_lengths, arc_length - window - self.max_arc_length_span, side='left')
+        end = np.searchsorted(self.min_arc_lengths, arc_length + window, side='right')
+        return start, end
+
+    def cut_triangles(self, start, end, point, normal):
+        '''Cut the range of sorted triangles [start, end) with a plane.
+
+           A point is inside the plane if its distance is >= 0. Returns the cut points on the triangle
+           edges and the segments joining the two cut points of each cut triangle.
+        '''
+        offset = point.dot(normal)
+        inside = (self.triangle_points[start:end].reshape(-1,3).dot(normal) >= offset).reshape(-1,3)
+        num_inside = inside[:,0].astype(np.int8) + inside[:,1] + inside[:,2]
+        cut = np.nonzero((num_inside == 1) | (num_inside == 2))[0]
+        triangles = self.triangles[start + cut]
+        inside = inside[cut]
+        num_inside = num_inside[cut]
+
+        # The two cut edges of a triangle join the point on one side of the plane to the other two points.
+        rows = np.arange(triangles.shape[0])
+        lone = np.where(num_inside == 1, np.argmax(inside, axis=1), np.argmin(inside, axis=1))
+        lone_ids = triangles[rows, lone]
+        edges = np.concatenate((np.column_stack((lone_ids, triangles[rows, (lone+1) % 3])),
+          np.column_stack((lone_ids, triangles[rows, (lone+2) % 3]))))
+        edges = np.sort(edges, axis=1)
+
+        # Cut points are computed once for edges shared by triangles.
+        keys, index = np.unique(edges[:,0]*self.points.shape[0] + edges[:,1], return_inverse=True)
+        cut_edges = np.column_stack((keys // self.points.shape[0], keys % self.points.shape[0]))
+        dist = self.points[cut_edges].dot(normal) - offset
+        t = dist[:,0] / (dist[:,0] - dist[:,1])
+        cut_points = self.points[cut_edges[:,0]] + t[:,None] * (self.points[cut_edges[:,1]] - self.points[cut_edges[:,0]])
+
+        return cut_points, index.reshape(2,-1).T
+
+    def extract_slice(self, index, point, normal):
+        '''Extract the slice at a centerline point.
+        '''
+        point = np.asarray(point, dtype=np.float64)
+        normal = np.asarray(normal, dtype=np.float64)
+        normal = normal / np.linalg.norm(normal)
+        slice = SurfaceSlice(index, point, normal)
+        window = self.window_scale * self.radii[index] if self.radii is not None else np.inf
+        if np.isnan(self.arc_lengths[index]):
+            window = np.inf
+
+        while True:
+            if np.isinf(window):
+                start, end = 0, self.num_triangles
+            else:
+                start, end = self.get_candidate_triangles(self.arc_lengths[index], window)
+
+            # The window may not include the surface near the plane, it is widened until all of
+            # the triangles are cut.
+            cut_points, segments = self.cut_triangles(start, end, point, normal)
+            if segments.shape[0] == 0:
+                if end - start == self.num_triangles:
+                    return slice
+                window *= 2.0
+                continue
+
+            loops = get_loops(cut_points.shape[0], segments)
+            centers = np.array([ cut_points[loop].mean(axis=0) for loop, closed in loops ])
+            loop, closed = loops[np.argmin(np.sum((centers - point)**2, axis=1))]
+
+            # The loop may be cut short if it extends outside the arc length window.
+            if closed or (end - start == self.num_triangles):
+                slice.set_points(cut_points[loop], closed)
+                return slice
+
+            window *= 2.0
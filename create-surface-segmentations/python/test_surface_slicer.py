@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+'''
+This script checks the slices extracted by SurfaceSlicer for centerlines with several paths.
+
+Centerlines computed for several outlets have a polyline for each path and the paths repeat the
+points of their shared vessels. A tube is sliced using centerlines with two copies of its axis and
+two branching paths sharing a trunk. The slices at the points of each copy must be the same closed
+contour. The script exits with status 1 if any check fails.
+
+Example:
+
+    python test_surface_slicer.py
+'''
+
+import sys
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk
+
+from surface_slicer import SurfaceSlicer
+
+def create_tube(start, end, radius, resolution=50, num_sides=64):
+    '''Create a triangulated tube surface around a line.
+    '''
+    line = vtk.vtkLineSource()
+    line.SetPoint1(start)
+    line.SetPoint2(end)
+    line.SetResolution(resolution)
+    tube = vtk.vtkTubeFilter()
+    tube.SetInputConnection(line.GetOutputPort())
+    tube.SetRadius(radius)
+    tube.SetNumberOfSides(num_sides)
+    tube.Update()
+    return tube.GetOutput()
+
+def create_centerlines(paths, radius):
+    '''Create centerlines with a polyline for each path of points.
+    '''
+    points = np.vstack(paths)
+    centerlines = vtk.vtkPolyData()
+    centerlines.SetPoints(vtk.vtkPoints())
+    centerlines.GetPoints().SetData(numpy_to_vtk(points, deep=True))
+
+    lines = vtk.vtkCellArray()
+    start = 0
+    for path in paths:
+        polyline = vtk.vtkPolyLine()
+        polyline.GetPointIds().SetNumberOfIds(path.shape[0])
+        for i in range(path.shape[0]):
+            polyline.GetPointIds().SetId(i, start+i)
+        lines.InsertNextCell(polyline)
+        start += path.shape[0]
+    centerlines.SetLines(lines)
+
+    radii = numpy_to_vtk(np.full(points.shape[0], radius), deep=True)
+    radii.SetName("MaximumInscribedSphereRadius")
+    centerlines.GetPointData().AddArray(radii)
+    return centerlines, points
+
+def check_copies(name, slicer, points, normals, num_copy_points, copy_start):
+    '''Check that the slices at the points of a path and at their copies are the same closed contour.
+
+       The planes at the first and last points are not checked, they may be at the ends of the tube.
+       Returns the number of failed checks.
+    '''
+    num_failed = 0
+    num_checked = num_copy_points - 2
+    for i in range(1, num_copy_points-1):
+        slices = [ slicer.extract_slice(j, points[j], normals[j]) for j in (i, copy_start+i) ]
+        ok = all((slice.points is not None) and slice.closed for slice in slices)
+        ok = ok and np.array_equal(slices[0].points, slices[1].points)
+        if not ok:
+            print("{0:s}: FAILED: the slices at points {1:d} and {2:d} differ.".format(name, i, copy_start+i))
+            num_failed += 1
+    print("{0:s}: {1:d} of {2:d} slice pairs ok".format(name, num_checked - num_failed, num_checked))
+    return num_failed
+
+def main():
+    num_failed = 0
+    z = np.linspace(0.0, 10.0, 51)
+    axis = np.column_stack((0*z, 0*z, z))
+
+    ## Two copies of the axis of a straight tube.
+    #
+    surface = create_tube((0,0,0), (0,0,10), 1.0)
+    centerlines, points = create_centerlines([axis, axis], 1.0)
+    normals = np.tile([0.0, 0.0, 1.0], (points.shape[0],1))
+    slicer = SurfaceSlicer(surface, centerlines)
+    num_failed += check_copies("two copies", slicer, points, normals, axis.shape[0], axis.shape[0])
+
+    ## Two paths sharing a trunk, the second path branches off at the end of the trunk.
+    #
+    branch = np.column_stack((z[1:], 0*z[1:], 10.0 + 0*z[1:]))
+    append = vtk.vtkAppendPolyData()
+    append.AddInputData(surface)
+    append.AddInputData(create_tube((0,0,10), (10,0,10), 1.0))
+    append.Update()
+    trunk = axis[:41]
+    centerlines, points = create_centerlines([axis, np.vstack((trunk, branch))], 1.0)
+    slicer = SurfaceSlicer(append.GetOutput(), centerlines)
+    num_failed += check_copies("shared trunk", slicer, points, normals, trunk.shape[0], axis.shape[0])
+
+    if num_failed != 0:
+        print("{0:d} checks failed.".format(num_failed))
+        sys.exit(1)
+    print("All checks passed.")
+
+if __name__ == '__main__':
+    main()
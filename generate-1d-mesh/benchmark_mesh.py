@@ -0,0 +1,401 @@
+#!/usr/bin/env python
+
+"""
+This module is used to benchmark 1D mesh generation on synthetic branching trees of scalable size.
+
+Centerlines are not computed with vmtk. Branch-split centerlines with the same cell data arrays
+(CenterlineIds, GroupIds, TractIds and Blanking) and point data arrays (MaximumInscribedSphereRadius)
+produced by vmtk are created for a tree with a given number of outlets and branching factor.
+
+A tree is grown from a single inlet vessel by splitting its outlet vessels in breadth-first order, each
+split adding a bifurcation group and 'branching factor' child vessels, until the tree has the requested
+number of outlets. A branching factor of 2 creates a binary tree, larger values create multi-furcating
+trees that are meshed with segment reorganization enabled.
+
+Each case is run in its own process so that the peak memory reported for a case is not affected by
+the cases run before it. The time and peak memory of each mesh generation stage is written to the log
+and to the 'benchmark_mesh.json' file in the output directory.
+
+Example:
+
+    python benchmark_mesh.py --num-outlets 10 100 1000 10000 --branching-factors 2 3 4 --output-directory bench
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, numpy_to_vtkIdTypeArray
+
+from manage import get_logger_name, init_logging
+from parameters import Parameters, OutflowBoundaryConditionType
+from centerlines import Centerlines
+from mesh import Mesh
+from profiling import get_profiler
+
+logger = logging.getLogger(get_logger_name())
+
+class Args(object):
+    """ This class defines the command line arguments to the generate-1d-mesh benchmark script.
+    """
+    PREFIX = "--"
+    BRANCHING_FACTORS = "branching_factors"
+    NUM_OUTLETS = "num_outlets"
+    NUM_POINTS = "num_points"
+    OUTPUT_DIRECTORY = "output_directory"
+    NO_WRITE_FILES = "no_write_files"
+
+REPORT_FILE_NAME = "benchmark_mesh.json"
+
+def cmd(name):
+    """ Create an argparse command argument.
+    """
+    return Args.PREFIX + name.replace("_", "-")
+
+def parse_args():
+    """ Parse command-line arguments."""
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(cmd(Args.BRANCHING_FACTORS), type=int, nargs='+', default=[2, 3, 4],
+      help="The number of child vessels at each branch, 2 for binary trees.")
+
+    parser.add_argument(cmd(Args.NUM_OUTLETS), type=int, nargs='+', default=[10, 100, 1000, 10000],
+      help="The number of outlets of the trees.")
+
+    parser.add_argument(cmd(Args.NUM_POINTS), type=int, default=20,
+      help="The number of centerline points in each vessel and bifurcation cell.")
+
+    parser.add_argument(cmd(Args.OUTPUT_DIRECTORY), required=True,
+      help="The directory where the benchmark results are written.")
+
+    parser.add_argument(cmd(Args.NO_WRITE_FILES), const=True, nargs='?', default=False,
+      help="If true then do not write the 1D mesh and solver files.")
+
+    return parser.parse_args()
+
+class SyntheticTree(object):
+    """ The SyntheticTree class is used to create branch-split centerlines for a vessel tree.
+
+    Attributes:
+        num_outlets (int): The number of outlets.
+        branching_factor (int): The maximum number of child vessels of a vessel.
+        parent (list[int]): parent[i] is the parent vessel of vessel i, -1 for the inlet vessel.
+        children (list[list[int]]): children[i] are the child vessels of vessel i.
+        start, end (ndarray[float]): The start and end points of the vessels.
+        bif_end (ndarray[float]): The end points of the bifurcations following the vessels.
+        radius (ndarray[float]): The radius at the start of the vessels.
+    """
+
+    ## Vessel geometry.
+    INLET_LENGTH = 20.0
+    INLET_RADIUS = 2.0
+    LENGTH_RATIO = 0.8
+    RADIUS_RATIO = 0.8
+    BIFURCATION_LENGTH = 0.15
+    BRANCH_ANGLE = np.pi / 6.0
+
+    def __init__(self, num_outlets, branching_factor):
+        self.num_outlets = num_outlets
+        self.branching_factor = branching_factor
+        self.create_topology()
+        self.create_geometry()
+
+    def create_topology(self):
+        """ Split the outlet vessels of the tree in breadth-first order until there are 'num_outlets' outlets.
+
+        The last vessel split may have fewer than 'branching_factor' children.
+        """
+        parent = [-1]
+        children = [[]]
+        leaves = [0]
+        num_leaves = 1
+        k = 0
+
+        while num_leaves < self.num_outlets:
+            vessel = leaves[k]
+            k += 1
+            num_children = min(self.branching_factor, self.num_outlets - num_leaves + 1)
+            for i in range(num_children):
+                parent.append(vessel)
+                children.append([])
+                children[vessel].append(len(parent)-1)
+                leaves.append(len(parent)-1)
+            num_leaves += num_children - 1
+        #__while num_leaves < self.num_outlets
+
+        self.parent = parent
+        self.children = children
+        self.num_vessels = len(parent)
+
+    def create_geometry(self):
+        """ Compute the start and end points and radii of the vessels.
+
+        Child vessels are rotated by BRANCH_ANGLE from their parent direction and spread
+        around it so the children of a vessel do not overlap.
+        """
+        num_vessels = self.num_vessels
+        start = np.zeros((num_vessels,3))
+        end = np.zeros((num_vessels,3))
+        bif_end = np.zeros((num_vessels,3))
+        direction = np.zeros((num_vessels,3))
+        length = np.zeros(num_vessels)
+        radius = np.zeros(num_vessels)
+
+        direction[0] = [0.0, 0.0, 1.0]
+        length[0] = self.INLET_LENGTH
+        radius[0] = self.INLET_RADIUS
+
+        # Vessels are created in breadth-first order so a parent is always processed before its children.
+        for i in range(num_vessels):
+            p = self.parent[i]
+            if p != -1:
+                start[i] = bif_end[p]
+                length[i] = self.LENGTH_RATIO * length[p]
+                radius[i] = self.RADIUS_RATIO * radius[p]
+            end[i] = start[i] + length[i]*direction[i]
+            bif_end[i] = end[i] + self.BIFURCATION_LENGTH*length[i]*direction[i]
+
+            ## Set the directions of the child vessels.
+            num_children = len(self.children[i])
+            if num_children == 0:
+                continue
+            d = direction[i]
+            u = np.cross(d, [1.0, 0.0, 0.0] if abs(d[0]) < 0.9 else [0.0, 1.0, 0.0])
+            u /= np.linalg.norm(u)
+            w = np.cross(d, u)
+            for j,child in enumerate(self.children[i]):
+                phi = 2.0*np.pi*(j + 0.5*(i % 2)) / num_children
+                child_dir = np.cos(self.BRANCH_ANGLE)*d + np.sin(self.BRANCH_ANGLE)*(np.cos(phi)*u + np.sin(phi)*w)
+                direction[child] = child_dir / np.linalg.norm(child_dir)
+        #__for i in range(num_vessels)
+
+        self.start = start
+        self.end = end
+        self.bif_end = bif_end
+        self.radius = radius
+
+    def get_paths(self):
+        """ Get the vessels from the inlet to each outlet in depth-first order.
+        """
+        paths = []
+        stack = [[0]]
+        while stack:
+            path = stack.pop()
+            children = self.children[path[-1]]
+            if not children:
+                paths.append(path)
+            for child in reversed(children):
+                stack.append(path + [child])
+        return paths
+
+    def create_centerlines(self, num_points):
+        """ Create branch-split centerlines as a vtkPolyData object.
+
+        Each path has a cell for each vessel and for each bifurcation along it. The cells of
+        a vessel or bifurcation shared by several paths are given the same group ID.
+        """
+        ## Assign group IDs: the vessel group and the bifurcation group following it.
+        vessel_group = np.zeros(self.num_vessels, dtype=np.int64)
+        bif_group = np.full(self.num_vessels, -1, dtype=np.int64)
+        num_groups = 1
+        for i in range(self.num_vessels):
+            if self.children[i]:
+                bif_group[i] = num_groups
+                num_groups += 1
+                for child in self.children[i]:
+                    vessel_group[child] = num_groups
+                    num_groups += 1
+
+        ## Create the cell data arrays and the segment end points of each cell.
+        centerline_ids = []
+        group_ids = []
+        tract_ids = []
+        blanking = []
+        cell_vessels = []
+        cell_is_bif = []
+
+        for path_id,path in enumerate(self.get_paths()):
+            tract = 0
+            for vessel in path:
+                for is_bif in (False, True):
+                    if is_bif and not self.children[vessel]:
+                        continue
+                    centerline_ids.append(path_id)
+                    group_ids.append(bif_group[vessel] if is_bif else vessel_group[vessel])
+                    tract_ids.append(tract)
+                    blanking.append(int(is_bif))
+                    cell_vessels.append(vessel)
+                    cell_is_bif.append(is_bif)
+                    tract += 1
+        #__for path_id,path in enumerate(self.get_paths())
+
+        cell_vessels = np.array(cell_vessels, dtype=np.int64)
+        cell_is_bif = np.array(cell_is_bif, dtype=bool)
+        num_cells = cell_vessels.shape[0]
+
+        p0 = np.where(cell_is_bif[:,None], self.end[cell_vessels], self.start[cell_vessels])
+        p1 = np.where(cell_is_bif[:,None], self.bif_end[cell_vessels], self.end[cell_vessels])
+        r0 = self.radius[cell_vessels]
+        r1 = np.where(cell_is_bif, r0*self.RADIUS_RATIO, r0*(0.5 + 0.5*self.RADIUS_RATIO))
+        r0 = np.where(cell_is_bif, r0*(0.5 + 0.5*self.RADIUS_RATIO), r0)
+
+        ## Create points, each cell has its own points as in vmtk centerlines.
+        t = np.linspace(0.0, 1.0, num_points)
+        points = (p0[:,None,:] + t[None,:,None]*(p1 - p0)[:,None,:]).reshape(-1,3)
+        radii = (r0[:,None] + t[None,:]*(r1 - r0)[:,None]).reshape(-1)
+
+        cells = np.empty((num_cells, num_points+1), dtype=np.int64)
+        cells[:,0] = num_points
+        cells[:,1:] = np.arange(num_cells*num_points).reshape(num_cells, num_points)
+
+        vtk_points = vtk.vtkPoints()
+        vtk_points.SetData(numpy_to_vtk(points, deep=True))
+        lines = vtk.vtkCellArray()
+        lines.SetCells(num_cells, numpy_to_vtkIdTypeArray(cells.ravel(), deep=True))
+
+        polydata = vtk.vtkPolyData()
+        polydata.SetPoints(vtk_points)
+        polydata.SetLines(lines)
+
+        fields = Mesh.CellDataFields
+        for name, values in [(fields.CENTERLINE_IDS, centerline_ids), (fields.GROUP_IDS, group_ids),
+          (fields.TRACT_IDS, tract_ids), (fields.BLANKING, blanking)]:
+            array = numpy_to_vtk(np.array(values, dtype=np.int32), deep=True)
+            array.SetName(name)
+            polydata.GetCellData().AddArray(array)
+
+        array = numpy_to_vtk(radii, deep=True)
+        array.SetName(Mesh.PointDataFields.MAX_INSCRIBED_RADIUS)
+        polydata.GetPointData().AddArray(array)
+
+        return polydata
+
+def get_outlet_face_names(num_outlets):
+    """ Get the outlet face names for the paths of a synthetic tree.
+    """
+    return ["cap_%d" % i for i in range(num_outlets)]
+
+def run_case(case):
+    """ Generate a 1D mesh for a synthetic tree.
+
+    Returns the case description with the time and peak memory of each stage.
+    """
+    output_dir = case["output_directory"]
+    os.makedirs(output_dir, exist_ok=True)
+    init_logging(output_dir, console=False)
+    profiler = get_profiler()
+    profiler.enable()
+
+    with profiler.stage("create_tree", outlets=case["num_outlets"]) as stage:
+        tree = SyntheticTree(case["num_outlets"], case["branching_factor"])
+        stage.counts["vessels"] = tree.num_vessels
+
+    with profiler.stage("create_centerlines") as stage:
+        centerlines = Centerlines()
+        centerlines.branch_geometry = tree.create_centerlines(case["num_points"])
+        centerlines.outlet_face_names = get_outlet_face_names(case["num_outlets"])
+        stage.counts["cells"] = centerlines.branch_geometry.GetNumberOfCells()
+        stage.counts["points"] = centerlines.branch_geometry.GetNumberOfPoints()
+
+    ## Set resistance outflow boundary conditions.
+    params = Parameters()
+    params.output_directory = output_dir
+    params.model_name = case["name"]
+    params.compute_centerlines = False
+    params.reorganize_seqments = case["branching_factor"] > 2
+    params.uniform_bc = False
+    params.outflow_bc_type = OutflowBoundaryConditionType.RESISTANCE
+    params.outflow_bc_file = os.path.join(output_dir, params.OUTFLOW_BC_TYPES[params.outflow_bc_type])
+    with open(params.outflow_bc_file, "w") as file:
+        for name in centerlines.outlet_face_names:
+            file.write("%s 100.0\n" % name)
+
+    params.write_mesh_file = case["write_files"]
+    params.write_solver_file = case["write_files"]
+    params.mesh_output_file = case["name"] + ".vtp"
+    params.solver_output_file = case["name"] + ".in"
+
+    result = { key:case[key] for key in ["name", "num_outlets", "branching_factor", "num_points"] }
+
+    try:
+        mesh = Mesh()
+        with profiler.stage("generate") as stage:
+            mesh.generate(params, centerlines)
+            stage.counts["nodes"] = len(mesh.nodes)
+            stage.counts["segments"] = mesh.num_seg
+        result["status"] = "ok"
+        result["error"] = None
+    except Exception as e:
+        logger.exception("Mesh generation failed")
+        result["status"] = "error"
+        result["error"] = str(e)
+
+    profiler.log_summary(logger)
+    result.update(profiler.get_report())
+    return result
+
+def log_summary(results):
+    """ Write a table of the time and peak memory of the mesh generation stages for all cases.
+    """
+    stage_names = []
+    for result in results:
+        for stage in result["stages"]:
+            if stage["name"] not in stage_names:
+                stage_names.append(stage["name"])
+
+    logger.info("Benchmark summary (time in seconds):")
+    header = "%-16s %7s %-6s %12s " % ("case", "outlets", "status", "peak RSS(MB)") + " ".join("%12s" % name[:12]
+      for name in stage_names)
+    logger.info(header)
+    logger.info("-" * len(header))
+
+    for result in results:
+        times = dict()
+        for stage in result["stages"]:
+            times[stage["name"]] = times.get(stage["name"], 0.0) + stage["time"]
+        rss = "" if result["process_peak_rss_mb"] is None else "%.1f" % result["process_peak_rss_mb"]
+        logger.info("%-16s %7d %-6s %12s " % (result["name"], result["num_outlets"], result["status"], rss) +
+          " ".join("%12s" % ("" if name not in times else "%.3f" % times[name]) for name in stage_names))
+        if result["error"]:
+            logger.info("    error: %s" % result["error"])
+
+def run(num_outlets, branching_factors, num_points, output_directory, write_files=True):
+    """ Run the benchmark cases for all combinations of number of outlets and branching factor.
+
+    Returns the list of case results.
+    """
+    cases = []
+    for factor in branching_factors:
+        for outlets in num_outlets:
+            name = "tree_k%d_n%d" % (factor, outlets)
+            cases.append({ "name":name, "num_outlets":outlets, "branching_factor":factor, "num_points":num_points,
+              "write_files":write_files, "output_directory":os.path.join(output_directory, name) })
+
+    ## Use a new process for each case so the peak memory is measured for that case only.
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for case in cases:
+        logger.info("Run case %s ..." % case["name"])
+        with context.Pool(processes=1, maxtasksperchild=1) as pool:
+            result = pool.apply(run_case, (case,))
+        logger.info("Case %s: %s (%.3f s)" % (result["name"], result["status"], result["total_time"]))
+        results.append(result)
+
+    log_summary(results)
+
+    file_name = os.path.join(output_directory, REPORT_FILE_NAME)
+    with open(file_name, "w") as file:
+        json.dump(results, file, indent=2, default=lambda value: value.item() if hasattr(value, "item") else str(value))
+    logger.info("Report written to: %s" % file_name)
+    return results
+
+if __name__ == '__main__':
+    args = parse_args()
+    if not os.path.exists(args.output_directory):
+        os.makedirs(args.output_directory)
+    init_logging(args.output_directory)
+    run(args.num_outlets, args.branching_factors, args.num_points, args.output_directory,
+      not args.no_write_files)
@@ -5,6 +5,7 @@ The module is used to extact centerlines from a surface mesh.
 """
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import numpy as np
 
@@ -25,6 +26,11 @@ class Centerlines(object):
 
     Attributes:
     """
+
+    ## Parameters used to execute vmtkCenterlines.
+    SEED_SELECTOR_NAME = "pointlist"
+    APPEND_END_POINTS = 1
+
     def __init__(self):
 
         self.inlet_face_name = None
@@ -55,8 +61,8 @@ class Centerlines(object):
         self.logger.info("Calculating surface centerlines ...");
         centerlines = vmtkscripts.vmtkCenterlines()
         centerlines.Surface = surface_mesh 
-        centerlines.SeedSelectorName = "pointlist"
-        centerlines.AppendEndPoints = 1
+        centerlines.SeedSelectorName = self.SEED_SELECTOR_NAME
+        centerlines.AppendEndPoints = self.APPEND_END_POINTS
         centerlines.SourcePoints = self.inlet_center
         centerlines.TargetPoints = self.outlet_centers
         centerlines.Execute()
@@ -84,17 +90,16 @@ class Centerlines(object):
         """
         self.branch_geometry = read_polydata(file_name)
 
-    def get_inlet_outlet_centers(self, params):
-        """ Get the centers of the inlet and outlet surface geometry.
+    def get_boundary_face_files(self, params):
+        """ Get the inlet and outlet face files in the boundary surfaces directory.
 
-            Surface inlet and outlet faces are identifed by their file name. 
+            Wall faces and files that are not surface files are skipped. Files are
+            sorted by name so that outlets are always processed in the same order.
         """
         surf_mesh_dir = Path(params.boundary_surfaces_dir)
-        inlet_file_name = params.inlet_face_input_file
-        self.outlet_face_names = []
-        self.outlet_centers = []
+        face_files = []
 
-        for face_file in surf_mesh_dir.iterdir():
+        for face_file in sorted(surf_mesh_dir.iterdir()):
             file_name = face_file.name
             self.logger.debug("Surface file name: %s" % file_name)
             file_suffix = face_file.suffix.lower()[1:]
@@ -102,20 +107,46 @@ class Centerlines(object):
             if file_suffix not in SurfaceFileFormats or file_name.lower().startswith('wall'):
                 continue
 
+            face_files.append(face_file)
+
+        return face_files
+
+    def get_face_center(self, face_file):
+        """ Read a face file and calculate its center.
+        """
+        file_suffix = face_file.suffix.lower()[1:]
+        polydata = read_surface(str(face_file.absolute()), file_suffix)
+        return get_polydata_centroid(polydata)
+
+    def get_inlet_outlet_centers(self, params):
+        """ Get the centers of the inlet and outlet surface geometry.
+
+            Surface inlet and outlet faces are identifed by their file name. 
+
+            Face files are read concurrently, the outlets are ordered as the 
+            files returned by get_boundary_face_files().
+        """
+        inlet_file_name = params.inlet_face_input_file
+        self.outlet_face_names = []
+        self.outlet_centers = []
+
+        face_files = self.get_boundary_face_files(params)
+        with ThreadPoolExecutor() as executor:
+            face_centers = list(executor.map(self.get_face_center, face_files))
+
+        for face_file, face_center in zip(face_files, face_centers):
+            file_name = face_file.name
+
             if (file_name == inlet_file_name):
-                inlet_path = str(face_file.absolute())
-                self.logger.info("Inlet file: %s" % inlet_path)
-                polydata = read_surface(inlet_path, file_suffix)
-                self.inlet_center = get_polydata_centroid(polydata)
+                self.logger.info("Inlet file: %s" % str(face_file.absolute()))
+                self.inlet_center = face_center
                 self.inlet_face_name = face_file.stem 
             else:
-                outlet_path = str(face_file.absolute())
                 self.outlet_face_names.append(face_file.stem)
                 self.logger.info("Outlet: %s" % file_name)
-                polydata = read_surface(outlet_path, file_suffix)
                 # Use extend because vmtk expects a list of floats.
-                self.outlet_centers.extend(get_polydata_centroid(polydata))
-        #__for face_file in surf_mesh_dir.iterdir()
+                self.outlet_centers.extend(face_center)
+        #__for face_file, face_center in zip(face_files, face_centers)
 
         if (not self.inlet_face_name):
             raise RuntimeError("No inlet face found in the boundary surface directory '%s'" % params.boundary_surfaces_dir)
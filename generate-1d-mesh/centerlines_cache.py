@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+"""
+This module is used to cache computed centerlines on disk.
+
+Computing centerlines with vmtk is the most expensive step of 1D mesh generation. The branch-split
+centerlines and outlet face names computed for a surface model are stored in a cache directory
+under a key computed from the contents of the surface model, the inlet and outlet face files and
+the vmtk parameters. If the same inputs are given again the centerlines are read from the cache.
+
+Each cache entry is a sub-directory of the cache directory named by its key. The least recently
+used entries are removed when the total size of the cache exceeds its maximum size.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+import logging
+from manage import get_logger_name
+
+from centerlines import Centerlines
+from utils import read_polydata, write_polydata
+
+class CenterlinesCache(object):
+    """ The CenterlinesCache class is used to store and retrieve computed centerlines.
+
+    Attributes:
+        cache_dir (str): The directory containing cache entries.
+        max_size (int): The maximum total size in bytes of the cache entries.
+    """
+
+    ## Change this if the cached data or how it is computed changes.
+    VERSION = "1"
+
+    class FileNames(object):
+        """ This class defines the names of the files stored in a cache entry.
+        """
+        CENTERLINES = "centerlines.vtp"
+        INLET_FACE_NAME = "inlet_face_name.dat"
+        OUTLET_FACE_NAMES = "outlet_face_names.dat"
+
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.logger = logging.getLogger(get_logger_name())
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get_key(self, params):
+        """ Get the key for the centerlines computed using the given parameters.
+
+        The key is a hash of the surface model file, the inlet and outlet face files
+        and the parameters used to execute vmtk.
+        """
+        sha = hashlib.sha256()
+        sha.update(("version %s\n" % self.VERSION).encode())
+        sha.update(("seed selector %s\n" % Centerlines.SEED_SELECTOR_NAME).encode())
+        sha.update(("append end points %d\n" % Centerlines.APPEND_END_POINTS).encode())
+        sha.update(("inlet %s\n" % params.inlet_face_input_file).encode())
+
+        self.hash_file(sha, "surface", params.surface_model)
+
+        face_files = Centerlines().get_boundary_face_files(params)
+        for face_file in sorted(face_files, key=lambda f: f.name):
+            self.hash_file(sha, face_file.name, str(face_file))
+
+        return sha.hexdigest()
+
+    @staticmethod
+    def hash_file(sha, name, file_name):
+        """ Add the name and contents of a file to a hash.
+        """
+        sha.update(("file %s %d\n" % (name, os.path.getsize(file_name))).encode())
+        with open(file_name, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                sha.update(chunk)
+
+    def load(self, key, centerlines):
+        """ Load cached centerlines into a Centerlines object.
+
+        Returns True if the centerlines were found in the cache.
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        file_names = self.FileNames
+        cl_file = os.path.join(entry_dir, file_names.CENTERLINES)
+
+        if not os.path.exists(cl_file):
+            return False
+
+        try:
+            centerlines.branch_geometry = read_polydata(cl_file)
+            with open(os.path.join(entry_dir, file_names.INLET_FACE_NAME)) as file:
+                centerlines.inlet_face_name = file.read().strip()
+            with open(os.path.join(entry_dir, file_names.OUTLET_FACE_NAMES)) as file:
+                centerlines.outlet_face_names = file.read().splitlines()
+        except Exception as e:
+            self.logger.warning("Unable to read cached centerlines from %s: %s" % (entry_dir, str(e)))
+            return False
+
+        # Mark the entry as recently used.
+        os.utime(entry_dir)
+        self.logger.info("Read centerlines from the cache: %s" % entry_dir)
+        return True
+
+    def store(self, key, centerlines):
+        """ Store computed centerlines in the cache.
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        file_names = self.FileNames
+
+        # Write to a temporary directory first so a partially written entry is never used.
+        tmp_dir = tempfile.mkdtemp(prefix="tmp-", dir=self.cache_dir)
+        try:
+            write_polydata(os.path.join(tmp_dir, file_names.CENTERLINES), centerlines.branch_geometry)
+            with open(os.path.join(tmp_dir, file_names.INLET_FACE_NAME), "w") as file:
+                file.write(centerlines.inlet_face_name + "\n")
+            with open(os.path.join(tmp_dir, file_names.OUTLET_FACE_NAMES), "w") as file:
+                for name in centerlines.outlet_face_names:
+                    file.write(name + "\n")
+            if os.path.exists(entry_dir):
+                shutil.rmtree(entry_dir)
+            os.rename(tmp_dir, entry_dir)
+        except Exception as e:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            self.logger.warning("Unable to write centerlines to the cache: %s" % str(e))
+            return
+
+        self.logger.info("Wrote centerlines to the cache: %s" % entry_dir)
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """ Remove the least recently used entries until the cache is within its maximum size.
+        """
+        entries = []
+        total_size = 0
+
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            if name.startswith("tmp-") or not os.path.isdir(entry_dir):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir))
+            entries.append((os.path.getmtime(entry_dir), size, name))
+            total_size += size
+
+        for mtime, size, name in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            if name == keep:
+                continue
+            self.logger.info("Remove centerlines cache entry: %s" % name)
+            shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+            total_size -= size
+
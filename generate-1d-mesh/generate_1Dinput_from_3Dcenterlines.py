@@ -15,6 +15,7 @@ import vtk.util.numpy_support as nps
 import os
 import numpy as np
 import re
+from topology import CenterlineTopology
 ############################################################################################################
 ## user inputs
 ModelName="SU201_2005"
@@ -331,30 +332,17 @@ num_group=max(group_list)+1
 print ("number of groups=",num_group)
 
 
-###path_elems[i] records the element(line) indices for centerline id=i
-path_elems=[]
-
-for i in range(0,num_path):
- path_elems.append([])
+###index the centerline cells by path and group
+topology=CenterlineTopology(centerline_list, group_list, tract_list, blank_list)
 
-for i in range(0,num_path):
-  for j in range(0,num_cells):
-    if i==centerline_list[j]: 
-     path_elems[i].append(j)
+###path_elems[i] records the element(line) indices for centerline id=i
+path_elems=topology.path_elems
 
 #for i in range(0,num_path):
 # print "centerline",i,"groups ids",path_elems[i]
 
 ###group_elems[i] records the element(line) indices for group id=i
-group_elems=[]
-for i in range(0,num_group):
-  group_elems.append([])
-
-
-for i in range(0,num_cells):
-#  print "cellid=",i
-#  print "groupid=",group_list[i]
-  group_elems[group_list[i]].append(i)
+group_elems=topology.group_elems
 
 #for i in range(0,num_group):
 # print "group",i, "element ids", group_elems[i]
@@ -484,25 +472,8 @@ for i in range(0,num_seg):
        temp_conn.append(pargroupid)
        print ("parent group id=",pargroupid)
   ## for each non-terminal group, at least there are 2 paths going through the child segments and sharing this group   
-       pathid1=centerline_list[group_elems[pargroupid][0]]
-       tractid1=tract_list[group_elems[pargroupid][0]]
-  ## find the corresponding element id in path_elems list and index+1 is the bifurcation index+2 is the child elem
-       childelemid1=path_elems[pathid1][tractid1+2]
-       childgroupid1=group_list[childelemid1]
-       temp_conn.append(childgroupid1)     
-  ## find second child or third/fourth child
-       for j in range(len(group_elems[pargroupid])-1,0,-1):
-         temppathid=centerline_list[group_elems[pargroupid][j]]
-         temptractid=tract_list[group_elems[pargroupid][j]]
-         tempelemid= path_elems[temppathid][temptractid+2]
-         tempgroupid=group_list[tempelemid]
-         repeat=0
-         for k in range (1,len(temp_conn)):
-            if tempgroupid == temp_conn[k]:
-              repeat=1 
-              break
-         if repeat==0:
-          temp_conn.append(tempgroupid)
+  ## find the child groups following the bifurcation, the child of the first element is listed first
+       temp_conn.extend(topology.child_groups(pargroupid))
        if len(temp_conn)>3:
          print ("there are more than 2 child segments for groupid=",pargroupid)
        connectivity.append(temp_conn)
@@ -601,11 +572,8 @@ for i in range(0,num_group):
 for i in range(0,num_seg):
    if group_terminal[seg_list[i]]!=1:
     pargroupid=seg_list[i]
-    pathid1=centerline_list[group_elems[pargroupid][0]]
-    tractid1=tract_list[group_elems[pargroupid][0]]
     #find the bifurcation group
-    bifelem=path_elems[pathid1][tractid1+1]
-    bifgroupid=group_list[bifelem]
+    bifgroupid=topology.bifurcation_group(pargroupid)
     #add the bifurcation group length to the parent group
     print( "biflength ",group_length[bifgroupid],"ratio to parent group length",group_length[bifgroupid]/group_length[pargroupid])
     group_length[pargroupid]=group_length[pargroupid]+group_length[bifgroupid]
@@ -638,11 +606,7 @@ for i in range(0,num_seg):
   if tempgroupid==0:
     seg_head.append(0)
   else:
-    tempelemid=group_elems[tempgroupid][0]
-    temptractid=tract_list[tempelemid]
-    temppathid=centerline_list[tempelemid]
-    tempelemid=path_elems[temppathid][temptractid-2]
-    seg_head.append(grouprearnodeid[group_list[tempelemid]])
+    seg_head.append(grouprearnodeid[topology.parent_group(tempgroupid)])
  
   seg_rear.append(grouprearnodeid[tempgroupid])
 
@@ -659,11 +623,8 @@ if ireorgseg==1:
       parsegid=seg_connectivity[i][0]
       pargroupid=seg_list[parsegid]
       num_child=len(seg_connectivity[i])-1
-      pathid1=centerline_list[group_elems[pargroupid][0]]
-      tractid1=tract_list[group_elems[pargroupid][0]]
       #find the bifurcation group
-      bifelem=path_elems[pathid1][tractid1+1]
-      bifgroupid=group_list[bifelem]
+      bifgroupid=topology.bifurcation_group(pargroupid)
       bifl=group_length[bifgroupid]
       dl=bifl/(num_child-2)
       childsegs=[]
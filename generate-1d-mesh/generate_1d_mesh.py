@@ -14,6 +14,8 @@ import os
 from manage import get_logger_name, init_logging, get_log_file_name
 from parameters import Parameters
 from centerlines import *
+from centerlines_cache import CenterlinesCache
+from profiling import get_profiler
 from mesh import *
 from utils import write_polydata, read_polydata
 
@@ -24,6 +26,7 @@ class Args(object):
     """
     PREFIX = "--"
     BOUNDARY_SURFACE_DIR = "boundary_surfaces_directory"
+    CACHE_DIR = "cache_dir"
     CENTERLINE_INPUT_FILE = "centerlines_input_file"
     CENTERLINE_OUTPUT_FILE = "centerlines_output_file"
     COMPUTE_CENTERLINES = "compute_centerlines"
@@ -34,17 +37,21 @@ class Args(object):
     MESH_OUTPUT_FILE = "mesh_output_file"
     MINIMUM_NUMBER_ELEMENTS = "min_num_elements"
     MODEL_NAME = "model_name"
+    NO_CACHE = "no_cache"
     NUM_TIME_STEPS = "num_time_steps"
     OUTFLOW_BC_INPUT_FILE = "outflow_bc_input_file"
     OUTFLOW_BC_TYPE = "outflow_bc_type"
     OUTLET_FACE_NAMES_INPUT_FILE = "outlet_face_names_input_file"
     OUTPUT_DIRECTORY = "output_directory"
+    PROFILE = "profile"
     SOLVER_OUTPUT_FILE = "solver_output_file"
     SAVE_DATA_FREQUENCY = "save_data_frequency"
     SURFACE_MODEL = "surface_model"
     TIME_STEP = "time_step"
     UNIFORM_BC = "uniform_bc"
     UNITS = "units"
+    UPDATE_BCS = "update_bcs"
+    WALL_PROPERTIES_AVERAGE = "wall_properties_average"
     WALL_PROPERTIES_INPUT_FILE = "wall_properties_input_file"
     WALL_PROPERTIES_OUTPUT_FILE = "wall_properties_output_file"
     WRITE_MESH_FILE = "write_mesh_file"
@@ -62,6 +69,9 @@ def parse_args():
     parser.add_argument(cmd(Args.BOUNDARY_SURFACE_DIR), 
       help="Directory containing the boundary (inlet/outlet) surface files")
 
+    parser.add_argument(cmd(Args.CACHE_DIR), 
+      help="The directory used to cache computed centerlines.")
+
     parser.add_argument(cmd(Args.CENTERLINE_INPUT_FILE), 
       help="The name of the file to read centerline geometry from.")
 
@@ -92,6 +102,9 @@ def parse_args():
     parser.add_argument(cmd(Args.MODEL_NAME), required=True,
       help="The name of the model.")
 
+    parser.add_argument(cmd(Args.NO_CACHE), const=True, nargs='?', default=False, 
+      help="If given or value is set to 1 then don't use cached centerlines.")
+
     parser.add_argument(cmd(Args.NUM_TIME_STEPS),
       help="The number of simulation time steps.")
 
@@ -104,11 +117,14 @@ def parse_args():
     parser.add_argument(cmd(Args.OUTPUT_DIRECTORY), required=True, 
       help="The directory where output files are written.")
 
+    parser.add_argument(cmd(Args.PROFILE), const=True, nargs='?', default=False, 
+      help="If given or value is set to 1 then write a profile of the time and memory used by each stage.")
+
     parser.add_argument(cmd(Args.SAVE_DATA_FREQUENCY), 
       help="The frequency to save data as the number of time steps between saves.")
 
     parser.add_argument(cmd(Args.SOLVER_OUTPUT_FILE), 
-      help="The name of the file to write the solver input to.")
+      help="The name of the file to write the solver input to. The file is gzip compressed if the name ends with .gz.")
 
     parser.add_argument(cmd(Args.SURFACE_MODEL), 
       help="The surface model used to compute centerlines.")
@@ -119,12 +135,18 @@ def parse_args():
     parser.add_argument(cmd(Args.UNIFORM_BC),
       help = "If set to (true,1,on) then read BC files")
 
+    parser.add_argument(cmd(Args.UPDATE_BCS), const=True, nargs='?', default=False, 
+      help="If given or value is set to 1 then only rewrite the boundary conditions in the solver file using the mesh state saved by a previous run.")
+
     parser.add_argument(cmd(Args.UNITS),
       help = "The units used to scale geometry. (cm or mm)")
 
     parser.add_argument(cmd(Args.OUTLET_FACE_NAMES_INPUT_FILE),
       help = "The file containing outlet face names.")
 
+    parser.add_argument(cmd(Args.WALL_PROPERTIES_AVERAGE), 
+      help="The method used to average wall properties over a vessel group (MEAN, MEDIAN, AREA).")
+
     parser.add_argument(cmd(Args.WALL_PROPERTIES_INPUT_FILE), 
       help = "The name of the file read surface wall material properties from.")
 
@@ -163,6 +185,10 @@ def set_parameters(**kwargs):
             logger.error("The surface directory '%s' was not found." % params.boundary_surfaces_dir)
             return None
 
+    if kwargs.get(Args.CACHE_DIR): 
+        params.centerlines_cache_dir = kwargs.get(Args.CACHE_DIR)
+        logger.info("Centerlines cache directory: %s" % params.centerlines_cache_dir)
+
     if kwargs.get(Args.CENTERLINE_INPUT_FILE):
         params.centerlines_input_file = kwargs.get(Args.CENTERLINE_INPUT_FILE)
         logger.info("Centerlines input file: %s" % params.centerlines_input_file)
@@ -222,12 +248,18 @@ def set_parameters(**kwargs):
         logger.info("Mesh output file: %s" % params.mesh_output_file)
 
     if kwargs.get(Args.MINIMUM_NUMBER_ELEMENTS):
-        params.min_num_elems = kwargs.get(Args.MINIMUM_NUMBER_ELEMENTS)
+        params.min_num_elems = int(kwargs.get(Args.MINIMUM_NUMBER_ELEMENTS))
     logger.info("Minimum number of finite elements per segment: %d" % params.min_num_elems)
 
     params.model_name = kwargs.get(Args.MODEL_NAME)
     logger.info("Model name: %s" % params.model_name)
 
+    # The 'use_centerlines_cache' parameter is set to False if the NO_CACHE 
+    # argument is given with no value. Otherwise it is set from the value given.
+    params.use_centerlines_cache = not ((kwargs.get(Args.NO_CACHE) == True) or \
+      (kwargs.get(Args.NO_CACHE) in true_values))
+    logger.info("Use centerlines cache: %s" % params.use_centerlines_cache)
+
     if kwargs.get(Args.NUM_TIME_STEPS):
         params.num_time_steps = int(kwargs.get(Args.NUM_TIME_STEPS))
     logger.info("Number of time steps: %d" % params.num_time_steps)
@@ -254,6 +286,12 @@ def set_parameters(**kwargs):
             return None
         logger.info("Outlet face names file: '%s'." % params.outlet_face_names_file)
 
+    # The 'profile' parameter is set to True if the PROFILE 
+    # argument is given with no value. Otherwise it is set to the value given.
+    params.profile = (kwargs.get(Args.PROFILE) == True) or \
+      (kwargs.get(Args.PROFILE) in true_values)
+    logger.info("Profile: %s" % params.profile)
+
     if kwargs.get(Args.SAVE_DATA_FREQUENCY):
         params.save_data_freq = int(kwargs.get(Args.SAVE_DATA_FREQUENCY))
     logger.info("Save data frequency: %d" % params.save_data_freq)
@@ -286,6 +324,20 @@ def set_parameters(**kwargs):
             return None
     logger.info("Units: %s" % params.units)
 
+    # The 'update_bcs' parameter is set to True if the UPDATE_BCS
+    # argument is given with no value. Otherwise it is set to the value given.
+    params.update_bcs = (kwargs.get(Args.UPDATE_BCS) == True) or \
+      (kwargs.get(Args.UPDATE_BCS) in true_values)
+    logger.info("Update BCs: %s" % params.update_bcs)
+
+    if kwargs.get(Args.WALL_PROPERTIES_AVERAGE):
+        average = kwargs.get(Args.WALL_PROPERTIES_AVERAGE).lower()
+        if not average in params.WALL_PROPERTIES_AVERAGE_TYPES:
+            logger.error("Unknown wall properties average '%s'." % average) 
+            return None
+        params.wall_properties_average = average
+        logger.info("Wall properties average: %s" % params.wall_properties_average)
+
     if kwargs.get(Args.WALL_PROPERTIES_INPUT_FILE):
         params.wall_properties_input_file = kwargs.get(Args.WALL_PROPERTIES_INPUT_FILE)
         logger.info("Wall properties input file: %s" % params.wall_properties_input_file)
@@ -333,7 +385,11 @@ def set_parameters(**kwargs):
         logger.error("If an outflow boundary condition type is given then an input data file for that type must also be given.")
         return None
 
-    if params.write_solver_file: 
+    if params.update_bcs and not params.solver_output_file: 
+        logger.error("A solver output file must be given when updating BCs.")
+        return None
+
+    if params.write_solver_file and not params.update_bcs: 
         if not params.outlet_face_names_file: 
             logger.error("No outlet face names file was given.")
             return None
@@ -356,7 +412,10 @@ def read_centerlines(params):
     The centerlines must have had 
     """
     centerlines = Centerlines()
-    centerlines.read(params, params.centerlines_input_file)
+    with get_profiler().stage("read_centerlines") as stage:
+        centerlines.read(params, params.centerlines_input_file)
+        stage.counts["points"] = centerlines.branch_geometry.GetNumberOfPoints()
+        stage.counts["cells"] = centerlines.branch_geometry.GetNumberOfCells()
 
     logger.info("Read centerlines from the file: %s", params.centerlines_input_file) 
     logger.info("   Number of points: %d ", centerlines.branch_geometry.GetNumberOfPoints())
@@ -382,11 +441,34 @@ def compute_centerlines(params):
     # Create Centerlines object that encapsulats centerline calculations. 
     centerlines = Centerlines()
 
+    profiler = get_profiler()
+
+    # Read centerlines computed for the same inputs from the cache.
+    cache = None
+    if params.use_centerlines_cache:
+        with profiler.stage("centerlines_cache_lookup") as stage:
+            cache = CenterlinesCache(params.centerlines_cache_dir, params.centerlines_cache_max_size)
+            cache_key = cache.get_key(params)
+            cache_hit = cache.load(cache_key, centerlines)
+            stage.counts["hit"] = int(cache_hit)
+        if cache_hit:
+            centerlines.write_outlet_face_names(params)
+            write_polydata(params.centerlines_output_file, centerlines.branch_geometry)
+            return centerlines
+
     # Extract centerlines.
-    centerlines.extract_center_lines(params)
+    with profiler.stage("extract_centerlines") as stage:
+        centerlines.extract_center_lines(params)
+        stage.counts["outlets"] = len(centerlines.outlet_face_names)
 
     # Split and group centerlines along branches. 
-    centerlines.extract_branches(params)
+    with profiler.stage("extract_branches") as stage:
+        centerlines.extract_branches(params)
+        if centerlines.branch_geometry:
+            stage.counts["cells"] = centerlines.branch_geometry.GetNumberOfCells()
+
+    if cache and centerlines.branch_geometry:
+        cache.store(cache_key, centerlines)
 
     # Write the centerlines branches to a file.
     if centerlines.branch_geometry:
@@ -394,17 +476,22 @@ def compute_centerlines(params):
 
     return centerlines
 
-def run(**kwargs):
-    """ Execute the 1D mesh generation using passed parameters.
-    """
-    ## Set input parameters.
-    params = set_parameters(**kwargs)
-    if not params:
-        logger.error("Error in parameters.")
-        return False
+def generate_mesh(params):
+    """ Compute or read centerlines and generate a 1D mesh from them.
 
+    Returns the Mesh object or None if no centerlines were calculated or read in. If only the boundary
+    conditions are updated then the mesh state saved by a previous run is used instead of centerlines.
+    """
     centerlines = None 
 
+    ## Rewrite the boundary conditions using the saved mesh state.
+    if params.update_bcs:
+        mesh = Mesh()
+        if not mesh.update_bcs(params):
+            logger.error("Unable to update the boundary conditions.")
+            return None
+        return mesh
+
     ## Extract surface centerlines.
     if params.compute_centerlines:
         centerlines = compute_centerlines(params)
@@ -415,11 +502,41 @@ def run(**kwargs):
 
     if not centerlines:
         logger.error("No centerlines calculated or read in.")
-        sys.exit(1)
+        return None
 
     ## Generate a 1D mesh.
     mesh = Mesh()
     mesh.generate(params, centerlines)
+    return mesh
+
+def write_profile(params):
+    """ Write the profile of the 1D mesh generation stages to the log and to a JSON file.
+    """
+    profiler = get_profiler()
+    profile_file = os.path.join(params.output_directory, params.PROFILE_FILE_NAME)
+    profiler.log_summary(logger)
+    profiler.write_report(profile_file)
+    logger.info("Profile written to: %s" % profile_file)
+
+def run(**kwargs):
+    """ Execute the 1D mesh generation using passed parameters.
+    """
+    ## Set input parameters.
+    params = set_parameters(**kwargs)
+    if not params:
+        logger.error("Error in parameters.")
+        return False
+
+    if params.profile:
+        get_profiler().enable()
+
+    mesh = generate_mesh(params)
+    if not mesh:
+        sys.exit(1)
+
+    if params.profile:
+        write_profile(params)
+
     logger.info("Generated %d segments, %d nodes and %d elements." % (mesh.num_seg, len(mesh.nodes), mesh.num_elements))
     result = "Mesh: num_nodes=%d num_elements=%d num_segs=%d\n" % (len(mesh.nodes), mesh.num_elements, mesh.num_seg)
     return result
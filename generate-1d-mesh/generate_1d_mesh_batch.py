@@ -0,0 +1,456 @@
+#!/usr/bin/env python
+
+"""
+This module is used to generate 1D meshes for many models and parameter settings in a single run.
+
+The cases to run are read from a manifest file (.json or .csv). Each case is a set of generate-1d-mesh
+arguments using the same names as the generate_1d_mesh.py command-line arguments. Cases are run in
+parallel using a pool of processes. Each case is written to its own sub-directory of the batch output
+directory together with its log file.
+
+Sweeps over the mesh-only parameters 'element_size' and 'min_num_elements' are given as a list of values
+(a JSON list or ';'-separated values in a CSV file). A case is created for each combination of values.
+Centerlines are computed once for each surface model and reused by all of the cases for that model.
+
+A JSON manifest is either a list of cases or an object with 'cases' and optional 'defaults' entries
+
+    {
+      "defaults": { "units": "mm", "write_solver_file": true, "solver_output_file": "solver.in" },
+      "cases": [
+        { "model_name": "SU201_2005", "centerlines_input_file": "SU201_2005_RPA1_cl.vtp",
+          "outlet_face_names_input_file": "outlets.dat", "element_size": [0.1, 0.05] }
+      ]
+    }
+
+A CSV manifest has a header row of argument names and a row for each case. Relative file names in
+a manifest are relative to the directory containing the manifest.
+
+A summary of the time and number of nodes, segments and elements for each case is written to the
+log and to the 'batch_summary.csv' file in the batch output directory.
+
+If a case sets 'profile' then each case is run in a new process so that the peak memory in its 
+profile is not affected by the cases run before it in the same worker process.
+"""
+import argparse
+import csv
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from manage import get_logger_name, init_logging
+from parameters import Parameters
+from generate_1d_mesh import Args as MeshArgs
+from generate_1d_mesh import set_parameters, compute_centerlines, generate_mesh, write_profile
+from profiling import get_profiler
+
+logger = logging.getLogger(get_logger_name())
+
+class Args(object):
+    """ This class defines the command line arguments to the generate-1d-mesh batch script.
+    """
+    PREFIX = "--"
+    MANIFEST_FILE = "manifest_file"
+    NUM_WORKERS = "num_workers"
+    OUTPUT_DIRECTORY = "output_directory"
+
+class ManifestFields(object):
+    """ This class defines manifest case fields that are not generate-1d-mesh arguments.
+    """
+    CASE_NAME = "case_name"
+
+## Mesh-only parameters that can be swept over.
+SWEEP_PARAMETERS = [MeshArgs.ELEMENT_SIZE, MeshArgs.MINIMUM_NUMBER_ELEMENTS]
+
+## Arguments that are input file or directory names.
+INPUT_FILE_PARAMETERS = [MeshArgs.BOUNDARY_SURFACE_DIR, MeshArgs.CENTERLINE_INPUT_FILE, MeshArgs.INFLOW_INPUT_FILE,
+  MeshArgs.OUTFLOW_BC_INPUT_FILE, MeshArgs.OUTLET_FACE_NAMES_INPUT_FILE, MeshArgs.SURFACE_MODEL,
+  MeshArgs.WALL_PROPERTIES_INPUT_FILE]
+
+## Arguments that are output file names given with a path.
+OUTPUT_FILE_PARAMETERS = [MeshArgs.CENTERLINE_OUTPUT_FILE, MeshArgs.WALL_PROPERTIES_OUTPUT_FILE]
+
+SUMMARY_FILE_NAME = "batch_summary.csv"
+SUMMARY_FIELDS = ["case_name", "status", "centerlines", "centerlines_time", "time", "num_nodes", "num_segs",
+  "num_elements", "error"]
+
+def cmd(name):
+    """ Create an argparse command argument.
+    """
+    return Args.PREFIX + name.replace("_", "-")
+
+def parse_args():
+    """ Parse command-line arguments."""
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(cmd(Args.MANIFEST_FILE), required=True,
+      help="The manifest file (.json or .csv) listing the cases to run.")
+
+    parser.add_argument(cmd(Args.NUM_WORKERS), type=int, default=os.cpu_count(),
+      help="The number of processes used to run cases.")
+
+    parser.add_argument(cmd(Args.OUTPUT_DIRECTORY), required=True,
+      help="The directory where the output of each case is written.")
+
+    return parser.parse_args()
+
+def get_mesh_args():
+    """ Get the names of the generate-1d-mesh arguments.
+    """
+    return [v for k,v in MeshArgs.__dict__.items() if not k.startswith('__') and k != 'PREFIX']
+
+def normalize_case(case):
+    """ Convert manifest case field names to generate-1d-mesh argument names.
+    """
+    valid_names = get_mesh_args() + [ManifestFields.CASE_NAME]
+    norm_case = {}
+
+    for name, value in case.items():
+        name = name.strip().lstrip('-').replace("-", "_")
+        if name not in valid_names:
+            raise RuntimeError("Unknown manifest field '%s'." % name)
+        if value is None or value == "":
+            continue
+        norm_case[name] = value
+
+    return norm_case
+
+def read_manifest(file_name):
+    """ Read the cases from a manifest file.
+    """
+    file_ext = file_name.split(".")[-1].lower()
+    defaults = {}
+
+    if file_ext == 'json':
+        with open(file_name) as file:
+            manifest = json.load(file)
+        if isinstance(manifest, dict):
+            defaults = manifest.get("defaults", {})
+            cases = manifest.get("cases", [])
+        else:
+            cases = manifest
+
+    elif file_ext == 'csv':
+        cases = []
+        with open(file_name, newline='') as file:
+            for row in csv.DictReader(file):
+                case = {}
+                for name, value in row.items():
+                    value = value.strip() if value else value
+                    if value and ";" in value:
+                        value = [v.strip() for v in value.split(";")]
+                    case[name] = value
+                cases.append(case)
+    else:
+        raise RuntimeError('Unknown manifest file type %s' % file_ext)
+
+    defaults = normalize_case(defaults)
+    manifest_dir = os.path.dirname(os.path.abspath(file_name))
+    case_list = []
+
+    for case in cases:
+        full_case = dict(defaults)
+        full_case.update(normalize_case(case))
+        if not full_case.get(MeshArgs.MODEL_NAME):
+            raise RuntimeError("A case in the manifest has no '%s' field." % MeshArgs.MODEL_NAME)
+
+        for name in INPUT_FILE_PARAMETERS:
+            if full_case.get(name):
+                full_case[name] = os.path.join(manifest_dir, full_case[name])
+
+        case_list.extend(expand_sweeps(full_case))
+
+    ## Make sure case names are unique.
+    names = {}
+    for case in case_list:
+        name = case[ManifestFields.CASE_NAME]
+        if name in names:
+            names[name] += 1
+            case[ManifestFields.CASE_NAME] = "%s_%d" % (name, names[name])
+        else:
+            names[name] = 0
+
+    return case_list
+
+def expand_sweeps(case):
+    """ Create a case for each combination of swept parameter values.
+    """
+    base_name = case.get(ManifestFields.CASE_NAME, case[MeshArgs.MODEL_NAME])
+    swept = [name for name in SWEEP_PARAMETERS if isinstance(case.get(name), list)]
+
+    if not swept:
+        new_case = dict(case)
+        new_case[ManifestFields.CASE_NAME] = base_name
+        return [new_case]
+
+    cases = []
+    for values in itertools.product(*[case[name] for name in swept]):
+        new_case = dict(case)
+        suffix = ""
+        for name, value in zip(swept, values):
+            new_case[name] = value
+            suffix += "_%s%s" % (name, value)
+        new_case[ManifestFields.CASE_NAME] = base_name + suffix
+        cases.append(new_case)
+
+    return cases
+
+def is_set(case, name):
+    """ Check if a flag argument is set for a case, as set_parameters() sets flag parameters.
+
+    A flag is set if it is True or one of the strings "on", "true" or "1", so "false" or "0"
+    read from a CSV manifest is not set.
+    """
+    value = case.get(name)
+    return (value == True) or (value in ["on", "true", "1"])
+
+def get_centerlines_key(case):
+    """ Get the key identifying the inputs used to compute the centerlines for a case.
+    """
+    if not is_set(case, MeshArgs.COMPUTE_CENTERLINES):
+        return None
+    return (case.get(MeshArgs.SURFACE_MODEL), case.get(MeshArgs.BOUNDARY_SURFACE_DIR),
+      case.get(MeshArgs.INLET_FACE_INPUT_FILE))
+
+def run_centerlines_job(job):
+    """ Compute the centerlines shared by a set of cases.
+
+    This is executed in a worker process.
+    """
+    output_dir = job[MeshArgs.OUTPUT_DIRECTORY]
+    os.makedirs(output_dir, exist_ok=True)
+    init_logging(output_dir, console=False)
+    result = { "status": "ok", "time": 0.0, "error": "" }
+    start_time = time.time()
+
+    try:
+        params = set_parameters(**job)
+        if not params:
+            raise RuntimeError("Error in centerlines parameters.")
+        centerlines = compute_centerlines(params)
+        if not centerlines or not centerlines.branch_geometry:
+            raise RuntimeError("No centerlines calculated.")
+    except (Exception, SystemExit) as e:
+        logger.error(str(e))
+        result["status"] = "error"
+        result["error"] = str(e)
+
+    result["time"] = time.time() - start_time
+    return result
+
+def run_case(case):
+    """ Generate a 1D mesh for a case.
+
+    This is executed in a worker process.
+    """
+    output_dir = case[MeshArgs.OUTPUT_DIRECTORY]
+    os.makedirs(output_dir, exist_ok=True)
+    init_logging(output_dir, console=False)
+    result = { "status": "ok", "time": 0.0, "error": "", "num_nodes": None, "num_segs": None,
+      "num_elements": None }
+    start_time = time.time()
+
+    kwargs = dict(case)
+    kwargs.pop(ManifestFields.CASE_NAME, None)
+
+    try:
+        params = set_parameters(**kwargs)
+        if not params:
+            raise RuntimeError("Error in parameters.")
+        if params.profile:
+            get_profiler().enable()
+        mesh = generate_mesh(params)
+        if not mesh:
+            raise RuntimeError("No centerlines calculated or read in.")
+        if params.profile:
+            write_profile(params)
+        result["num_nodes"] = len(mesh.nodes)
+        result["num_segs"] = mesh.num_seg
+        result["num_elements"] = mesh.num_elements
+    except (Exception, SystemExit) as e:
+        logger.error(str(e))
+        result["status"] = "error"
+        result["error"] = str(e)
+
+    result["time"] = time.time() - start_time
+    return result
+
+def set_case_outputs(cases, output_dir):
+    """ Set the output directory and output files for each case.
+    """
+    for case in cases:
+        case_dir = os.path.join(output_dir, case[ManifestFields.CASE_NAME])
+        case[MeshArgs.OUTPUT_DIRECTORY] = case_dir
+        for name in OUTPUT_FILE_PARAMETERS:
+            if case.get(name) and not os.path.isabs(case[name]):
+                case[name] = os.path.join(case_dir, case[name])
+
+def create_centerlines_jobs(cases, output_dir):
+    """ Create a job to compute centerlines for each unique set of centerline inputs.
+
+    Cases computing centerlines are modified to read the centerlines computed by their job.
+    """
+    jobs = {}
+    outlets_file_name = Parameters().CENTERLINES_OUTLET_FILE_NAME
+
+    for case in cases:
+        key = get_centerlines_key(case)
+        if key is None:
+            continue
+
+        if key not in jobs:
+            job_dir = os.path.join(output_dir, "centerlines", "%s_%d" % (case[MeshArgs.MODEL_NAME], len(jobs)))
+            cl_file = case.get(MeshArgs.CENTERLINE_OUTPUT_FILE, os.path.join(job_dir, "centerlines.vtp"))
+            jobs[key] = {
+              MeshArgs.MODEL_NAME: case[MeshArgs.MODEL_NAME],
+              MeshArgs.OUTPUT_DIRECTORY: job_dir,
+              MeshArgs.COMPUTE_CENTERLINES: True,
+              MeshArgs.SURFACE_MODEL: case.get(MeshArgs.SURFACE_MODEL),
+              MeshArgs.BOUNDARY_SURFACE_DIR: case.get(MeshArgs.BOUNDARY_SURFACE_DIR),
+              MeshArgs.INLET_FACE_INPUT_FILE: case.get(MeshArgs.INLET_FACE_INPUT_FILE),
+              MeshArgs.CENTERLINE_OUTPUT_FILE: cl_file,
+              MeshArgs.CACHE_DIR: case.get(MeshArgs.CACHE_DIR),
+              MeshArgs.NO_CACHE: case.get(MeshArgs.NO_CACHE)
+            }
+
+        job = jobs[key]
+        case[MeshArgs.COMPUTE_CENTERLINES] = False
+        case.pop(MeshArgs.CENTERLINE_OUTPUT_FILE, None)
+        case[MeshArgs.CENTERLINE_INPUT_FILE] = job[MeshArgs.CENTERLINE_OUTPUT_FILE]
+        if not case.get(MeshArgs.OUTLET_FACE_NAMES_INPUT_FILE):
+            case[MeshArgs.OUTLET_FACE_NAMES_INPUT_FILE] = os.path.join(job[MeshArgs.OUTPUT_DIRECTORY], outlets_file_name)
+        case["_centerlines_key"] = key
+
+    return jobs
+
+def write_summary(results, output_dir):
+    """ Write a summary of the results for all cases to the log and to a CSV file.
+    """
+    file_name = os.path.join(output_dir, SUMMARY_FILE_NAME)
+    with open(file_name, "w", newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        for result in results:
+            writer.writerow(result)
+
+    def fmt(value, spec):
+        return "" if value is None else spec % value
+
+    header = "%-32s %-6s %-9s %10s %10s %9s %9s %12s" % ("case", "status", "cl", "cl time(s)", "time(s)",
+      "nodes", "segments", "elements")
+    logger.info("Batch summary:")
+    logger.info(header)
+    logger.info("-" * len(header))
+    for result in results:
+        logger.info("%-32s %-6s %-9s %10s %10s %9s %9s %12s" % (result["case_name"], result["status"],
+          result["centerlines"], fmt(result["centerlines_time"], "%.2f"), fmt(result["time"], "%.2f"),
+          fmt(result["num_nodes"], "%d"), fmt(result["num_segs"], "%d"), fmt(result["num_elements"], "%d")))
+        if result["error"]:
+            logger.info("    error: %s" % result["error"])
+    logger.info("Summary written to: %s" % file_name)
+
+class FreshProcessPool(object):
+    """ This class runs each job in a new worker process using a multiprocessing pool.
+
+    It provides the submit() and map() methods of a ProcessPoolExecutor, which only supports
+    max_tasks_per_child from Python 3.11.
+    """
+    def __init__(self, num_workers):
+        self.pool = multiprocessing.Pool(num_workers, maxtasksperchild=1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.pool.close()
+        self.pool.join()
+
+    def submit(self, function, *args):
+        result = self.pool.apply_async(function, args)
+        # Provide the Future.result() method.
+        result.result = result.get
+        return result
+
+    def map(self, function, items):
+        return self.pool.map(function, items, chunksize=1)
+
+def create_executor(num_workers, fresh_processes=False):
+    """ Create the pool of worker processes used to run centerlines jobs and cases.
+
+    If fresh_processes is True then each job is run in a new process.
+    """
+    if not fresh_processes:
+        return ProcessPoolExecutor(max_workers=num_workers)
+    if sys.version_info >= (3, 11):
+        return ProcessPoolExecutor(max_workers=num_workers, max_tasks_per_child=1)
+    return FreshProcessPool(num_workers)
+
+def run(manifest_file, output_directory, num_workers=None):
+    """ Run all of the cases listed in a manifest file.
+
+    Returns the list of case results.
+    """
+    start_time = time.time()
+    cases = read_manifest(manifest_file)
+    logger.info("Read %d cases from the manifest file: %s" % (len(cases), manifest_file))
+
+    set_case_outputs(cases, output_directory)
+    cl_jobs = create_centerlines_jobs(cases, output_directory)
+    logger.info("Number of centerline calculations: %d" % len(cl_jobs))
+    logger.info("Number of workers: %s" % num_workers)
+
+    # Profiled cases are run in new processes so that their peak memory is for the case only.
+    fresh_processes = any(is_set(case, MeshArgs.PROFILE) for case in cases)
+    if fresh_processes:
+        logger.info("Cases are profiled, each case is run in a new process.")
+
+    with create_executor(num_workers, fresh_processes) as executor:
+
+        ## Compute centerlines shared by cases.
+        cl_keys = list(cl_jobs.keys())
+        cl_results = dict(zip(cl_keys, executor.map(run_centerlines_job, [cl_jobs[key] for key in cl_keys])))
+        for key in cl_keys:
+            logger.info("Centerlines %s: %s (%.2f s)" % (cl_jobs[key][MeshArgs.CENTERLINE_OUTPUT_FILE],
+              cl_results[key]["status"], cl_results[key]["time"]))
+
+        ## Generate meshes for cases whose centerlines are available.
+        futures = []
+        for case in cases:
+            key = case.get("_centerlines_key")
+            if key is not None and cl_results[key]["status"] != "ok":
+                futures.append(None)
+            else:
+                mesh_case = {k:v for k,v in case.items() if k != "_centerlines_key"}
+                futures.append(executor.submit(run_case, mesh_case))
+
+        results = []
+        for case, future in zip(cases, futures):
+            key = case.get("_centerlines_key")
+            if future is None:
+                result = { "status": "error", "time": None, "error": "Centerlines calculation failed: " +
+                  cl_results[key]["error"], "num_nodes": None, "num_segs": None, "num_elements": None }
+            else:
+                result = future.result()
+            result["case_name"] = case[ManifestFields.CASE_NAME]
+            result["centerlines"] = "computed" if key is not None else "read"
+            result["centerlines_time"] = cl_results[key]["time"] if key is not None else None
+            logger.info("Case %s: %s" % (result["case_name"], result["status"]))
+            results.append(result)
+
+    write_summary(results, output_directory)
+    logger.info("Total time: %.2f s" % (time.time() - start_time))
+    return results
+
+if __name__ == '__main__':
+    args = parse_args()
+    if not os.path.exists(args.output_directory):
+        os.makedirs(args.output_directory)
+    init_logging(args.output_directory)
+    results = run(args.manifest_file, args.output_directory, args.num_workers)
+    if any(result["status"] != "ok" for result in results):
+        sys.exit(1)
+
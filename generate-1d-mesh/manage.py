@@ -9,14 +9,22 @@ def get_logger_name():
 def get_log_file_name():
     return 'generate-1d-mesh.log'
 
-def init_logging(outputDir="./"):
+def init_logging(outputDir="./", console=True):
     import logging
     logger = logging.getLogger(get_logger_name())
     logger.setLevel(logging.INFO)
-    console_handler = logging.StreamHandler()
     formatter = logging.Formatter('[%(name)s] %(levelname)s - %(message)s')
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+
+    # Remove handlers from a previous call, e.g. when running several 
+    # meshing cases in the same process.
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+        logger.addHandler(console_handler)
 
     logFile = os.path.join(outputDir, get_log_file_name())
     file_handler = logging.FileHandler(logFile, mode="w")
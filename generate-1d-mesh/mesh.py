@@ -10,11 +10,19 @@ In Cell Data, lines are listed from 0 to m. For each line, the first number is t
 followed by 1st point to the last point.
 
 """
+import os
 from os import path 
+import gzip
+import hashlib
+import json
+import io
 import logging
+import math
 import re
 from manage import get_logger_name
-from parameters import OutflowBoundaryConditionType 
+from parameters import OutflowBoundaryConditionType, WallPropertiesAverageType
+from topology import CenterlineTopology
+from profiling import get_profiler
 from collections import OrderedDict 
 
 import numpy as np
@@ -27,6 +35,7 @@ except ImportError:
 import vtk.util.numpy_support as nps
 from vtk import vtkIdList
 from vtk import vtkPoints, vtkLine, vtkCellArray, vtkPolyData, vtkXMLPolyDataWriter
+from vtk import vtkStringArray, vtkTriangleFilter, vtkProbeFilter
 from utils import SurfaceFileFormats, read_polydata, write_polydata
 from collections import namedtuple
 
@@ -38,6 +47,7 @@ class Mesh(object):
 
     Attributes:
         path_elems (list[int]): Records the element indices for centerline ids.
+        topology (CenterlineTopology): Indexes centerline cells by path and group.
     """
 
     class OutputFileNames(object):
@@ -61,15 +71,22 @@ class Mesh(object):
         MAX_INSCRIBED_RADIUS = "MaximumInscribedSphereRadius" 
 
     class Open(object):
-        """ This class wraps the 'open' class and adds a method to automatically 
-            write newlines. 
+        """ This class wraps the 'open' class and adds methods to automatically 
+            write newlines and to write blocks of lines. 
+
+            Output is buffered in large chunks. If the file name ends with '.gz' 
+            then the file is compressed using gzip.
         """ 
-        def __init__(self, *args, **kwds):
-            self.args = args
-            self.kwds = kwds
-            self.file_obj = open(*self.args, **self.kwds)
+        BUFFER_SIZE = 4*1024*1024
+
+        def __init__(self, file_name, mode="w"):
+            if file_name.endswith(".gz"):
+                gzip_file = gzip.open(file_name, mode.replace("t", "") + "b")
+                buffered_file = io.BufferedWriter(gzip_file, buffer_size=self.BUFFER_SIZE)
+                self.file_obj = io.TextIOWrapper(buffered_file)
+            else:
+                self.file_obj = open(file_name, mode, buffering=self.BUFFER_SIZE)
         def __enter__(self):
-            self.file_obj = open(*self.args, **self.kwds)
             return self
         def __exit__(self, *args):
             self.file_obj.close()
@@ -77,14 +94,36 @@ class Mesh(object):
             self.file_obj.close()
         def writeln(self, string):
             self.file_obj.write(string + '\n')
+        def writelns(self, lines):
+            if lines:
+                self.file_obj.write('\n'.join(lines) + '\n')
         def write(self, string):
             self.file_obj.write(string)
 
+    class WallPropertyFields(object):
+        """ This class defines the wall properties surface point data field names.
+        """
+        GROUP_IDS = "GroupIds"
+        THICKNESS = "thickness"
+        YOUNGS_MODULUS = "Young_Mod"
+
+    ## The name of the field data array storing the key of the inputs used to create 
+    #  the clipped wall properties surface. Change the version if the clipping changes.
+    BRANCH_CLIPPER_KEY_NAME = "BranchClipperKey"
+    BRANCH_CLIPPER_KEY_VERSION = "2"
+
+    ## The version of the mesh state file format.
+    STATE_VERSION = 1
+
+    ## The number of solver file cards formatted and written at a time.
+    SOLVER_FILE_CHUNK_SIZE = 10000
+
     def __init__(self):
         self.centerlines = None
         self.logger = logging.getLogger(get_logger_name())
         self.num_cells = None
         self.num_paths = None
+        self.topology = None
         self.path_elems = None
         self.group_elems = None
         self.materials = None
@@ -105,6 +144,8 @@ class Mesh(object):
         self.bc_list = None
         self.bc_map = None
         self.inflow_data = None
+        self.centerline_list = None
+        self.group_list = None
 
         self.outlet_face_names = None
         self.outlet_face_names_index = None
@@ -145,33 +186,86 @@ class Mesh(object):
         self.logger.info("Number of paths: %d" % self.num_paths) 
         self.logger.info("Number of groups: %d" % self.num_groups) 
 
-        self.set_path_elements(centerline_list)
-        self.set_group_elements(group_list)
+        profiler = get_profiler()
+
+        with profiler.stage("set_topology", cells=self.num_cells, paths=self.num_paths, groups=self.num_groups):
+            self.set_topology(centerline_list, group_list, tract_list, blank_list)
 
         if not params.uniform_bc:
-            self.set_variable_outflow_bcs(params)
+            with profiler.stage("set_variable_outflow_bcs") as stage:
+                self.set_variable_outflow_bcs(params)
+                stage.counts["bcs"] = len(self.bc_list)
 
         if params.inflow_input_file:
-            self.read_inflow_file(params)
+            with profiler.stage("read_inflow_file") as stage:
+                self.read_inflow_file(params)
+                stage.counts["points"] = len(self.inflow_data)
 
         if not params.uniform_material:
-            materials = self.generate_grouped_wall_properties(params)
+            with profiler.stage("generate_grouped_wall_properties") as stage:
+                self.materials = self.generate_grouped_wall_properties(params)
+                stage.counts["materials"] = len(self.materials)
 
-        self.calculate_connectivity(params, blank_list, centerline_list, group_list, tract_list)
+        with profiler.stage("calculate_connectivity") as stage:
+            self.calculate_connectivity(params, blank_list, centerline_list, group_list, tract_list)
+            stage.counts["segments"] = self.num_seg
+            stage.counts["joints"] = len(self.connectivity)
 
-        self.calculate_seg_lengths(params, centerline_list, group_list, tract_list)
+        with profiler.stage("calculate_seg_lengths", groups=self.num_groups, 
+          points=self.centerlines_geometry.GetNumberOfPoints()):
+            self.calculate_seg_lengths(params, centerline_list, group_list, tract_list)
 
-        self.calculate_node_coordinates(centerline_list, group_list, tract_list)
+        with profiler.stage("calculate_node_coordinates") as stage:
+            self.calculate_node_coordinates(centerline_list, group_list, tract_list)
+            stage.counts["nodes"] = len(self.nodes)
 
         if params.reorganize_seqments:
-            self.reorganize_child_segments(centerline_list, group_list, tract_list)
+            with profiler.stage("reorganize_child_segments") as stage:
+                self.reorganize_child_segments(centerline_list, group_list, tract_list)
+                stage.counts["segments"] = len(self.seg_list)
 
         if params.write_mesh_file:
-            self.write_mesh(params, centerline_list, group_list)
+            with profiler.stage("write_mesh", nodes=len(self.nodes), segments=self.num_seg):
+                self.write_mesh(params, centerline_list, group_list)
 
         if params.write_solver_file:
-            self.write_solver_file(params, centerline_list)
-            self.write_results(params, centerline_list, group_list)
+            with profiler.stage("write_solver_file", nodes=len(self.nodes), segments=self.num_seg) as stage:
+                self.write_solver_file(params, centerline_list)
+                stage.counts["elements"] = self.num_elements
+            with profiler.stage("write_results"):
+                self.write_results(params, centerline_list, group_list)
+            with profiler.stage("write_state"):
+                self.write_state(params, centerline_list, group_list, tract_list, blank_list)
+
+    def update_bcs(self, params):
+        """ Rewrite the boundary conditions of a solver file using the saved mesh state.
+
+        The mesh state written by a previous run is read and the outflow and inflow boundary 
+        conditions are read from their files. Only the segment section of the solver file, 
+        containing the boundary condition data tables, is rewritten.
+
+        Returns False if the mesh state could not be used.
+        """
+        self.logger.info("Update the boundary conditions of the 1D mesh ...")
+        if not self.read_state(params):
+            return False
+
+        profiler = get_profiler()
+
+        if not params.uniform_bc:
+            with profiler.stage("set_variable_outflow_bcs") as stage:
+                self.set_variable_outflow_bcs(params)
+                stage.counts["bcs"] = len(self.bc_list)
+
+        if params.inflow_input_file:
+            with profiler.stage("read_inflow_file") as stage:
+                self.read_inflow_file(params)
+                stage.counts["points"] = len(self.inflow_data)
+
+        with profiler.stage("update_solver_file", segments=self.num_seg):
+            self.update_solver_file(params)
+
+        return True
 
     def set_outlet_face_names(self, params): 
         """ Set outlet face names.
@@ -214,32 +308,10 @@ class Mesh(object):
 
             # For each non-terminal group, at least there are 2 paths going through 
             # the child segments and sharing this group.
-            pathid1 = centerline_list[self.group_elems[pargroupid][0]]
-            tractid1 = tract_list[self.group_elems[pargroupid][0]]
-
-            # Find the corresponding element id in path_elems list and index+1 is 
-            # the bifurcation index+2 is the child elem
-            childelemid1 = self.path_elems[pathid1][tractid1+2]
-            childgroupid1 = group_list[childelemid1]
-            temp_conn.append(childgroupid1)
-
-            # Find second child or third/fourth child.
-            for j in range(len(self.group_elems[pargroupid])-1,0,-1):
-                temppathid = centerline_list[self.group_elems[pargroupid][j]]
-                temptractid = tract_list[self.group_elems[pargroupid][j]]
-                tempelemid = self.path_elems[temppathid][temptractid+2]
-                tempgroupid = group_list[tempelemid]
-                repeat = 0
-                for k in range (1,len(temp_conn)):
-                    if tempgroupid == temp_conn[k]:
-                        repeat = 1
-                        break
-                #__for k in range (1,len(temp_conn))
-                if repeat == 0:
-                    temp_conn.append(tempgroupid)
-            #__for j in range(len(group_elems[pargroupid])-1,0,-1)
+            temp_conn.extend(self.topology.child_groups(pargroupid))
 
-            if len(temp_conn) > 3:
+            # Joints with more than 3 child segments are split when reorganizing segments.
+            if (len(temp_conn) > 3) and not params.reorganize_seqments:
                 msg = "There are more than 2 child segments for groupid %s" % str(pargroupid)
                 raise RuntimeError(msg)
 
@@ -378,6 +450,162 @@ class Mesh(object):
         #__with open(file_name, "w") as file
 
 
+    def get_state_parameters(self, params):
+        """ Get the parameters that the saved mesh state depends on.
+        """
+        return { "element_size":float(params.element_size), "min_num_elems":int(params.min_num_elems), 
+          "lcoef":float(params.lcoef), "Acoef":float(params.Acoef), "uniform_material":bool(params.uniform_material) }
+
+    def write_state(self, params, centerline_list, group_list, tract_list, blank_list):
+        """ Write the mesh state needed to rewrite the solver file boundary conditions.
+
+        The nodes, segments, group lengths and areas, connectivity and centerline cell data 
+        are written to a NumPy .npz file in the output directory.
+        """
+        file_name = path.join(params.output_directory, params.MESH_STATE_FILE_NAME)
+        self.logger.info("Write mesh state file: %s" % file_name)
+
+        def flatten(lists):
+            offsets = np.zeros(len(lists)+1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(values) for values in lists])
+            values = np.array([int(v) for values in lists for v in values], dtype=np.int64)
+            return offsets, values
+
+        conn_offsets, conn = flatten(self.connectivity)
+        seg_conn_offsets, seg_conn = flatten(self.seg_connectivity)
+        materials = np.zeros((0,2)) if self.materials is None else np.array(self.materials, dtype=np.float64)
+
+        np.savez_compressed(file_name, 
+          version=self.STATE_VERSION,
+          parameters=np.array(json.dumps(self.get_state_parameters(params))),
+          centerline_list=centerline_list, group_list=group_list, tract_list=tract_list, blank_list=blank_list,
+          outlet_face_names=np.array(self.outlet_face_names, dtype=str),
+          nodes=np.array(self.nodes, dtype=np.float64),
+          num_seg=self.num_seg, seg_list=np.array(self.seg_list, dtype=np.int64),
+          seg_head=np.array(self.seg_head, dtype=np.int64), seg_rear=np.array(self.seg_rear, dtype=np.int64),
+          group_terminal=np.array(self.group_terminal, dtype=np.int64),
+          group_length=np.array(self.group_length, dtype=np.float64),
+          group_Ain=np.array(self.group_Ain, dtype=np.float64), group_Aout=np.array(self.group_Aout, dtype=np.float64),
+          connectivity_offsets=conn_offsets, connectivity=conn,
+          seg_connectivity_offsets=seg_conn_offsets, seg_connectivity=seg_conn,
+          materials=materials)
+
+    def read_state(self, params):
+        """ Read the mesh state written by a previous run.
+
+        Returns False if the state file was not found or was created using different 
+        mesh parameters.
+        """
+        file_name = path.join(params.output_directory, params.MESH_STATE_FILE_NAME)
+        self.logger.info("Read mesh state file: %s" % file_name)
+
+        if not path.exists(file_name):
+            self.logger.error("The mesh state file '%s' was not found." % file_name)
+            return False
+
+        with np.load(file_name) as state:
+            if int(state["version"]) != self.STATE_VERSION:
+                self.logger.error("The mesh state file '%s' was written by a different version." % file_name)
+                return False
+
+            state_params = json.loads(str(state["parameters"]))
+            for name, value in self.get_state_parameters(params).items():
+                if state_params[name] != value:
+                    self.logger.error("The mesh state was created with %s=%s, not %s." % (name, state_params[name], value))
+                    return False
+
+            def unflatten(offsets, values):
+                values = values.tolist()
+                return [values[offsets[i]:offsets[i+1]] for i in range(offsets.shape[0]-1)]
+
+            centerline_list = state["centerline_list"]
+            group_list = state["group_list"]
+            self.set_topology(centerline_list, group_list, state["tract_list"], state["blank_list"])
+            self.centerline_list = centerline_list
+            self.group_list = group_list
+            self.num_cells = self.topology.num_cells
+            self.num_paths = self.topology.num_paths
+            self.num_groups = self.topology.num_groups
+
+            self.outlet_face_names = state["outlet_face_names"].tolist()
+            self.outlet_face_names_index = OrderedDict((name,i) for i,name in enumerate(self.outlet_face_names))
+            self.nodes = state["nodes"].tolist()
+            self.num_seg = int(state["num_seg"])
+            self.seg_list = state["seg_list"].tolist()
+            self.seg_head = state["seg_head"].tolist()
+            self.seg_rear = state["seg_rear"].tolist()
+            self.group_terminal = state["group_terminal"].tolist()
+            self.group_length = state["group_length"].tolist()
+            self.group_Ain = state["group_Ain"].tolist()
+            self.group_Aout = state["group_Aout"].tolist()
+            self.connectivity = unflatten(state["connectivity_offsets"], state["connectivity"])
+            self.seg_connectivity = unflatten(state["seg_connectivity_offsets"], state["seg_connectivity"])
+            materials = state["materials"]
+            self.materials = materials.tolist() if materials.shape[0] != 0 else None
+
+        self.logger.info("Number of paths: %d" % self.num_paths) 
+        self.logger.info("Number of segments: %d" % self.num_seg) 
+        return True
+
+    def update_solver_file(self, params):
+        """ Rewrite the segment section of a solver file.
+
+        The segment section contains the segment boundary conditions and the outflow and 
+        inflow data tables. The other sections are copied from the existing solver file. 
+        If the solver file does not exist then the complete file is written.
+        """
+        file_name = path.join(params.output_directory, params.solver_output_file) 
+
+        if not path.exists(file_name):
+            self.logger.info("The solver file '%s' was not found, write the complete file." % file_name)
+            self.write_solver_file(params, self.centerline_list)
+            return
+
+        self.logger.info("Update the boundary conditions in the solver file: %s" % file_name)
+        segment_header = "# SEGMENT CARD\n"
+        options_header = "# SOLVEROPTIONS CARD\n"
+        tmp_file_name = file_name + ".tmp" + (".gz" if file_name.endswith(".gz") else "")
+
+        if file_name.endswith(".gz"):
+            ifile = gzip.open(file_name, "rt")
+        else:
+            ifile = open(file_name, "r", buffering=self.Open.BUFFER_SIZE)
+
+        ## Copy the lines before and after the segment section, the first line of a 
+        #  section header is a line of '=' that precedes the section name.
+        found_segments = False
+        found_options = False
+        prev_line = None
+
+        with ifile, self.Open(tmp_file_name, "w") as ofile:
+            for line in ifile:
+                if not found_segments:
+                    if line == segment_header:
+                        found_segments = True
+                        self.write_solver_segments(ofile, params, self.centerline_list)
+                    elif prev_line is not None:
+                        ofile.write(prev_line)
+                elif not found_options:
+                    if line == options_header:
+                        found_options = True
+                        ofile.write(prev_line)
+                else:
+                    ofile.write(prev_line)
+                prev_line = line
+            #__for line in ifile
+
+            if found_options and (prev_line is not None):
+                ofile.write(prev_line)
+        #__with ifile, self.Open(tmp_file_name, "w") as ofile
+
+        if not (found_segments and found_options):
+            self.logger.warning("No segment section found in the solver file '%s', write the complete file." % file_name)
+            os.remove(tmp_file_name)
+            self.write_solver_file(params, self.centerline_list)
+            return
+
+        os.replace(tmp_file_name, file_name)
+
     def calculate_seg_lists(self, blank_list):
         """ Calculate segment list and group segments.
         """
@@ -387,14 +615,15 @@ class Mesh(object):
         tmp = len(self.group_elems[0])
 
         for i in range(self.num_groups):
-            if blank_list[self.group_elems[i][0]] == 1:
+            group_blanking = self.topology.group_blanking[i]
+            if group_blanking == 1:
                 group_terminal[i] = 2
                 num_bif = num_bif+1
-            if (len(self.group_elems[i]) == 1) and (blank_list[self.group_elems[i][0]] != 1):
+            if (len(self.group_elems[i]) == 1) and (group_blanking != 1):
                 group_terminal[i] = 1
                 num_outlet = num_outlet+1
 
-            if (len(self.group_elems[i]) > tmp) and (blank_list[self.group_elems[i][0]] != 1):
+            if (len(self.group_elems[i]) > tmp) and (group_blanking != 1):
                 tmp = len(self.group_elems[i])
                 self.logger.warning("A group with id>0 contains more centerlines than group 0")
         #__for i in range(num_groups)
@@ -431,49 +660,206 @@ class Mesh(object):
 
     def generate_grouped_wall_properties(self, params):
         """ Generate grouped wall properties and write them to a file.
+
+        The wall properties surface is split into branches using the centerline groups and 
+        the thickness and Young's modulus are averaged over the points of each group. 
+
+        Returns:
+            materials (list[list[float]]): materials[i] is the [thickness, Young's modulus] of group i.
         """
         self.logger.info("Generate grouped wall properties ...") 
+        surface = self.clip_wall_properties(params)
+
+        fields = self.WallPropertyFields
+        point_data = surface.GetPointData()
+        thickness = nps.vtk_to_numpy(point_data.GetArray(fields.THICKNESS))
+        E = nps.vtk_to_numpy(point_data.GetArray(fields.YOUNGS_MODULUS))
+        group_ids = nps.vtk_to_numpy(point_data.GetArray(fields.GROUP_IDS)).astype(np.int64)
+
+        weights = None
+        if params.wall_properties_average == WallPropertiesAverageType.AREA:
+            weights = self.get_point_areas(surface)
+
+        values = np.column_stack((thickness, E))
+        averages, counts = self.average_group_values(group_ids, values, self.num_groups, 
+          params.wall_properties_average, weights)
+
+        for i in np.nonzero(counts == 0)[0]:
+            self.logger.info("Group %d is empty." % i) 
+
+        materials = averages.tolist()
+        self.logger.info("Created %d materials." % len(materials)) 
+
+        return materials
+
+    def clip_wall_properties(self, params):
+        """ Split the wall properties surface into branches using vmtkBranchClipper.
+
+        The clipped surface is written to the wall properties output file together with a key 
+        computed from the wall properties surface geometry and the centerlines. If the output file 
+        exists and has the same key then it is read instead of clipping the surface again, the 
+        wall properties are then interpolated from the input surface so that changing them does
+        not clip the surface again.
+        """
         self.logger.info("Read wall properties file: %s" % params.wall_properties_input_file) 
         poly_data = read_polydata(params.wall_properties_input_file)
+        key = self.get_branch_clipper_key(poly_data)
+        output_file = params.wall_properties_output_file
+
+        if path.exists(output_file):
+            try:
+                surface = read_polydata(output_file)
+                key_array = surface.GetFieldData().GetAbstractArray(self.BRANCH_CLIPPER_KEY_NAME)
+                if (key_array is not None) and (key_array.GetValue(0) == key):
+                    self.logger.info("Read clipped wall properties file: %s" % output_file) 
+                    if self.update_clipped_wall_properties(surface, poly_data, output_file):
+                        return surface
+                    self.logger.warning("Unable to interpolate wall properties to the clipped surface.")
+            except Exception as e:
+                self.logger.warning("Unable to read wall properties file %s: %s" % (output_file, str(e)))
+        #__if path.exists(output_file)
 
         branch_clip = vmtkscripts.vmtkBranchClipper()
         branch_clip.Surface = poly_data
-        branch_clip.Centerlines = centerlines
+        branch_clip.Centerlines = self.centerlines_geometry
         branch_clip.Execute()
         surface = branch_clip.Surface
 
-        self.logger.info("Write wall properties file: %s" % params.wall_properties_output_file) 
-        write_polydata(params.wall_properties_output_file, surface)
+        key_array = vtkStringArray()
+        key_array.SetName(self.BRANCH_CLIPPER_KEY_NAME)
+        key_array.InsertNextValue(key)
+        surface.GetFieldData().AddArray(key_array)
+
+        self.logger.info("Write wall properties file: %s" % output_file) 
+        write_polydata(output_file, surface)
+        return surface
+
+    def update_clipped_wall_properties(self, surface, wall_surface, output_file):
+        """ Interpolate the wall properties of the wall properties surface to a clipped surface.
+
+        The clipped surface points are on the wall properties surface so the values are the same
+        as those interpolated by vmtkBranchClipper. The output file is written if the values change.
+        Returns False if a clipped surface point is not on the wall properties surface.
+        """
+        probe = vtkProbeFilter()
+        probe.SetInputData(surface)
+        probe.SetSourceData(wall_surface)
+        probe.Update()
+        probe_data = probe.GetOutput().GetPointData()
+        if not np.all(nps.vtk_to_numpy(probe_data.GetArray(probe.GetValidPointMaskArrayName()))):
+            return False
 
+        fields = self.WallPropertyFields
         point_data = surface.GetPointData()
-        thickness = nps.vtk_to_numpy(point_data.GetArray('thickness'))
-        E = nps.vtk_to_numpy(point_data.GetArray('Young_Mod'))
-        group_ids = nps.vtk_to_numpy(point_data.GetArray('GroupIds'))
+        changed = False
+        for name in [fields.THICKNESS, fields.YOUNGS_MODULUS]:
+            values = probe_data.GetArray(name)
+            if values is None:
+                raise RuntimeError("No '%s' data in the wall properties file." % name)
+            old_values = point_data.GetArray(name)
+            if (old_values is None) or not np.array_equal(nps.vtk_to_numpy(old_values), nps.vtk_to_numpy(values)):
+                point_data.RemoveArray(name)
+                point_data.AddArray(values)
+                changed = True
+
+        if changed:
+            self.logger.info("Write wall properties file: %s" % output_file) 
+            write_polydata(output_file, surface)
+        return True
+
+    def get_branch_clipper_key(self, wall_surface):
+        """ Get a key identifying the wall properties surface geometry and centerlines used by vmtkBranchClipper.
+
+        The wall properties values are not included, the clipping does not depend on them.
+        """
+        sha = hashlib.sha256()
+        sha.update(("version %s\n" % self.BRANCH_CLIPPER_KEY_VERSION).encode())
 
-        group_thickness = []
-        group_E = []
+        sha.update(nps.vtk_to_numpy(wall_surface.GetPoints().GetData()).astype(np.float64).tobytes())
+        for ids in self.get_cell_point_ids(wall_surface.GetPolys()):
+            sha.update(ids.tobytes())
 
-        for i in range(self.num_groups):
-            group_thickness.append([])
-            group_E.append([])
+        cl_geom = self.centerlines_geometry
+        sha.update(nps.vtk_to_numpy(cl_geom.GetPoints().GetData()).astype(np.float64).tobytes())
+        for ids in self.get_cell_point_ids():
+            sha.update(ids.tobytes())
+        fields = self.CellDataFields
+        for field in [fields.CENTERLINE_IDS, fields.GROUP_IDS, fields.TRACT_IDS, fields.BLANKING]:
+            sha.update(self.get_cell_data(field).astype(np.int64).tobytes())
+        radius = cl_geom.GetPointData().GetArray(self.PointDataFields.MAX_INSCRIBED_RADIUS)
+        sha.update(nps.vtk_to_numpy(radius).astype(np.float64).tobytes())
 
-        for i in range(poly_data.GetNumberOfPoints()):
-            group_thickness[group_ids[i]].append(float(thickness[i]))
-            group_E[group_ids[i]].append(float(E[i]))
+        return sha.hexdigest()
 
-        materials = []
-        for i in range(self.num_groups):
-            thickness_mean = 0.0
-            E_mean = 0.0
-            if len(group_thickness[i]) != 0:
-                thickness_mean = np.mean(group_thickness[i])
-                E_mean = np.mean(group_E[i])
-            else:
-                self.logger.info("Group %d is empty." % i) 
-            materials.append([thickness_mean, E_mean])
-        self.logger.info("Created %d materials." % len(materials)) 
+    def get_point_areas(self, surface):
+        """ Get the area associated with each surface point, a third of the area of its triangles.
+        """
+        triangle_filter = vtkTriangleFilter()
+        triangle_filter.SetInputData(surface)
+        triangle_filter.PassLinesOff()
+        triangle_filter.PassVertsOff()
+        triangle_filter.Update()
+        triangles = triangle_filter.GetOutput()
+
+        points = nps.vtk_to_numpy(triangles.GetPoints().GetData()).astype(np.float64)
+        offsets, connectivity = self.get_cell_point_ids(triangles.GetPolys())
+        tri = connectivity.reshape(-1,3)
+
+        v1 = points[tri[:,1]] - points[tri[:,0]]
+        v2 = points[tri[:,2]] - points[tri[:,0]]
+        areas = 0.5 * np.linalg.norm(np.cross(v1, v2), axis=1)
+
+        num_points = surface.GetNumberOfPoints()
+        return np.bincount(tri.ravel(), weights=np.repeat(areas/3.0, 3), minlength=num_points)[:num_points]
+
+    @staticmethod
+    def average_group_values(group_ids, values, num_groups, method, weights=None):
+        """ Average point values over groups.
+
+        Args:
+            group_ids (ndarray[int]): The group ID of each point.
+            values (ndarray[float]): The (num_points, num_values) values at each point.
+            num_groups (int): The number of groups.
+            method (str): The WallPropertiesAverageType used to average values.
+            weights (ndarray[float]): The point weights used for an area-weighted average.
+
+        Returns:
+            averages (ndarray[float]): The (num_groups, num_values) group averages, 0 for empty groups.
+            counts (ndarray[int]): The number of points in each group.
+        """
+        # Ignore points not assigned to a centerline group.
+        valid = (group_ids >= 0) & (group_ids < num_groups)
+        group_ids = group_ids[valid]
+        values = values[valid].astype(np.float64)
+        num_values = values.shape[1]
+
+        counts = np.bincount(group_ids, minlength=num_groups)
+        averages = np.zeros((num_groups, num_values), dtype=np.float64)
+        nonempty = counts > 0
+
+        if method == WallPropertiesAverageType.MEDIAN:
+            offsets = np.zeros(num_groups+1, dtype=np.int64)
+            offsets[1:] = np.cumsum(counts)
+            lower = (offsets[:-1] + (counts-1)//2)[nonempty]
+            upper = (offsets[:-1] + counts//2)[nonempty]
+            for j in range(num_values):
+                # Sort values by group and then by value.
+                sorted_values = values[np.lexsort((values[:,j], group_ids)), j]
+                averages[nonempty,j] = 0.5*(sorted_values[lower] + sorted_values[upper])
+            return averages, counts
+
+        if method == WallPropertiesAverageType.AREA:
+            point_weights = weights[valid].astype(np.float64)
+        else:
+            point_weights = np.ones(group_ids.shape[0], dtype=np.float64)
 
-        return materials
+        sum_weights = np.bincount(group_ids, weights=point_weights, minlength=num_groups)
+        nonzero = sum_weights > 0.0
+        for j in range(num_values):
+            sums = np.bincount(group_ids, weights=point_weights*values[:,j], minlength=num_groups)
+            averages[nonzero,j] = sums[nonzero] / sum_weights[nonzero]
+
+        return averages, counts
 
     def read_outlet_face_names(self, params):
         """ Read in outlet face names file.
@@ -549,35 +935,15 @@ class Mesh(object):
         self.bc_list = bc_list
         self.bc_map = bc_map
 
-    def set_group_elements(self, group_list):
-        """
-        group_elems[i] records the element(line) indices for group id=i
-        """
-        group_elems = []
-        for i in range(self.num_groups):
-            group_elems.append([])
+    def set_topology(self, centerline_list, group_list, tract_list, blank_list):
+        """ Index the centerline cells by path and group.
 
-        for i in range(self.num_cells):
-            group_elems[group_list[i]].append(i)
- 
-        self.group_elems = group_elems
-
-    def set_path_elements(self, centerline_list):
-        """
         path_elems[i] records the element(line) indices for centerline id=i.
+        group_elems[i] records the element(line) indices for group id=i.
         """
-        path_elems = []
-
-        for i in range(self.num_paths):
-            path_elems.append([])
-
-        for i in range(self.num_paths):
-            for j in range(self.num_cells):
-                if i == centerline_list[j]:
-                    path_elems[i].append(j)
-        #__for i in range(num_path)
-
-        self.path_elems = path_elems 
+        self.topology = CenterlineTopology(centerline_list, group_list, tract_list, blank_list)
+        self.path_elems = self.topology.path_elems
+        self.group_elems = self.topology.group_elems
 
     def check_centerlines_data(self):
         """ Check that the centerline data contains all of the required fields.
@@ -605,52 +971,105 @@ class Mesh(object):
         return nps.vtk_to_numpy(cell_data)
 
 
+    def get_cell_point_ids(self, cells=None):
+        """ Get the point IDs for all centerline cells as NumPy arrays.
+
+        If 'cells' (vtkCellArray) is given then the point IDs of those cells are returned.
+
+        Returns:
+            offsets (ndarray[int]): offsets[i] is the index into 'connectivity' of the first point of cell i,
+                offsets[num_cells] is the length of 'connectivity'.
+            connectivity (ndarray[int]): The point IDs of all cells.
+        """
+        lines = self.centerlines_geometry.GetLines() if cells is None else cells
+
+        # VTK 9 stores cells as separate offsets and connectivity arrays.
+        if hasattr(lines, "GetOffsetsArray"):
+            offsets = nps.vtk_to_numpy(lines.GetOffsetsArray()).astype(np.int64)
+            connectivity = nps.vtk_to_numpy(lines.GetConnectivityArray()).astype(np.int64)
+            return offsets, connectivity
+
+        # Older VTK versions store cells as (n, id_1, ..., id_n) runs.
+        cell_data = nps.vtk_to_numpy(lines.GetData()).astype(np.int64)
+        num_cells = lines.GetNumberOfCells()
+        counts = np.zeros(num_cells, dtype=np.int64)
+        pos = 0
+        for i in range(num_cells):
+            counts[i] = cell_data[pos]
+            pos += counts[i] + 1
+        offsets = np.zeros(num_cells+1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts)
+        # Remove the leading point count of each cell.
+        keep = np.ones(cell_data.shape[0], dtype=bool)
+        keep[offsets[:-1] + np.arange(num_cells)] = False
+        return offsets, cell_data[keep]
+
+    def calculate_group_geometry(self, group_list):
+        """ Calculate the summed length, inlet and outlet areas of the cells in each group.
+
+        The centerline point coordinates, cell connectivity and maximum inscribed sphere 
+        radii are extracted once and the per-group sums are computed with np.bincount(), 
+        which accumulates values in cell order so that the sums are identical to summing 
+        over group_elems[i] one point at a time.
+
+        As for the original per-cell calculation, the last line segment of each cell is not 
+        included in its length.
+
+        Returns:
+            length (ndarray[float]): The sum of the cell lengths for each group.
+            Ain (ndarray[float]): The sum of the cell inlet areas for each group.
+            Aout (ndarray[float]): The sum of the cell outlet areas for each group.
+            num_elems (ndarray[int]): The number of cells in each group.
+        """
+        num_groups = self.num_groups
+        cl_geom = self.centerlines_geometry
+        group_list = np.asarray(group_list, dtype=np.int64)
+
+        field_name = self.PointDataFields.MAX_INSCRIBED_RADIUS
+        points_maxR = nps.vtk_to_numpy(cl_geom.GetPointData().GetArray(field_name))
+        points = nps.vtk_to_numpy(cl_geom.GetPoints().GetData()).astype(np.float64)
+        offsets, connectivity = self.get_cell_point_ids()
+        counts = np.diff(offsets)
+
+        # Cell inlet and outlet areas.
+        area = np.pi*points_maxR**2
+        Ain = np.bincount(group_list, weights=area[connectivity[offsets[:-1]]], minlength=num_groups)
+        Aout = np.bincount(group_list, weights=area[connectivity[offsets[1:]-1]], minlength=num_groups)
+
+        # Line segments (k,k+1) for k = 0 to num_ids-3 of each cell.
+        cell_ids = np.repeat(np.arange(counts.shape[0]), counts)
+        local_ids = np.arange(connectivity.shape[0]) - np.repeat(offsets[:-1], counts)
+        seg_start = np.nonzero(local_ids < counts[cell_ids]-2)[0]
+        dx = points[connectivity[seg_start+1]] - points[connectivity[seg_start]]
+
+        # Use the same dot product as np.linalg.norm() so that lengths are unchanged.
+        seg_length = np.sqrt(np.matmul(dx[:,np.newaxis,:], dx[:,:,np.newaxis]).ravel())
+        length = np.bincount(group_list[cell_ids[seg_start]], weights=seg_length, minlength=num_groups)
+
+        num_elems = np.bincount(group_list, minlength=num_groups)
+        return length, Ain, Aout, num_elems
+
     def calculate_seg_lengths(self, params, centerline_list, group_list, tract_list):
         """ calculate seg length, Ain and Aout
         """
         num_groups = self.num_groups
-        group_elems = self.group_elems
         group_terminal = self.group_terminal
-        path_elems = self.path_elems
         num_seg = self.num_seg
         seg_list = self.seg_list
-        cl_geom = self.centerlines_geometry
 
         group_length = []
         group_Ain = []
         group_Aout = []
-        seg_head = []
-        seg_rear = []
 
-        # Get max inscribed sphere radius data.
-        field_name = self.PointDataFields.MAX_INSCRIBED_RADIUS
-        celldata = cl_geom.GetPointData().GetArray(field_name)
-        points_maxR = nps.vtk_to_numpy(celldata)
-        points = cl_geom.GetPoints()
+        sum_length, sum_Ain, sum_Aout, num_elems = self.calculate_group_geometry(group_list)
+        sum_length = (params.lcoef * sum_length / num_elems).tolist()
+        sum_Ain = (params.Acoef * sum_Ain / num_elems).tolist()
+        sum_Aout = (params.Acoef * sum_Aout / num_elems).tolist()
 
         for i in range(num_groups):
-            tmpl = 0.0
-            tmpAin = 0.0
-            tmpAout = 0.0
-
-            for j in range(0,len(group_elems[i])):
-                ids = vtkIdList()
-                cl_geom.GetCellPoints(group_elems[i][j],ids)
-                num_ids = ids.GetNumberOfIds()
-                tmpAin = tmpAin + np.pi*points_maxR[ids.GetId(0)]**2
-                tmpAout = tmpAout + np.pi*points_maxR[ids.GetId(num_ids-1)]**2
-                for k in range(0,num_ids-2):
-                    id1 = ids.GetId(k)
-                    id2 = ids.GetId(k+1)
-                    pt1 = np.array([points.GetPoint(id1)[0], points.GetPoint(id1)[1], points.GetPoint(id1)[2]])
-                    pt2 = np.array([points.GetPoint(id2)[0], points.GetPoint(id2)[1], points.GetPoint(id2)[2]])
-                    tmpl = tmpl + np.linalg.norm(pt2-pt1)
-                #__for k in range(0,num_ids-2)
-            #__for j in range(0,len(group_elems[i]))
-         
-            tmpl = params.lcoef * tmpl/len(group_elems[i])
-            tmpAin = params.Acoef * tmpAin/len(group_elems[i])
-            tmpAout = params.Acoef * tmpAout/len(group_elems[i])
+            tmpl = sum_length[i]
+            tmpAin = sum_Ain[i]
+            tmpAout = sum_Aout[i]
  
             if (tmpAin < tmpAout) and (group_terminal[i] != 2):
                 self.logger.warning("warning! Ain < Aout in group id = %d" % i)
@@ -672,11 +1091,8 @@ class Mesh(object):
         for i in range(num_seg):
             if group_terminal[seg_list[i]] != 1:
                 pargroupid = seg_list[i]
-                pathid1 = centerline_list[group_elems[pargroupid][0]]
-                tractid1 = tract_list[group_elems[pargroupid][0]]
                 # Find the bifurcation group.
-                bifelem = path_elems[pathid1][tractid1+1]
-                bifgroupid = group_list[bifelem]
+                bifgroupid = self.topology.bifurcation_group(pargroupid)
                 # Add the bifurcation group length to the parent group.
                 #print("biflength ",group_length[bifgroupid],"ratio to parent group length",group_length[bifgroupid]/group_length[pargroupid])
                 group_length[pargroupid] = group_length[pargroupid]+group_length[bifgroupid]
@@ -730,11 +1146,7 @@ class Mesh(object):
             if tempgroupid == 0:
                  seg_head.append(0)
             else:
-                 tempelemid = group_elems[tempgroupid][0]
-                 temptractid = tract_list[tempelemid]
-                 temppathid = centerline_list[tempelemid]
-                 tempelemid = path_elems[temppathid][temptractid-2]
-                 seg_head.append(grouprearnodeid[group_list[tempelemid]])
+                 seg_head.append(grouprearnodeid[self.topology.parent_group(tempgroupid)])
             seg_rear.append(grouprearnodeid[tempgroupid])
         #_for i in range(0,num_seg)
 
@@ -757,6 +1169,10 @@ class Mesh(object):
         num_seg = self.num_seg
         seg_list = self.seg_list
         seg_connectivity = self.seg_connectivity
+        seg_head = self.seg_head
+        seg_rear = self.seg_rear
+        group_length = self.group_length
+        nodes = self.nodes
         cl_geom = self.centerlines_geometry
         points = cl_geom.GetPoints()
 
@@ -769,11 +1185,8 @@ class Mesh(object):
               parsegid = seg_connectivity[i][0]
               pargroupid = seg_list[parsegid]
               num_child = len(seg_connectivity[i])-1
-              pathid1 = centerline_list[group_elems[pargroupid][0]]
-              tractid1 = tract_list[group_elems[pargroupid][0]]
               # Find the bifurcation group
-              bifelem = path_elems[pathid1][tractid1+1]
-              bifgroupid = group_list[bifelem]
+              bifgroupid = self.topology.bifurcation_group(pargroupid)
               bifl = group_length[bifgroupid]
               dl = bifl/(num_child-2)
               childsegs = []
@@ -811,7 +1224,7 @@ class Mesh(object):
               id1 = ids.GetId(0) 
               pt1 = np.array([points.GetPoint(id1)[0], points.GetPoint(id1)[1], points.GetPoint(id1)[2]])
               id2 = ids.GetId(int(num_ids/2)) 
-              pt2 = np.array([points.GetPoint(id2)[0], points.GetPoint(id2)[1], points().GetPoint(id2)[2]])
+              pt2 = np.array([points.GetPoint(id2)[0], points.GetPoint(id2)[1], points.GetPoint(id2)[2]])
               v = pt2-pt1
               v = v/np.linalg.norm(v)
              
@@ -866,7 +1279,7 @@ class Mesh(object):
         #__while i < len(seg_connectivity)
 
         #print ("num_seg = ",num_seg)
-        num_seg = len(seg_list)   
+        self.num_seg = len(seg_list)   
         #print ("redefine num_seg = ",num_seg)
 
 
@@ -936,12 +1349,12 @@ class Mesh(object):
         ofile.writeln(self.solver_file_msg)
         self.write_solver_section_header(ofile, header)
 
-        nodes = self.nodes
-        lcoef = params.lcoef
-        sp = self.space
+        coords = params.lcoef * np.array(self.nodes, dtype=np.float64)
+        chunk_size = self.SOLVER_FILE_CHUNK_SIZE
 
-        for i in range(0,len(nodes)):
-            ofile.writeln("NODE " + str(i) + sp + sp.join(str(lcoef*nodes[i][j]) for j in range(3)) )
+        for start in range(0, coords.shape[0], chunk_size):
+            chunk = coords[start:start+chunk_size].tolist()
+            ofile.writelns(["NODE %d %r %r %r" % (start+i, x, y, z) for i,(x,y,z) in enumerate(chunk)])
 
     def write_solver_joints(self, ofile, params):
         """ Write a solver input file joints section.
@@ -975,21 +1388,20 @@ class Mesh(object):
         ofile.writeln(self.solver_file_msg)
         self.write_solver_section_header(ofile, header2)
         
-        sp = self.space
         seg_connectivity = self.seg_connectivity
         seg_rear = self.seg_rear 
-
-        for i in range(0,len(seg_connectivity)):
-          pargroupid = seg_connectivity[i][0]
-          joint = "JOINT J" + str(i) + sp + str(seg_rear[pargroupid])
-          jin = "IN" + str(i)
-          jout = "OUT" + str(i)
-          ofile.writeln(joint + sp + jin + sp + jout)
-          ofile.writeln("JOINTINLET IN" + str(i) + sp + "1 " + str(seg_connectivity[i][0]))
-          ofile.write("JOINTOUTLET OUT" + str(i) + sp + str(len(seg_connectivity[i])-1))
-          for j in range(1,len(seg_connectivity[i])): 
-             ofile.write(sp + str(seg_connectivity[i][j]))
-          ofile.write("\n\n")
+        chunk_size = self.SOLVER_FILE_CHUNK_SIZE
+
+        # Each joint is written as JOINT, JOINTINLET and JOINTOUTLET cards followed by a blank line.
+        for start in range(0, len(seg_connectivity), chunk_size):
+            lines = []
+            for i in range(start, min(start+chunk_size, len(seg_connectivity))):
+                conn = [int(segid) for segid in seg_connectivity[i]]
+                lines.append("JOINT J%d %d IN%d OUT%d" % (i, seg_rear[conn[0]], i, i))
+                lines.append("JOINTINLET IN%d 1 %d" % (i, conn[0]))
+                lines.append(" ".join(["JOINTOUTLET OUT%d %d" % (i, len(conn)-1)] + [str(segid) for segid in conn[1:]]))
+                lines.append("")
+            ofile.writelns(lines)
 
     def write_solver_segments(self, ofile, params, centerline_list):
         """ Write a solver input file joints section.
@@ -1047,41 +1459,49 @@ class Mesh(object):
         self.logger.info("Outflow BC: %s" % outflow_bc)
         self.num_elements = 0
 
-        for i in range(0,num_seg):
-           if uniform_material:
-               matname = "MAT1"
-           else:
-               matname = "MAT_group"+str(seg_list[i])
-           
-           numfe = int(round(group_length[seg_list[i]]/dx))
-
-           if numfe < min_num_elems:
-               numfe = min_num_elems
-
-           self.num_elements += numfe 
-
-           ofile.write("SEGMENT" + sp + "Group"+ str(seg_list[i])+"_Seg"+str(i) + sp + str(i) + sp + 
-             str(group_length[seg_list[i]]) + sp + str(numfe) + sp + str(seg_head[i]) + sp + 
-             str(seg_rear[i]) + sp + str(group_Ain[seg_list[i]]) + sp + str(group_Aout[seg_list[i]])+ sp +
-             "0.0 " + matname + " NONE 0.0 0 0 ")
-
-           if group_terminal[seg_list[i]] == 1:
-               if uniform_bc:
-                   outflow_bc = OutflowBoundaryConditionType.RCR.upper()
-                   ofile.writeln(outflow_bc+ " " + outflow_bc +"_1")
-                   msg = "While writing solver segments encountered: group_terminal[seg_list[i]] == 1"
-                   self.logger.critical(msg)
-                   raise RuntimeError(msg)
-               else:
-                   temp_group_id = seg_list[i]
-                   temp_elem_id = group_elems[temp_group_id][0]
-                   temp_path_id = centerline_list[temp_elem_id]
-                   outlet_face = outlet_face_names[temp_path_id]
-                   map_val = self.bc_map[outlet_face]
-                   ofile.writeln(outflow_bc_uc + " "+ outflow_bc_uc +"_"+str(temp_path_id))
-           else:
-               ofile.writeln("NOBOUND NONE")   
-        #__for i in range(0,num_seg)
+        ## Segment data.
+        seg_groups = np.array(seg_list[:num_seg], dtype=np.int64)
+        seg_length = np.array(group_length, dtype=np.float64)[seg_groups]
+        seg_Ain = np.array(group_Ain, dtype=np.float64)[seg_groups]
+        seg_Aout = np.array(group_Aout, dtype=np.float64)[seg_groups]
+        seg_numfe = np.maximum(np.round(seg_length/dx).astype(np.int64), int(min_num_elems))
+        self.num_elements = int(seg_numfe.sum())
+
+        ## Boundary condition of each segment, outlet segments are identified by their path ID.
+        seg_bc = num_seg*["NOBOUND NONE"]
+        terminal_segs = np.nonzero(np.array(group_terminal, dtype=np.int64)[seg_groups] == 1)[0]
+
+        if uniform_bc and terminal_segs.shape[0] != 0:
+            msg = "While writing solver segments encountered: group_terminal[seg_list[i]] == 1"
+            self.logger.critical(msg)
+            raise RuntimeError(msg)
+
+        for i in terminal_segs.tolist():
+            temp_path_id = int(centerline_list[group_elems[seg_list[i]][0]])
+            outlet_face = outlet_face_names[temp_path_id]
+            if outlet_face not in self.bc_map:
+                raise RuntimeError("No outflow boundary condition was given for the outlet face '%s'." % outlet_face)
+            seg_bc[i] = outflow_bc_uc + " " + outflow_bc_uc + "_" + str(temp_path_id)
+
+        chunk_size = self.SOLVER_FILE_CHUNK_SIZE
+
+        for start in range(0, num_seg, chunk_size):
+            end = min(start+chunk_size, num_seg)
+            groups = seg_groups[start:end].tolist()
+            length = seg_length[start:end].tolist()
+            numfe = seg_numfe[start:end].tolist()
+            Ain = seg_Ain[start:end].tolist()
+            Aout = seg_Aout[start:end].tolist()
+            lines = []
+            for k,i in enumerate(range(start, end)):
+                if uniform_material:
+                    matname = "MAT1"
+                else:
+                    matname = "MAT_group" + str(groups[k])
+                lines.append("SEGMENT Group%d_Seg%d %d %r %d %d %d %r %r 0.0 %s NONE 0.0 0 0 %s" % (groups[k], i, i, 
+                  length[k], numfe[k], seg_head[i], seg_rear[i], Ain[k], Aout[k], matname, seg_bc[i]))
+            ofile.writelns(lines)
+        #__for start in range(0, num_seg, chunk_size)
 
         ofile.writeln("")
         ofile.writeln("")
@@ -1183,6 +1603,11 @@ class Mesh(object):
         c2 = params.c2
         c3 = params.c3
         uniform_material = params.uniform_material
+        num_seg = self.num_seg
+        seg_list = self.seg_list
+        group_Ain = self.group_Ain
+        group_Aout = self.group_Aout
+        matlist = self.materials
 
         if uniform_material:
            ofile.writeln("MATERIAL MAT1 " + mattype + sp + str(density) + sp + str(viscosity) + sp +
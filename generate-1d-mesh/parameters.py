@@ -1,9 +1,16 @@
 #!/usr/bin/env python
 
+import os
+
 class OutflowBoundaryConditionType(object):
     RCR = "rcr"
     RESISTANCE = "resistance"
 
+class WallPropertiesAverageType(object):
+    AREA = "area"
+    MEAN = "mean"
+    MEDIAN = "median"
+
 class Parameters():
     """ The Parameter class stores the input parameters for a 1D mesh generation.
     """
@@ -26,6 +33,9 @@ class Parameters():
         self.uniform_material = True
         self.wall_properties_input_file = None
         self.wall_properties_output_file = None
+        self.wall_properties_average = WallPropertiesAverageType.MEAN
+        self.WALL_PROPERTIES_AVERAGE_TYPES = [WallPropertiesAverageType.AREA, WallPropertiesAverageType.MEAN,
+                                              WallPropertiesAverageType.MEDIAN]
         self.write_mesh_file = False
         self.write_solver_file = False
 
@@ -41,7 +51,18 @@ class Parameters():
                                  OutflowBoundaryConditionType.RESISTANCE : "resistance.dat"}
 
         self.outlet_face_names_file = None
+        self.profile = False
+        self.PROFILE_FILE_NAME = "generate-1d-mesh-profile.json"
         self.CENTERLINES_OUTLET_FILE_NAME = "centerlines_outlets.dat"
+        self.MESH_STATE_FILE_NAME = "mesh_state.npz"
+
+        # Reload the mesh state and only rewrite the boundary conditions in the solver file.
+        self.update_bcs = False
+
+        # Cache computed centerlines.
+        self.use_centerlines_cache = True
+        self.centerlines_cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "generate-1d-mesh", "centerlines")
+        self.centerlines_cache_max_size = 2*1024*1024*1024
 
         # Mesh size in a vessel segment.
         self.element_size = 0.1
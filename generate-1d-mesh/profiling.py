@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+"""
+This module is used to record the wall time, memory use and item counts of the stages of
+the 1D mesh generation pipeline.
+
+Profiling is disabled by default. When it is enabled a record is created for each stage executed
+within a Profiler.stage() context and a summary can be written to the log and to a JSON file.
+
+The memory use of a stage is recorded as the resident set size (RSS) of the process when the stage
+starts and ends, it is read using psutil if it is installed or from /proc/self/statm. The peak RSS
+of the process (ru_maxrss) is also recorded, this is the peak since the process started so it
+includes the memory used by earlier stages and by anything else run in the same process.
+"""
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+def get_profiler():
+    """ Get the profiler used by the 1D mesh generation modules.
+    """
+    return _profiler
+
+def get_peak_rss():
+    """ Get the peak resident set size of the process since it started in MB, None if it is not available.
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux.
+    if sys.platform == "darwin":
+        return max_rss / (1024.0*1024.0)
+    return max_rss / 1024.0
+
+def get_current_rss():
+    """ Get the current resident set size of the process in MB, None if it is not available.
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024.0*1024.0)
+
+    # The second field of statm is the number of resident pages.
+    try:
+        with open("/proc/self/statm") as file:
+            num_pages = int(file.read().split()[1])
+        return num_pages * os.sysconf("SC_PAGE_SIZE") / (1024.0*1024.0)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+class Profiler(object):
+    """ The Profiler class is used to record the execution of pipeline stages.
+
+    Attributes:
+        enabled (bool): If True then stages are recorded.
+        stages (list[dict]): The records of the executed stages.
+    """
+
+    class StageRecord(dict):
+        """ This class stores the name, time, memory use and item counts of a stage.
+
+        rss_start_mb and rss_end_mb are the RSS of the process when the stage starts and ends,
+        process_peak_rss_mb is the peak RSS of the process up to the end of the stage.
+        """
+        def __init__(self, name):
+            super().__init__(name=name, time=0.0, rss_start_mb=None, rss_end_mb=None, 
+              process_peak_rss_mb=None, counts={})
+        @property
+        def counts(self):
+            return self["counts"]
+
+    def __init__(self):
+        self.enabled = False
+        self.stages = []
+        self.start_time = None
+
+    def enable(self):
+        """ Enable profiling and clear previously recorded stages.
+        """
+        self.enabled = True
+        self.stages = []
+        self.start_time = time.time()
+
+    @contextmanager
+    def stage(self, name, **counts):
+        """ Record a pipeline stage.
+
+        Item counts can be given as keyword arguments or added to the 'counts'
+        of the returned record.
+        """
+        record = self.StageRecord(name)
+        record.counts.update(counts)
+
+        if not self.enabled:
+            yield record
+            return
+
+        record["rss_start_mb"] = get_current_rss()
+        start_time = time.time()
+        try:
+            yield record
+        finally:
+            record["time"] = time.time() - start_time
+            record["rss_end_mb"] = get_current_rss()
+            record["process_peak_rss_mb"] = get_peak_rss()
+            self.stages.append(record)
+
+    def get_report(self):
+        """ Get the report of the recorded stages.
+        """
+        total_time = None
+        if self.start_time is not None:
+            total_time = time.time() - self.start_time
+        return { "total_time": total_time, "process_peak_rss_mb": get_peak_rss(), "stages": self.stages }
+
+    def write_report(self, file_name):
+        """ Write the report of the recorded stages to a JSON file.
+        """
+        # Counts may be NumPy scalars.
+        def to_json(value):
+            if hasattr(value, "item"):
+                return value.item()
+            return str(value)
+
+        with open(file_name, "w") as file:
+            json.dump(self.get_report(), file, indent=2, default=to_json)
+
+    def log_summary(self, logger):
+        """ Write a summary of the recorded stages to the log.
+        """
+        report = self.get_report()
+        header = "%-36s %10s %12s %12s %16s  %s" % ("stage", "time (s)", "RSS in (MB)", "RSS out (MB)", 
+          "proc. peak (MB)", "counts")
+        logger.info("Profile:")
+        logger.info(header)
+        logger.info("-" * len(header))
+
+        def fmt(value):
+            return "" if value is None else "%.1f" % value
+
+        for stage in report["stages"]:
+            counts = " ".join("%s=%s" % (k,v) for k,v in stage["counts"].items())
+            logger.info("%-36s %10.3f %12s %12s %16s  %s" % (stage["name"], stage["time"], fmt(stage["rss_start_mb"]),
+              fmt(stage["rss_end_mb"]), fmt(stage["process_peak_rss_mb"]), counts))
+
+        if report["total_time"] is not None:
+            logger.info("%-36s %10.3f" % ("total", report["total_time"]))
+
+_profiler = Profiler()
+
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+"""
+This script checks that the flag values read from a CSV batch manifest are parsed the way
+set_parameters() parses them.
+
+A CSV manifest is written with rows setting 'compute_centerlines' to "false", "0", "true" and
+leaving it empty. Only the "true" row must get a centerlines job, the other rows must keep reading
+their centerlines input file. The script exits with status 1 if any check fails.
+
+Example:
+
+    python test_batch_manifest.py
+"""
+import os
+import sys
+import tempfile
+
+from generate_1d_mesh import Args as MeshArgs
+from generate_1d_mesh_batch import ManifestFields, read_manifest, set_case_outputs, create_centerlines_jobs, is_set
+
+## The manifest rows, the compute_centerlines value and if the case computes centerlines.
+MANIFEST_ROWS = [ ("cl_false", "false", False), ("cl_zero", "0", False), ("cl_true", "true", True),
+  ("cl_empty", "", False) ]
+
+def write_manifest(file_name):
+    """ Write a CSV manifest with a case for each row in MANIFEST_ROWS.
+    """
+    fields = [ManifestFields.CASE_NAME, MeshArgs.MODEL_NAME, MeshArgs.COMPUTE_CENTERLINES, MeshArgs.SURFACE_MODEL,
+      MeshArgs.CENTERLINE_INPUT_FILE]
+    with open(file_name, "w") as file:
+        file.write(",".join(fields) + "\n")
+        for case_name, value, _ in MANIFEST_ROWS:
+            file.write(",".join([case_name, "model", value, "model.vtp", "centerlines.vtp"]) + "\n")
+
+def main():
+    num_failed = 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        manifest_file = os.path.join(directory, "manifest.csv")
+        write_manifest(manifest_file)
+        cases = read_manifest(manifest_file)
+        output_dir = os.path.join(directory, "output")
+        set_case_outputs(cases, output_dir)
+        flags = [ is_set(case, MeshArgs.COMPUTE_CENTERLINES) for case in cases ]
+        jobs = create_centerlines_jobs(cases, output_dir)
+        centerlines_file = os.path.join(directory, "centerlines.vtp")
+
+        for case, flag, (case_name, value, computes) in zip(cases, flags, MANIFEST_ROWS):
+            has_job = "_centerlines_key" in case
+            input_file = case.get(MeshArgs.CENTERLINE_INPUT_FILE)
+            ok = (has_job == computes) and (flag == computes)
+            if not computes:
+                ok = ok and (input_file == centerlines_file)
+            num_failed += not ok
+            print("%s: compute_centerlines='%s': centerlines job: %s input file: %s %s" % (case_name, value,
+              has_job, input_file, "ok" if ok else "FAILED"))
+
+        if len(jobs) != 1:
+            print("FAILED: %d centerlines jobs, expected 1." % len(jobs))
+            num_failed += 1
+
+    if num_failed != 0:
+        print("%d checks failed." % num_failed)
+        sys.exit(1)
+    print("All checks passed.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+"""
+This script checks that the group lengths and areas computed by Mesh.calculate_group_geometry() with
+np.bincount() are bit-for-bit identical to those computed by the original per-cell loop.
+
+The check is run for the bundled example centerlines and for synthetic branching trees created by
+the benchmark_mesh module. The script exits with status 1 if any value differs.
+
+Example:
+
+    python test_calculate_seg_lengths.py
+"""
+import os
+import sys
+
+import numpy as np
+import vtk.util.numpy_support as nps
+from vtk import vtkIdList
+
+from benchmark_mesh import SyntheticTree
+from mesh import Mesh
+from parameters import Parameters
+from utils import read_polydata
+
+## The bundled example centerlines.
+EXAMPLE_FILES = [ os.path.join("example", "SU201_2005_RPA1_cl.vtp"), os.path.join("input", "SU201_2005_RPA1_cl.vtp") ]
+
+## The synthetic trees (number of outlets, branching factor, points per vessel).
+SYNTHETIC_TREES = [ (10, 2, 20), (100, 3, 20), (1000, 2, 10) ]
+
+def calculate_group_geometry_loop(mesh, params):
+    """ Calculate the averaged group length, Ain and Aout using the original per-cell loop.
+    """
+    cl_geom = mesh.centerlines_geometry
+    group_elems = mesh.group_elems
+    field_name = mesh.PointDataFields.MAX_INSCRIBED_RADIUS
+    points_maxR = nps.vtk_to_numpy(cl_geom.GetPointData().GetArray(field_name))
+    points = cl_geom.GetPoints()
+    group_length = []
+    group_Ain = []
+    group_Aout = []
+
+    for i in range(mesh.num_groups):
+        tmpl = 0.0
+        tmpAin = 0.0
+        tmpAout = 0.0
+
+        for j in range(0,len(group_elems[i])):
+            ids = vtkIdList()
+            cl_geom.GetCellPoints(group_elems[i][j],ids)
+            num_ids = ids.GetNumberOfIds()
+            tmpAin = tmpAin + np.pi*points_maxR[ids.GetId(0)]**2
+            tmpAout = tmpAout + np.pi*points_maxR[ids.GetId(num_ids-1)]**2
+            for k in range(0,num_ids-2):
+                id1 = ids.GetId(k)
+                id2 = ids.GetId(k+1)
+                pt1 = np.array([points.GetPoint(id1)[0], points.GetPoint(id1)[1], points.GetPoint(id1)[2]])
+                pt2 = np.array([points.GetPoint(id2)[0], points.GetPoint(id2)[1], points.GetPoint(id2)[2]])
+                tmpl = tmpl + np.linalg.norm(pt2-pt1)
+
+        group_length.append(params.lcoef * tmpl/len(group_elems[i]))
+        group_Ain.append(params.Acoef * tmpAin/len(group_elems[i]))
+        group_Aout.append(params.Acoef * tmpAout/len(group_elems[i]))
+
+    return group_length, group_Ain, group_Aout
+
+def calculate_group_geometry_bincount(mesh, params, group_list):
+    """ Calculate the averaged group length, Ain and Aout as Mesh.calculate_seg_lengths() does.
+    """
+    sum_length, sum_Ain, sum_Aout, num_elems = mesh.calculate_group_geometry(group_list)
+    group_length = (params.lcoef * sum_length / num_elems).tolist()
+    group_Ain = (params.Acoef * sum_Ain / num_elems).tolist()
+    group_Aout = (params.Acoef * sum_Aout / num_elems).tolist()
+    return group_length, group_Ain, group_Aout
+
+def check_centerlines(name, centerlines_geometry):
+    """ Check the group geometry computed for a centerlines geometry.
+
+    Returns the number of values that differ.
+    """
+    mesh = Mesh()
+    mesh.centerlines_geometry = centerlines_geometry
+    fields = mesh.CellDataFields
+    centerline_list = mesh.get_cell_data(fields.CENTERLINE_IDS)
+    blank_list = mesh.get_cell_data(fields.BLANKING)
+    group_list = mesh.get_cell_data(fields.GROUP_IDS)
+    tract_list = mesh.get_cell_data(fields.TRACT_IDS)
+    mesh.num_groups = max(group_list)+1
+    mesh.set_topology(centerline_list, group_list, tract_list, blank_list)
+
+    num_diffs = 0
+    for units in [Parameters.Units.MM, Parameters.Units.CM]:
+        params = Parameters()
+        params.set_units(units)
+        expected = calculate_group_geometry_loop(mesh, params)
+        computed = calculate_group_geometry_bincount(mesh, params, group_list)
+        for value_name, expected_values, computed_values in zip(["length", "Ain", "Aout"], expected, computed):
+            diffs = [ i for i in range(mesh.num_groups) if computed_values[i] != expected_values[i] ]
+            num_diffs += len(diffs)
+            status = "ok" if len(diffs) == 0 else "FAILED: groups %s differ" % str(diffs)
+            print("%s: units %s: %d groups: %s %s" % (name, units, mesh.num_groups, value_name, status))
+
+    return num_diffs
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    num_diffs = 0
+
+    for file_name in EXAMPLE_FILES:
+        num_diffs += check_centerlines(file_name, read_polydata(os.path.join(script_dir, file_name)))
+
+    for num_outlets, branching_factor, num_points in SYNTHETIC_TREES:
+        tree = SyntheticTree(num_outlets, branching_factor)
+        name = "tree(%d outlets, branching %d)" % (num_outlets, branching_factor)
+        num_diffs += check_centerlines(name, tree.create_centerlines(num_points))
+
+    if num_diffs != 0:
+        print("%d values differ." % num_diffs)
+        sys.exit(1)
+    print("All values are identical.")
+
+if __name__ == '__main__':
+    main()
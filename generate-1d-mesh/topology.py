@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+"""
+This module is used to index the cells of centerlines that have been split and grouped along branches.
+
+A centerline consists of m cells. Each cell stores its centerline (path) ID, group ID, tract ID and
+blanking (0 non bifurcation, 1 bifurcation). The cells of a path are ordered from the inlet to the
+outlet so the n-th cell of a path has tract ID n.
+
+"""
+import numpy as np
+
+class CenterlineTopology(object):
+    """ The CenterlineTopology class is used to look up centerline cells by path and group.
+
+    The index is built in a single pass by sorting the cell data arrays so that lookups
+    do not need to scan all of the centerline cells.
+
+    Attributes:
+        num_cells (int): The number of centerline cells.
+        num_paths (int): The number of paths (centerlines from the inlet to an outlet).
+        num_groups (int): The number of groups.
+        path_elems (list[list[int]]): path_elems[i] records the element(line) indices for centerline id=i.
+        group_elems (list[list[int]]): group_elems[i] records the element(line) indices for group id=i.
+        group_blanking (ndarray[int]): The blanking of the first element of each group.
+    """
+
+    def __init__(self, centerline_list, group_list, tract_list, blank_list):
+        self.centerline_list = np.asarray(centerline_list, dtype=np.int64)
+        self.group_list = np.asarray(group_list, dtype=np.int64)
+        self.tract_list = np.asarray(tract_list, dtype=np.int64)
+        self.blank_list = np.asarray(blank_list, dtype=np.int64)
+
+        self.num_cells = self.centerline_list.shape[0]
+        self.num_paths = int(self.centerline_list[-1]) + 1
+        self.num_groups = int(self.group_list.max()) + 1
+
+        ## Sort cells by path and by group, a stable sort keeps the cells of each path
+        #  and group in increasing cell order.
+        self.path_order, self.path_offsets = self.sort_cells(self.centerline_list, self.num_paths)
+        self.group_order, self.group_offsets = self.sort_cells(self.group_list, self.num_groups)
+
+        self.path_elems = [self.path_order[self.path_offsets[i]:self.path_offsets[i+1]].tolist()
+          for i in range(self.num_paths)]
+        self.group_elems = [self.group_order[self.group_offsets[i]:self.group_offsets[i+1]].tolist()
+          for i in range(self.num_groups)]
+
+        first_elems = self.group_order[self.group_offsets[:-1]]
+        self.group_blanking = self.blank_list[first_elems]
+
+        ## For each cell find the groups of the cells one and two positions downstream and two
+        #  positions upstream along its path, -1 if there is no such cell.
+        self.bifurcation_group_list = self.get_path_neighbor_groups(1)
+        self.child_group_list = self.get_path_neighbor_groups(2)
+        self.parent_group_list = self.get_path_neighbor_groups(-2)
+
+    @staticmethod
+    def sort_cells(ids, num_ids):
+        """ Sort cell indices by ID.
+
+        Returns:
+            order (ndarray[int]): The cell indices sorted by ID.
+            offsets (ndarray[int]): The cells with ID i are order[offsets[i]:offsets[i+1]].
+        """
+        order = np.argsort(ids, kind='stable')
+        unique_ids, counts = np.unique(ids, return_counts=True)
+        num_cells = np.zeros(num_ids, dtype=np.int64)
+        num_cells[unique_ids] = counts
+        offsets = np.zeros(num_ids+1, dtype=np.int64)
+        offsets[1:] = np.cumsum(num_cells)
+        return order, offsets
+
+    def get_path_neighbor_groups(self, shift):
+        """ Get the group ID of the cell 'shift' positions from each cell along its path.
+        """
+        path_ids = self.centerline_list
+        position = self.tract_list + shift
+        path_length = self.path_offsets[path_ids+1] - self.path_offsets[path_ids]
+        valid = (position >= 0) & (position < path_length)
+
+        groups = np.full(self.num_cells, -1, dtype=np.int64)
+        cells = self.path_order[self.path_offsets[path_ids[valid]] + position[valid]]
+        groups[valid] = self.group_list[cells]
+        return groups
+
+    def path_cell(self, path_id, position):
+        """ Get the index of the cell at the given position along a path.
+        """
+        return int(self.path_order[self.path_offsets[path_id] + position])
+
+    def bifurcation_group(self, group_id):
+        """ Get the ID of the bifurcation group following a group.
+        """
+        return int(self.bifurcation_group_list[self.group_elems[group_id][0]])
+
+    def parent_group(self, group_id):
+        """ Get the ID of the group upstream of the bifurcation preceding a group.
+        """
+        return int(self.parent_group_list[self.group_elems[group_id][0]])
+
+    def child_groups(self, group_id):
+        """ Get the IDs of the groups downstream of the bifurcation following a group.
+
+        The child of the first element of the group is listed first followed by the
+        children of the remaining elements in reverse order.
+        """
+        elems = self.group_elems[group_id]
+        children = self.child_group_list[elems]
+        child_groups = [int(children[0])]
+
+        for child in children[:0:-1]:
+            if child not in child_groups:
+                child_groups.append(int(child))
+
+        return child_groups
+
@@ -5,7 +5,9 @@ The module contains utilities used to read files, calculate centers, etc.
 """
 
 import os.path
+import numpy as np
 import vtk
+from vtk.util.numpy_support import vtk_to_numpy
 
 import logging
 from manage import get_logger_name
@@ -16,21 +18,8 @@ SurfaceFileFormats = ["vtk", "vtp"]
 def get_polydata_centroid(poly_data):
     """ Calculate the centroid of polydata.
     """
-    x_list = []
-    y_list = []
-    z_list = []
-    cx = 0.0;
-    cy = 0.0;
-    cz = 0.0;
-    num_pts = poly_data.GetNumberOfPoints()
-
-    for i in range(num_pts): 
-        point = poly_data.GetPoints().GetPoint(i)
-        cx += point[0]
-        cy += point[1]
-        cz += point[2]
-
-    return [cx/num_pts, cy/num_pts, cz/num_pts]
+    points = vtk_to_numpy(poly_data.GetPoints().GetData())
+    return points.mean(axis=0, dtype=np.float64).tolist()
 
 
 def read_surface(file_name, file_format="vtp", datatype=None):
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+'''
+This module is used to write VTK XML .vtu and .vtp files with compressed appended raw binary data.
+
+The data arrays of a mesh are given as lists of NumPy arrays (pieces), for example one piece for each
+region of a merged mesh. The pieces are compressed and written one block at a time so the merged arrays
+are never created in memory.
+
+The file format is the same as that written by vtkXMLWriter using
+
+    SetDataModeToAppended()
+    EncodeAppendedDataOff()
+    SetHeaderTypeToUInt64()
+    SetCompressorTypeToZLib()
+'''
+
+import sys
+import zlib
+from xml.sax.saxutils import escape
+import numpy as np
+
+class VtkTypeNames(object):
+    '''This class maps NumPy data types to VTK XML data type names.
+    '''
+    names = {
+      np.dtype(np.int8): "Int8",
+      np.dtype(np.uint8): "UInt8",
+      np.dtype(np.int16): "Int16",
+      np.dtype(np.uint16): "UInt16",
+      np.dtype(np.int32): "Int32",
+      np.dtype(np.uint32): "UInt32",
+      np.dtype(np.int64): "Int64",
+      np.dtype(np.uint64): "UInt64",
+      np.dtype(np.float32): "Float32",
+      np.dtype(np.float64): "Float64"
+    }
+
+    @classmethod
+    def get(cls, dtype):
+        if dtype not in cls.names:
+            raise Exception("No VTK XML type for NumPy data type '" + str(dtype) + "'.")
+        return cls.names[dtype]
+
+class DataArray(object):
+    '''This class stores the pieces of a data array.
+
+       The pieces are converted to dtype (by default their common data type) when they are written. 
+       An optional shift is added to the values of each piece, for example to offset the point IDs 
+       of the cells of a region.
+    '''
+    def __init__(self, name, pieces, num_components=1, shifts=None, dtype=None):
+        self.name = name
+        self.num_components = num_components
+        self.dtype = np.dtype(dtype) if dtype != None else np.result_type(*pieces)
+        self.pieces = [np.ascontiguousarray(piece).reshape(-1) for piece in pieces]
+        self.shifts = shifts if shifts != None else [0]*len(pieces)
+        self.num_values = sum([piece.shape[0] for piece in self.pieces])
+        self.num_tuples = self.num_values // num_components
+        self.type_name = VtkTypeNames.get(self.dtype)
+
+    def get_chunks(self, chunk_size):
+        '''Get the values of the array in chunks of at most chunk_size values.
+        '''
+        for piece, shift in zip(self.pieces, self.shifts):
+            for start in range(0, piece.shape[0], chunk_size):
+                chunk = piece[start:start+chunk_size].astype(self.dtype, copy=False)
+                if shift != 0:
+                    chunk = chunk + self.dtype.type(shift)
+                yield chunk
+
+class AppendedWriter(object):
+    '''This class is used to write meshes to VTK XML files with compressed appended raw binary data.
+    '''
+    # The offset attributes are written as blanks and set after the appended data is written.
+    OFFSET_WIDTH = 20
+
+    def __init__(self, file_name, compression_level=5, block_size=32768):
+        self.file_name = file_name
+        self.compression_level = compression_level
+        self.block_size = block_size
+
+    def write_unstructured_grid(self, points, connectivity, offsets, cell_types, point_data=[], cell_data=[]):
+        '''Write a .vtu file.
+
+           offsets are the end offsets of the cells into connectivity.
+        '''
+        piece_attributes = [ ("NumberOfPoints", points.num_tuples), ("NumberOfCells", cell_types.num_tuples) ]
+        sections = [ ("PointData", point_data), ("CellData", cell_data), ("Points", [points]),
+          ("Cells", [connectivity, offsets, cell_types]) ]
+        self.write("UnstructuredGrid", piece_attributes, sections)
+
+    def write_polydata(self, points, connectivity, offsets, point_data=[], cell_data=[]):
+        '''Write a .vtp file with polygon cells.
+
+           offsets are the end offsets of the polygons into connectivity.
+        '''
+        piece_attributes = [ ("NumberOfPoints", points.num_tuples), ("NumberOfVerts", 0), ("NumberOfLines", 0),
+          ("NumberOfStrips", 0), ("NumberOfPolys", offsets.num_tuples) ]
+        sections = [ ("PointData", point_data), ("CellData", cell_data), ("Points", [points]),
+          ("Polys", [connectivity, offsets]) ]
+        self.write("PolyData", piece_attributes, sections)
+
+    def write(self, data_type, piece_attributes, sections):
+        '''Write the XML header and then the appended data for each array.
+        '''
+        byte_order = "LittleEndian" if sys.byteorder == "little" else "BigEndian"
+
+        with open(self.file_name, "wb") as file:
+            def write_line(indent, line):
+                file.write((" "*indent + line + "\n").encode())
+
+            write_line(0, '<?xml version="1.0"?>')
+            write_line(0, '<VTKFile type="{0:s}" version="1.0" byte_order="{1:s}" header_type="UInt64" compressor="vtkZLibDataCompressor">'.
+              format(data_type, byte_order))
+            write_line(2, '<{0:s}>'.format(data_type))
+            write_line(4, '<Piece ' + " ".join(['{0:s}="{1:d}"'.format(name, value) for name, value in piece_attributes]) + '>')
+
+            arrays = []
+            offset_positions = []
+            for section, section_arrays in sections:
+                write_line(6, '<{0:s}>'.format(section))
+                for array in section_arrays:
+                    file.write('        <DataArray type="{0:s}" Name="{1:s}" NumberOfComponents="{2:d}" format="appended" offset="'.
+                      format(array.type_name, escape(array.name, {'"':"&quot;"}), array.num_components).encode())
+                    offset_positions.append(file.tell())
+                    file.write((" "*self.OFFSET_WIDTH + '"/>\n').encode())
+                    arrays.append(array)
+                write_line(6, '</{0:s}>'.format(section))
+
+            write_line(4, '</Piece>')
+            write_line(2, '</{0:s}>'.format(data_type))
+            write_line(2, '<AppendedData encoding="raw">')
+            file.write(b"   _")
+
+            data_start = file.tell()
+            array_offsets = []
+            for array in arrays:
+                array_offsets.append(file.tell() - data_start)
+                self.write_array(file, array)
+
+            file.write(b"\n")
+            write_line(2, '</AppendedData>')
+            write_line(0, '</VTKFile>')
+
+            for position, offset in zip(offset_positions, array_offsets):
+                file.seek(position)
+                file.write(str(offset).ljust(self.OFFSET_WIDTH).encode())
+
+    def write_array(self, file, array):
+        '''Write the compressed blocks of an array.
+
+           The data is preceded by a header giving the number of blocks, the uncompressed block size,
+           the uncompressed size of the last block (0 if it is a full block) and the compressed size
+           of each block. The header is written after the blocks have been compressed.
+        '''
+        num_bytes = array.num_values * array.dtype.itemsize
+        num_blocks = -(-num_bytes // self.block_size)
+        header = np.zeros(3+num_blocks, dtype=np.uint64)
+        header[0] = num_blocks
+        header[1] = self.block_size
+        header[2] = num_bytes % self.block_size
+
+        header_position = file.tell()
+        file.write(header.tobytes())
+
+        for i, block in enumerate(self.get_blocks(array)):
+            compressed_block = zlib.compress(block, self.compression_level)
+            header[3+i] = len(compressed_block)
+            file.write(compressed_block)
+
+        end_position = file.tell()
+        file.seek(header_position)
+        file.write(header.tobytes())
+        file.seek(end_position)
+
+    def get_blocks(self, array):
+        '''Get the bytes of an array in blocks of block_size bytes.
+        '''
+        block_size = self.block_size
+        pending = bytearray()
+        chunk_size = max(1, 64*block_size // array.dtype.itemsize)
+
+        for chunk in array.get_chunks(chunk_size):
+            data = memoryview(chunk).cast("B")
+            start = 0
+            if len(pending) != 0:
+                start = min(block_size - len(pending), len(data))
+                pending += data[:start]
+                if len(pending) < block_size:
+                    continue
+                yield bytes(pending)
+                pending = bytearray()
+
+            while len(data) - start >= block_size:
+                yield data[start:start+block_size]
+                start += block_size
+            pending += data[start:]
+
+        if len(pending) != 0:
+            yield bytes(pending)
+
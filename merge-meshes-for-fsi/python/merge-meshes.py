@@ -12,12 +12,22 @@ named and classified as a cap or wall.
 
 The .vtu, .vtp, and .mdl files can then be used by the 'create-fsi-mesh-complete.py' script to create the mesh files needed
 for an FSI simulation.. 
+
+The --streaming option is used for large meshes. The solid boundary layer region is extracted using NumPy arrays and the
+merged meshes are written as compressed appended raw binary files directly from the fluid and solid region arrays, the 
+merged mesh is not created in memory. The --no-intermediate-files option skips writing the 'solid_mesh_bl.vtu' and 
+'solid_mesh_bl.vtp' files.
 '''
 
+from collections import OrderedDict
 import argparse
 import os
 import sys
+import numpy as np
 import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+
+from appended_writer import AppendedWriter, DataArray
 
 class Args(object):
     '''This class defines the command line arguments to the script.
@@ -26,6 +36,8 @@ class Args(object):
     FLUID_MESH = "fluid_mesh"
     SOLID_MESH = "solid_mesh"
     SOLID_REGION_ID = "solid_region_id"
+    STREAMING = "streaming"
+    NO_INTERMEDIATE_FILES = "no_intermediate_files"
 
 def cmd(name):
     '''Create an argparse command argument.
@@ -40,9 +52,140 @@ def parse_args():
     parser.add_argument(cmd(Args.FLUID_MESH),    help="The name of the fluid volume and surface meshes files.", required=True)
     parser.add_argument(cmd(Args.SOLID_MESH),    help="The name of the solid volume and surface meshes files.", required=True)
     parser.add_argument(cmd(Args.SOLID_REGION_ID), help="The solid region ID.", type=int, required=True)
+    parser.add_argument(cmd(Args.STREAMING), help="Write the merged meshes directly from the region arrays.", 
+      action="store_true", default=False)
+    parser.add_argument(cmd(Args.NO_INTERMEDIATE_FILES), help="Don't write the solid boundary layer mesh files.", 
+      action="store_true", default=False)
 
     return parser.parse_args(), parser.print_help
 
+class MeshArrays(object):
+    '''This class stores the points, cells and data arrays of a volume or surface mesh as NumPy arrays.
+
+       offsets[i] is the index into connectivity of the first point of cell i, offsets[-1] is the
+       length of connectivity. cell_types is None for a surface mesh.
+    '''
+    def __init__(self, points, offsets, connectivity, cell_types=None, point_data=None, cell_data=None):
+        self.points = points
+        self.offsets = offsets
+        self.connectivity = connectivity
+        self.cell_types = cell_types
+        self.point_data = point_data if point_data != None else OrderedDict()
+        self.cell_data = cell_data if cell_data != None else OrderedDict()
+        self.num_points = points.shape[0]
+        self.num_cells = offsets.shape[0] - 1
+
+    @staticmethod
+    def from_mesh(mesh):
+        '''Create a MeshArrays object from a vtkUnstructuredGrid or a vtkPolyData mesh.
+
+           The arrays reference the VTK data, they are not copied.
+        '''
+        if isinstance(mesh, vtk.vtkPolyData):
+            if mesh.GetNumberOfVerts() + mesh.GetNumberOfLines() + mesh.GetNumberOfStrips() != 0:
+                raise Exception("Only surface meshes with polygon cells can be merged.")
+            cells = mesh.GetPolys()
+            cell_types = None
+        else:
+            cells = mesh.GetCells()
+            # GetCellTypesArray() is deprecated in VTK 9.6.
+            try:
+                cell_types = vtk_to_numpy(mesh.GetCellTypes())
+            except TypeError:
+                cell_types = vtk_to_numpy(mesh.GetCellTypesArray())
+
+        return MeshArrays(vtk_to_numpy(mesh.GetPoints().GetData()), vtk_to_numpy(cells.GetOffsetsArray()), 
+          vtk_to_numpy(cells.GetConnectivityArray()), cell_types, get_data_arrays(mesh.GetPointData()), 
+          get_data_arrays(mesh.GetCellData()))
+
+    def extract_region(self, region_id):
+        '''Extract the cells with the given ModelRegionID.
+
+           As with vtkThreshold the points used by the cells are kept in their original order.
+        '''
+        cell_ids = np.nonzero(self.cell_data["ModelRegionID"] == region_id)[0]
+        offsets, connectivity = get_cells(self.offsets, self.connectivity, cell_ids)
+
+        used = np.zeros(self.num_points, dtype=bool)
+        used[connectivity] = True
+        point_ids = np.nonzero(used)[0]
+        point_map = np.cumsum(used) - 1
+        cell_types = None if self.cell_types is None else self.cell_types[cell_ids]
+
+        return MeshArrays(self.points[point_ids], offsets, point_map[connectivity], cell_types,
+          take_data_arrays(self.point_data, point_ids), take_data_arrays(self.cell_data, cell_ids))
+
+    def renumber_points(self):
+        '''Renumber points in the order they are first used by the cells, removing unused points.
+
+           This is the point order of a vtkDataSetSurfaceFilter output.
+        '''
+        point_ids, first_use = np.unique(self.connectivity, return_index=True)
+        point_ids = point_ids[np.argsort(first_use)]
+        point_map = np.zeros(self.num_points, dtype=np.int64)
+        point_map[point_ids] = np.arange(point_ids.shape[0])
+
+        return MeshArrays(self.points[point_ids], self.offsets, point_map[self.connectivity], self.cell_types,
+          take_data_arrays(self.point_data, point_ids), self.cell_data)
+
+def get_data_arrays(data):
+    '''Get the named numeric arrays of vtkPointData or vtkCellData as NumPy arrays.
+    '''
+    arrays = OrderedDict()
+    for i in range(data.GetNumberOfArrays()):
+        array = data.GetArray(i)
+        if (array is not None) and (array.GetName() != None):
+            arrays[array.GetName()] = vtk_to_numpy(array)
+    return arrays
+
+def take_data_arrays(arrays, ids):
+    '''Get the values of data arrays for the given point or cell IDs.
+    '''
+    return OrderedDict([ (name, values[ids]) for name, values in arrays.items() ])
+
+def get_cells(offsets, connectivity, cell_ids):
+    '''Get the offsets and connectivity of a subset of cells.
+    '''
+    sizes = offsets[cell_ids+1] - offsets[cell_ids]
+    new_offsets = np.zeros(cell_ids.shape[0]+1, dtype=np.int64)
+    np.cumsum(sizes, out=new_offsets[1:])
+    index = np.repeat(offsets[cell_ids] - new_offsets[:-1], sizes) + np.arange(new_offsets[-1])
+    return new_offsets, connectivity[index]
+
+def get_common_data_arrays(data_arrays):
+    '''Get the data arrays found in all meshes with the same number of components, as vtkAppendFilter does.
+    '''
+    common_arrays = []
+    for name, values in data_arrays[0].items():
+        pieces = [ arrays.get(name) for arrays in data_arrays ]
+        if any([ (piece is None) or (piece.shape[1:] != values.shape[1:]) for piece in pieces ]):
+            continue
+        num_components = 1 if values.ndim == 1 else values.shape[1]
+        common_arrays.append(DataArray(name, pieces, num_components))
+    return common_arrays
+
+def write_merged_mesh(file_name, meshes):
+    '''Write the merge of a list of MeshArrays objects to a .vtu or .vtp file.
+
+       The points and cells of the meshes are appended in order without merging points. 
+    '''
+    print("[write_merged_mesh] file_name: " + file_name)
+    point_shifts = np.cumsum([0] + [ mesh.num_points for mesh in meshes[:-1] ]).tolist()
+    offset_shifts = np.cumsum([0] + [ mesh.offsets[-1] for mesh in meshes[:-1] ]).tolist()
+
+    points = DataArray("Points", [ mesh.points for mesh in meshes ], 3)
+    connectivity = DataArray("connectivity", [ mesh.connectivity for mesh in meshes ], shifts=point_shifts, dtype=np.int64)
+    offsets = DataArray("offsets", [ mesh.offsets[1:] for mesh in meshes ], shifts=offset_shifts, dtype=np.int64)
+    point_data = get_common_data_arrays([ mesh.point_data for mesh in meshes ])
+    cell_data = get_common_data_arrays([ mesh.cell_data for mesh in meshes ])
+    writer = AppendedWriter(file_name)
+
+    if meshes[0].cell_types is None:
+        writer.write_polydata(points, connectivity, offsets, point_data, cell_data)
+    else:
+        cell_types = DataArray("types", [ mesh.cell_types for mesh in meshes ], dtype=np.uint8)
+        writer.write_unstructured_grid(points, connectivity, offsets, cell_types, point_data, cell_data)
+
 def read_surface_mesh(file_name):
     print("[read_surface_mesh] file_name: " + file_name)
     reader = vtk.vtkXMLPolyDataReader()
@@ -71,17 +214,9 @@ def write_volume_mesh(file_name, mesh):
     writer.Update()
     writer.Write()
 
-if __name__ == '__main__':
-
-    args, print_help = parse_args()
-
-    ## Create renderer and graphics window.
-    renderer = vtk.vtkRenderer()
-    renderer_win = vtk.vtkRenderWindow()
-    renderer_win.AddRenderer(renderer)
-    renderer.SetBackground(0.6, 0.6, 0.6)
-    renderer_win.SetSize(800, 800)
-
+def merge_meshes(args):
+    '''Merge the fluid and solid meshes using VTK filters.
+    '''
     # Read solid mesh and surface.
     solid_file_name = args.solid_mesh
     solid_mesh = read_volume_mesh(solid_file_name+'.vtu')
@@ -97,7 +232,8 @@ if __name__ == '__main__':
     threshold.SetUpperThreshold(region_id)
     threshold.Update();
     solid_mesh_bl = threshold.GetOutput()
-    write_volume_mesh('solid_mesh_bl.vtu', solid_mesh_bl)
+    if not args.no_intermediate_files:
+        write_volume_mesh('solid_mesh_bl.vtu', solid_mesh_bl)
 
     surf_threshold = vtk.vtkThreshold()
     surf_threshold.SetInputData(solid_surf)
@@ -110,7 +246,8 @@ if __name__ == '__main__':
     surface_filter.SetInputData(surf_threshold.GetOutput())
     surface_filter.Update()
     solid_surf_bl = surface_filter.GetOutput()
-    write_surface_mesh('solid_mesh_bl.vtp', solid_surf_bl)
+    if not args.no_intermediate_files:
+        write_surface_mesh('solid_mesh_bl.vtp', solid_surf_bl)
 
     # Read fluid mesh and surface.
     fluid_file_name = args.fluid_mesh
@@ -137,4 +274,41 @@ if __name__ == '__main__':
     fluid_solid_surf = surface_filter.GetOutput()
     write_surface_mesh('fluid_solid_surf.vtp', fluid_solid_surf)
 
+def merge_meshes_streaming(args):
+    '''Merge the fluid and solid meshes using NumPy arrays.
+
+       Each mesh is read, reduced to the arrays needed for the merge and then released so only 
+       the region arrays are kept in memory.
+    '''
+    # Extract solid extruded boundary layer (should be region ID 2).
+    #
+    region_id = int(args.solid_region_id)
+    solid_file_name = args.solid_mesh
+    solid_mesh_bl = MeshArrays.from_mesh(read_volume_mesh(solid_file_name+'.vtu')).extract_region(region_id)
+    if not args.no_intermediate_files:
+        write_merged_mesh('solid_mesh_bl.vtu', [solid_mesh_bl])
+
+    solid_surf_bl = MeshArrays.from_mesh(read_surface_mesh(solid_file_name+'.vtp')).extract_region(region_id)
+    solid_surf_bl = solid_surf_bl.renumber_points()
+    if not args.no_intermediate_files:
+        write_merged_mesh('solid_mesh_bl.vtp', [solid_surf_bl])
+
+    # Combine the solid and fluid meshes. 
+    fluid_file_name = args.fluid_mesh
+    fluid_mesh = MeshArrays.from_mesh(read_volume_mesh(fluid_file_name+'.vtu'))
+    write_merged_mesh('fluid_solid_mesh.vtu', [fluid_mesh, solid_mesh_bl])
+    fluid_mesh = None
+    solid_mesh_bl = None
+
+    fluid_surf = MeshArrays.from_mesh(read_surface_mesh(fluid_file_name+'.vtp')).renumber_points()
+    write_merged_mesh('fluid_solid_surf.vtp', [fluid_surf, solid_surf_bl])
+
+if __name__ == '__main__':
+
+    args, print_help = parse_args()
+
+    if args.streaming:
+        merge_meshes_streaming(args)
+    else:
+        merge_meshes(args)
 
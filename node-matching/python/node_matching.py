@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+
+'''
+This module is used to match the nodes of two meshes by their coordinates.
+
+Nodes are sorted by a key computed from their coordinates so that a query node can be found using a
+binary search. If the tolerance is 0.0 then nodes must match exactly. Otherwise nodes are binned into
+a uniform grid with cells at least the size of the tolerance and the nearest node within tolerance is 
+found by searching the 27 grid cells around the query node. All searches are done for arrays of nodes using NumPy.
+
+The nearest node to points without a node within tolerance is found by widening the search around them 
+to larger blocks of grid cells, the grid cells are not changed so the search is not slowed down by points 
+far from the nodes.
+
+Example:
+
+    from node_matching import NodeMatcher
+
+    matcher = NodeMatcher(points1, tolerance)
+    matches = matcher.match(points2)
+    print(matches.pairs, matches.unmatched, matches.num_duplicates)
+
+    index = find_nearest(points1, points2)
+'''
+
+import numpy as np
+
+class NodeMatches(object):
+    '''This class stores the result of matching query nodes to the nodes of a NodeMatcher.
+
+       The numbers of duplicate nodes are computed when they are first used.
+
+    Attributes:
+        pairs (np.ndarray): (N,2) array of matched node index pairs [node index, query node index].
+        distances (np.ndarray): The distance between the nodes of each pair.
+        unmatched (np.ndarray): The indices of the query nodes that were not matched.
+        unmatched_nodes (np.ndarray): The indices of the nodes not matched by any query node.
+        num_duplicates (int): The number of nodes within tolerance of a lower-index node.
+        num_query_duplicates (int): The number of query nodes within tolerance of a lower-index query node.
+    '''
+    def __init__(self, matcher, query_points, pairs, distances, unmatched, unmatched_nodes):
+        self.matcher = matcher
+        self.query_points = query_points
+        self.pairs = pairs
+        self.distances = distances
+        self.unmatched = unmatched
+        self.unmatched_nodes = unmatched_nodes
+        self._num_query_duplicates = None
+
+    @property
+    def num_duplicates(self):
+        '''The number of nodes within tolerance of a lower-index node.
+        '''
+        return self.matcher.num_duplicates
+
+    @property
+    def num_query_duplicates(self):
+        '''The number of query nodes within tolerance of a lower-index query node.
+        '''
+        if self._num_query_duplicates is None:
+            self._num_query_duplicates = NodeMatcher(self.query_points, self.matcher.tolerance).num_duplicates
+        return self._num_query_duplicates
+
+class NodeMatcher(object):
+    '''This class is used to find the nodes within a tolerance of query nodes.
+    '''
+    # The maximum number of grid cells along each axis, this keeps grid cell keys within int64.
+    MAX_GRID_CELLS = 2**20
+
+    def __init__(self, points, tolerance=0.0):
+        # Adding 0.0 converts -0.0 to 0.0 so they are matched.
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1,3) + 0.0
+        self.num_points = self.points.shape[0]
+        self.tolerance = tolerance
+        self._num_duplicates = None
+
+        if (tolerance > 0.0) and (self.num_points != 0):
+            # Grid cells may be larger than the tolerance, nodes within tolerance are 
+            # still in neighboring cells.
+            self.origin = self.points.min(axis=0)
+            extent = (self.points.max(axis=0) - self.origin).max()
+            self.cell_size = max(tolerance, extent / (self.MAX_GRID_CELLS-1))
+            cells = self.get_cells(self.points)
+            self.dims = cells.max(axis=0) + 1
+            keys = self.get_cell_keys(cells)
+        else:
+            keys = self.get_keys(self.points)
+
+        # A stable sort puts the lowest index first for nodes with the same key.
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+
+    @staticmethod
+    def get_keys(points):
+        '''Get a sortable key for each row of three coordinates.
+        '''
+        points = np.ascontiguousarray(points)
+        return points.view(np.dtype((np.void, points.dtype.itemsize*3))).ravel()
+
+    def get_cells(self, points):
+        '''Get the indices of the grid cells containing points.
+        '''
+        return np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+
+    def get_cell_keys(self, cells):
+        '''Get the key of grid cells, the cells along z have consecutive keys.
+        '''
+        return (cells[:,0]*self.dims[1] + cells[:,1])*self.dims[2] + cells[:,2]
+
+    @property
+    def num_duplicates(self):
+        '''The number of nodes within tolerance of a lower-index node.
+        '''
+        if self._num_duplicates is None:
+            index = self.find(self.points, np.arange(self.num_points))
+            self._num_duplicates = int(np.count_nonzero(index != -1))
+        return self._num_duplicates
+
+    def find(self, points, max_index=None):
+        '''Find the index of the nearest node within tolerance of each point, -1 if there is none.
+
+           If several nodes are at the same distance the lowest index is returned. If max_index is
+           given then only nodes with an index less than max_index[i] are considered for point i.
+        '''
+        points = np.asarray(points, dtype=np.float64).reshape(-1,3) + 0.0
+        index = np.full(points.shape[0], -1, dtype=np.int64)
+        if (self.num_points == 0) or (points.shape[0] == 0):
+            return index
+
+        if self.tolerance <= 0.0:
+            query_keys = self.get_keys(points)
+            start = np.searchsorted(self.keys, query_keys, side='left')
+            end = np.searchsorted(self.keys, query_keys, side='right')
+            return self.search(points, start, end, index, np.full(points.shape[0], np.inf), max_index)
+
+        ## Search the 3x3 rows of three grid cells along z around each point.
+        min_dist = np.full(points.shape[0], self.tolerance*self.tolerance)
+        cells = np.clip(np.floor((points - self.origin) / self.cell_size), -2, self.dims+1).astype(np.int64)
+        z_lo = np.maximum(cells[:,2]-1, 0)
+        z_hi = np.minimum(cells[:,2]+1, self.dims[2]-1)
+
+        for dx in (-1,0,1):
+            for dy in (-1,0,1):
+                x = cells[:,0] + dx
+                y = cells[:,1] + dy
+                valid = (x >= 0) & (x < self.dims[0]) & (y >= 0) & (y < self.dims[1]) & (z_lo <= z_hi)
+                row = (x*self.dims[1] + y)*self.dims[2]
+                start = np.searchsorted(self.keys, row + z_lo, side='left')
+                end = np.searchsorted(self.keys, row + z_hi, side='right')
+                end[~valid] = start[~valid]
+                self.search(points, start, end, index, min_dist, max_index)
+
+        return index
+
+    def search(self, points, start, end, index, min_dist, max_index=None):
+        '''Search the sorted nodes in [start, end) for the nearest node to each point.
+
+           index and min_dist are updated with the nearest node found so far, a node is accepted
+           if its squared distance is not more than min_dist.
+        '''
+        k = 0
+        while True:
+            active = np.nonzero(start + k < end)[0]
+            if active.shape[0] == 0:
+                break
+            candidates = self.order[start[active] + k]
+            if max_index is not None:
+                valid = candidates < max_index[active]
+                active = active[valid]
+                candidates = candidates[valid]
+            d = np.sum((self.points[candidates] - points[active])**2, axis=1)
+            closer = (d < min_dist[active]) | ((d == min_dist[active]) &
+              ((index[active] == -1) | (candidates < index[active])))
+            index[active[closer]] = candidates[closer]
+            min_dist[active[closer]] = d[closer]
+            k += 1
+        return index
+
+    def match(self, points):
+        '''Match points to nodes.
+        '''
+        points = np.asarray(points, dtype=np.float64).reshape(-1,3)
+        index = self.find(points)
+        matched = np.nonzero(index != -1)[0]
+        pairs = np.column_stack((index[matched], matched))
+        distances = np.sqrt(np.sum((self.points[index[matched]] - points[matched])**2, axis=1))
+
+        used = np.zeros(self.num_points, dtype=bool)
+        used[index[matched]] = True
+        unmatched = np.nonzero(index == -1)[0]
+        unmatched_nodes = np.nonzero(~used)[0]
+
+        return NodeMatches(self, points, pairs, distances, unmatched, unmatched_nodes)
+
+    def find_nearest(self, points, max_candidates=4000000):
+        '''Find the index of the nearest node to each point.
+
+           Points are first searched for within tolerance. For the remaining points the grid cells are
+           not changed, the searched cells are widened instead:
+
+              1) The block of cells within a half width of the grid cell nearest a point is searched, 
+                 the half width is doubled until a node is found. 
+
+              2) All nodes closer than this node are in the cells intersecting the sphere through it 
+                 around the point, these cells are searched for the nearest node.
+
+           If several nodes are at the same distance the lowest index is returned. The number of cells
+           searched grows with the distance to the nearest node in cell units so the tolerance should 
+           not be much smaller than the node spacing. At most about max_candidates nodes or rows of 
+           cells are processed at a time.
+        '''
+        if self.tolerance <= 0.0:
+            raise Exception("find_nearest() needs a NodeMatcher with a tolerance > 0.0.")
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1,3) + 0.0
+        index = self.find(points)
+        remaining = np.nonzero(index == -1)[0]
+        if (self.num_points == 0) or (remaining.shape[0] == 0):
+            return index
+
+        ## Find a node in the blocks of cells around the remaining points.
+        #
+        # Points outside the grid start at the nearest cell on its boundary.
+        #
+        points = points[remaining]
+        cells = np.clip(self.get_cells(points), 0, self.dims-1)
+        nearest = np.full(remaining.shape[0], -1, dtype=np.int64)
+        min_dist = np.full(remaining.shape[0], np.inf)
+        active = np.arange(remaining.shape[0])
+        half_width = 1
+
+        while active.shape[0] != 0:
+            num_rows = np.full(active.shape[0], np.prod(np.minimum(2*half_width+1, self.dims[:2])))
+            for batch in self.get_batches(num_rows, max_candidates):
+                ids = active[batch]
+                lo = np.maximum(cells[ids] - half_width, 0)
+                hi = np.minimum(cells[ids] + half_width, self.dims-1)
+                nearest[ids], min_dist[ids] = self.search_rows(points[ids], self.get_block_rows(lo, hi), max_candidates)
+            active = active[nearest[active] == -1]
+            half_width *= 2
+
+        ## Search the cells intersecting the sphere through the node found for each point.
+        #
+        diameters = np.minimum(2*np.sqrt(min_dist)/self.cell_size + 2, self.dims.max())
+        for batch in self.get_batches(diameters*diameters, max_candidates):
+            rows = self.get_sphere_rows(points[batch], np.sqrt(min_dist[batch]))
+            index[remaining[batch]], _ = self.search_rows(points[batch], rows, max_candidates)
+
+        return index
+
+    @staticmethod
+    def get_batches(sizes, max_size):
+        '''Split items into consecutive batches with a total size of about max_size.
+        '''
+        ends = np.cumsum(sizes)
+        start = 0
+        while start < ends.shape[0]:
+            end = max(start+1, np.searchsorted(ends, ends[start] - sizes[start] + max_size, side='right'))
+            yield np.arange(start, end)
+            start = end
+
+    def get_block_rows(self, lo, hi):
+        '''Get the rows of grid cells along z in the blocks of cells [lo, hi] around points.
+
+           Returns the point index, first cell key and last cell key of each row. 
+        '''
+        num_y = hi[:,1] - lo[:,1] + 1
+        num_rows = (hi[:,0] - lo[:,0] + 1) * num_y
+        ids = np.repeat(np.arange(lo.shape[0]), num_rows)
+        k = np.arange(num_rows.sum()) - np.repeat(np.cumsum(num_rows) - num_rows, num_rows)
+        x = lo[ids,0] + k // num_y[ids]
+        y = lo[ids,1] + k % num_y[ids]
+        row = (x*self.dims[1] + y)*self.dims[2]
+        return ids, row + lo[ids,2], row + hi[ids,2]
+
+    def get_sphere_rows(self, points, radii):
+        '''Get the rows of grid cells along z intersecting spheres around points.
+
+           The cells along x intersecting a sphere are found first, then the cells along y for each of
+           these and then the range of cells along z. Returns the point index, first cell key and last 
+           cell key of each row. 
+        '''
+        # The radii are in cell units, they are enlarged a little so that nodes on a sphere
+        # are not missed by rounding.
+        centers = (points - self.origin) / self.cell_size
+        radii = radii / self.cell_size * (1.0 + 1e-9) + 1e-9
+
+        def get_cells(axis, ids, dist2):
+            '''Get the cells along an axis within the remaining squared radius of a sphere.
+
+               Returns the index of the parent cell range, cell index and the squared distance 
+               of each cell from the sphere center.
+            '''
+            center = centers[ids,axis]
+            radius = np.sqrt(np.maximum(radii[ids]**2 - dist2, 0.0))
+            lo = np.maximum(np.floor(center - radius), 0).astype(np.int64)
+            hi = np.minimum(np.floor(center + radius), self.dims[axis]-1).astype(np.int64)
+            counts = np.where(dist2 <= radii[ids]**2, np.maximum(hi - lo + 1, 0), 0)
+            parents = np.repeat(np.arange(ids.shape[0]), counts)
+            cells = lo[parents] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            dist = np.maximum(np.maximum(cells - center[parents], center[parents] - (cells + 1)), 0.0)
+            return parents, cells, dist2[parents] + dist*dist
+
+        ids = np.arange(points.shape[0])
+        parents, x, dist2 = get_cells(0, ids, np.zeros(ids.shape[0]))
+        ids = ids[parents]
+        parents, y, dist2 = get_cells(1, ids, dist2)
+        ids = ids[parents]
+        x = x[parents]
+
+        center = centers[ids,2]
+        radius = np.sqrt(np.maximum(radii[ids]**2 - dist2, 0.0))
+        z_lo = np.maximum(np.floor(center - radius), 0).astype(np.int64)
+        z_hi = np.minimum(np.floor(center + radius), self.dims[2]-1).astype(np.int64)
+        keep = z_lo <= z_hi
+        row = (x*self.dims[1] + y)*self.dims[2]
+        return ids[keep], (row + z_lo)[keep], (row + z_hi)[keep]
+
+    def search_rows(self, points, rows, max_candidates):
+        '''Search the rows of grid cells of points for their nearest nodes.
+
+           Returns the index of the nearest node in the rows of each point (-1 if there are none) 
+           and its squared distance. The nodes are compared in chunks of about max_candidates nodes.
+        '''
+        ids, first_key, last_key = rows
+        nearest = np.full(points.shape[0], -1, dtype=np.int64)
+        min_dist = np.full(points.shape[0], np.inf)
+
+        start = np.searchsorted(self.keys, first_key, side='left')
+        end = np.searchsorted(self.keys, last_key, side='right')
+        keep = end > start
+        ids = ids[keep]
+        start = start[keep]
+        lengths = end[keep] - start
+
+        for chunk in self.get_batches(lengths, max_candidates):
+            chunk_lengths = lengths[chunk]
+            offsets = np.arange(chunk_lengths.sum()) - np.repeat(np.cumsum(chunk_lengths) - chunk_lengths, chunk_lengths)
+            candidates = self.order[np.repeat(start[chunk], chunk_lengths) + offsets]
+            candidate_ids = np.repeat(ids[chunk], chunk_lengths)
+            d = np.sum((self.points[candidates] - points[candidate_ids])**2, axis=1)
+
+            # The nearest candidate of each point is the first sorted by distance and then index.
+            order = np.lexsort((candidates, d, candidate_ids))
+            first = order[np.unique(candidate_ids[order], return_index=True)[1]]
+            point_ids = candidate_ids[first]
+            candidates = candidates[first]
+            d = d[first]
+            closer = (d < min_dist[point_ids]) | ((d == min_dist[point_ids]) & 
+              ((nearest[point_ids] == -1) | (candidates < nearest[point_ids])))
+            nearest[point_ids[closer]] = candidates[closer]
+            min_dist[point_ids[closer]] = d[closer]
+
+        return nearest, min_dist
+
+def find_nearest(nodes, points, tolerance=None):
+    '''Find the index of the nearest node to each point.
+
+       The nodes are binned into a grid with cells the size of the tolerance, see NodeMatcher.find_nearest().
+       The default tolerance is half the mean node spacing.
+    '''
+    nodes = np.asarray(nodes, dtype=np.float64).reshape(-1,3)
+    points = np.asarray(points, dtype=np.float64).reshape(-1,3)
+    if nodes.shape[0] == 0:
+        return np.full(points.shape[0], -1, dtype=np.int64)
+
+    if tolerance is None:
+        diagonal = np.linalg.norm(nodes.max(axis=0) - nodes.min(axis=0))
+        tolerance = 0.5 * diagonal / np.cbrt(nodes.shape[0]) if diagonal > 0.0 else 1.0
+
+    return NodeMatcher(nodes, tolerance).find_nearest(points)
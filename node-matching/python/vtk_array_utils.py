@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+'''
+This module has functions used to convert VTK cell and data arrays to and from NumPy arrays.
+
+The cells of a vtkCellArray are returned as NumPy offsets and connectivity arrays so that meshes can
+be split and copied using NumPy indexing rather than per-cell VTK calls. Both the VTK 9 cell array
+layout and the (n, id_1, ..., id_n) layout of older VTK versions are supported.
+
+Example:
+
+    from vtk_array_utils import get_cell_point_ids, create_cell_array
+
+    offsets, connectivity = get_cell_point_ids(mesh.GetPolys())
+    polydata.SetPolys(create_cell_array(offsets, connectivity))
+'''
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy, numpy_to_vtk, numpy_to_vtkIdTypeArray
+
+def get_cell_point_ids(cells):
+    '''Get the point IDs of the cells in a vtkCellArray as NumPy arrays.
+
+       offsets[i] is the index into connectivity of the first point of cell i.
+    '''
+    # VTK 9 stores cells as separate offsets and connectivity arrays.
+    if hasattr(cells, "GetOffsetsArray"):
+        offsets = vtk_to_numpy(cells.GetOffsetsArray()).astype(np.int64, copy=False)
+        connectivity = vtk_to_numpy(cells.GetConnectivityArray()).astype(np.int64, copy=False)
+        return offsets, connectivity
+
+    ## Older VTK versions store cells as (n, id_1, ..., id_n) runs.
+    #
+    # The position of the next run after a value is found for every value as if it were the
+    # size of a run. Following these positions from the first run finds all of the runs, the
+    # positions are doubled to follow 2, 4, 8, ... runs at a time.
+    #
+    cell_data = vtk_to_numpy(cells.GetData()).astype(np.int64)
+    num_cells = cells.GetNumberOfCells()
+    size = cell_data.shape[0]
+    next_run = np.append(np.minimum(np.arange(size) + cell_data + 1, size), size)
+    starts = np.zeros(min(num_cells, 1), dtype=np.int64)
+    while starts.shape[0] < num_cells:
+        starts = np.union1d(starts, next_run[starts])
+        starts = starts[starts < size]
+        next_run = next_run[next_run]
+
+    offsets = np.zeros(num_cells+1, dtype=np.int64)
+    np.cumsum(cell_data[starts], out=offsets[1:])
+    keep = np.ones(size, dtype=bool)
+    keep[starts] = False
+    return offsets, cell_data[keep]
+
+def create_cell_array(offsets, connectivity, id_type=True):
+    '''Create a vtkCellArray from NumPy offsets and connectivity arrays.
+
+       If id_type is True then vtkIdTypeArrays are used as vtkThreshold does, otherwise the 
+       vtkTypeInt64Arrays a vtkCellArray stores by default are used.
+    '''
+    cells = vtk.vtkCellArray()
+    if hasattr(cells, "GetOffsetsArray"):
+        array_type = vtk.VTK_ID_TYPE if id_type else vtk.VTK_TYPE_INT64
+        arrays = [ numpy_to_vtk(np.ascontiguousarray(values, dtype=np.int64), deep=True, array_type=array_type)
+          for values in (offsets, connectivity) ]
+        cells.SetData(arrays[0], arrays[1])
+    else:
+        sizes = offsets[1:] - offsets[:-1]
+        cell_data = np.insert(connectivity, offsets[:-1], sizes)
+        cells.SetCells(sizes.shape[0], numpy_to_vtkIdTypeArray(cell_data.astype(np.int64), deep=True))
+    return cells
+
+def get_cell_types(mesh):
+    '''Get the cell types of a vtkUnstructuredGrid as a NumPy array.
+    '''
+    # GetCellTypesArray() is deprecated in VTK 9.6.
+    try:
+        return vtk_to_numpy(mesh.GetCellTypes())
+    except TypeError:
+        return vtk_to_numpy(mesh.GetCellTypesArray())
+
+def take_array(array, ids):
+    '''Create a copy of a VTK data array containing the tuples with the given IDs.
+    '''
+    values = vtk_to_numpy(array)[ids]
+    new_array = numpy_to_vtk(np.ascontiguousarray(values), deep=True, array_type=array.GetDataType())
+    new_array.SetName(array.GetName())
+    return new_array
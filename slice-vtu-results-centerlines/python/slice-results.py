@@ -1,124 +1,131 @@
 #!/usr/bin/env python
 '''This script is used to extract slices of results along a centerline geomatry. 
+
+   Slices are extracted using a Slicer object, only the mesh cells near a centerline point are contoured.
+
+   Usage:
+
+       slice-results.py [ --centerlines-file CENTERLINES_FILE ] [ --results-file RESULTS_FILE ] 
+           [ --results-dir RESULTS_DIR ] [ --output-file OUTPUT_FILE ] [ --radius-scale RADIUS_SCALE ]
+           [ --pressure-name PRESSURE_NAME ] [ --velocity-name VELOCITY_NAME ] [ --workers NUM_WORKERS ]
+
+   The slices of RESULTS_FILE (default all_results_00500.vtu) are displayed and extracted interactively 
+   using keys:
+
+       a - Extract slices for all centerline points.
+       c - Select a centerline point and extract a slice.
+
+   If RESULTS_DIR is given the script runs without graphics. The slices of the first all_results_NNNNN.vtu
+   file in RESULTS_DIR are extracted once and the weights used to integrate point data over each slice 
+   are stored. The slice area, mean pressure and flux at each centerline point are then computed for each
+   time step from the weights and the results arrays. The results are written to OUTPUT_FILE (default
+   slice-results.npz) as arrays named
+
+       time_steps (T), points (P,3), normals (P,3), area (P), pressure (T,P), flux (T,P), files (T)
+
+   An OUTPUT_FILE with a .h5 or .hdf5 extension is written as an HDF5 file using h5py. Centerline points
+   without a slice have NaN values.
+
+   If NUM_WORKERS is greater than 1 then the slices for all centerline points (the 'a' key and the batch
+   mode) are extracted in parallel by NUM_WORKERS processes using a SlicerPool.
 '''
 from graphics import Graphics
+import argparse
+import importlib.util
 import os
 from os import path
+import re
 import sys
 import time
+import numpy as np
 import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+from slicer import Slicer, SlicerPool, SliceWeights
 
-def extract_all_slices(renderer, centerlines, mesh):
-    print('[extract_all_slices] ')
-    cl_points = centerlines.GetPoints()
-    num_cl_points = centerlines.GetNumberOfPoints()
-    normal_data = centerlines.GetPointData().GetArray("CenterlineSectionNormal")
-    print('[extract_all_slices] Number of centerline points: {0:d}'.format(num_cl_points))
+class Args(object):
+    '''This class defines the command line arguments.
+    '''
+    CENTERLINES_FILE = "centerlines_file"
+    RESULTS_FILE = "results_file"
+    RESULTS_DIR = "results_dir"
+    OUTPUT_FILE = "output_file"
+    RADIUS_SCALE = "radius_scale"
+    PRESSURE_NAME = "pressure_name"
+    VELOCITY_NAME = "velocity_name"
+    WORKERS = "workers"
+
+def cmd(name):
+    '''Create an argparse command argument.
+    '''
+    return "--" + name.replace("_", "-")
 
-    plane_dist = mesh.GetPointData().GetArray("plane_dist")
-    mesh.GetPointData().SetActiveScalars("plane_dist")
-    num_mesh_pts = mesh.GetNumberOfPoints()
-    mesh_points = mesh.GetPoints()
+def parse_args():
+    '''Parse command-line arguments.
+    '''
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(cmd(Args.CENTERLINES_FILE), help="The centerlines .vtp file.", default="centerlines.vtp")
+    parser.add_argument(cmd(Args.RESULTS_FILE), help="The results .vtu file to slice interactively.", 
+      default="all_results_00500.vtu")
+    parser.add_argument(cmd(Args.RESULTS_DIR), help="The directory of all_results_NNNNN.vtu files to integrate over slices.")
+    parser.add_argument(cmd(Args.OUTPUT_FILE), help="The .npz or .h5 file slice results are written to.", 
+      default="slice-results.npz")
+    parser.add_argument(cmd(Args.RADIUS_SCALE), help="The scale applied to centerline radii to cull cells.", 
+      type=float, default=2.0)
+    parser.add_argument(cmd(Args.PRESSURE_NAME), help="The name of the pressure array.", default="pressure")
+    parser.add_argument(cmd(Args.VELOCITY_NAME), help="The name of the velocity array.", default="velocity")
+    parser.add_argument(cmd(Args.WORKERS), help="The number of processes used to extract slices.", type=int, default=1)
+
+    return parser.parse_args()
+
+def get_centerline_planes(centerlines):
+    '''Get the points, section normals and MaximumInscribedSphereRadius values of centerlines as NumPy arrays.
+    '''
+    points = vtk_to_numpy(centerlines.GetPoints().GetData())
+    normals = vtk_to_numpy(centerlines.GetPointData().GetArray("CenterlineSectionNormal"))
+    radius_data = centerlines.GetPointData().GetArray("MaximumInscribedSphereRadius")
+    radii = None if radius_data is None else vtk_to_numpy(radius_data)
+    return points, normals, radii
 
-    cl_pt = 3*[0.0]
-    mesh_pt = 3*[0.0]
-    s = 2.0
+def extract_all_slices(**kwargs):
+    '''Extract slices at all centerline points.
+    '''
+    print('[extract_all_slices] ')
+    centerlines = kwargs['pick_geometry']
+    slicer = kwargs['data']
+    graphics = kwargs['graphics']
 
-    start_time = time.time()
+    points, normals, radii = get_centerline_planes(centerlines)
+    num_cl_points = points.shape[0]
+    print('[extract_all_slices] Number of centerline points: {0:d}'.format(num_cl_points))
 
-    for i in range(200,400):
-    #for i in range(2,num_cl_points-2):
-        cl_points.GetPoint(i, cl_pt)
-        normal = [normal_data.GetComponent(i,j) for j in range(3)]
-        #pt = [ cl_pt[i] + s*normal[i] for i in range(3) ]
-        #gr.add_line(renderer, cl_pt, pt, color=[1.0, 1.0, 1.0], width=2)
-
-        for j in range(num_mesh_pts):
-            mesh_points.GetPoint(j, mesh_pt)
-            d = sum( [ normal[k] * (mesh_pt[k] - cl_pt[k]) for k in range(3) ] )
-            plane_dist.SetValue(j, d)
-
-        contour = vtk.vtkContourGrid()
-        contour.SetInputData(mesh)
-        contour.SetValue(0, 0.0)
-        contour.Update()
-        iso_surface = contour.GetOutput()
-
-        conn_filter = vtk.vtkPolyDataConnectivityFilter()
-        conn_filter.SetInputData(iso_surface)
-        conn_filter.SetExtractionModeToSpecifiedRegions()
-
-        min_d = 1e6
-        min_comp = None
-        center = 3*[0.0]
-        rid = 0
-        cpt = 3*[0.0]
-        
-        while True:
-            conn_filter.AddSpecifiedRegion(rid)
-            conn_filter.Update()
-            component = vtk.vtkPolyData()
-            component.DeepCopy(conn_filter.GetOutput())
-            if component.GetNumberOfCells() <= 0:
-                break
-
-            conn_filter.DeleteSpecifiedRegion(rid)
-            
-            clean_filter = vtk.vtkCleanPolyData()
-            clean_filter.SetInputData(component)
-            clean_filter.Update();
-            component = clean_filter.GetOutput()
-
-            comp_points = component.GetPoints()
-            num_comp_points = component.GetNumberOfPoints()
-            num_comp_cells = component.GetNumberOfCells()
-
-            cx = 0.0
-            cy = 0.0
-            cz = 0.0
-            for j in range(num_comp_points):
-                comp_points.GetPoint(j, cpt)
-                cx += cpt[0]
-                cy += cpt[1]
-                cz += cpt[2]
-            center[0] = cx / num_comp_points
-            center[1] = cy / num_comp_points
-            center[2] = cz / num_comp_points
-
-            if d < min_d:
-                min_d = d
-                min_comp = component
-
-            rid += 1
-        #_while True
-
-        if i % 10 == 0:
-            gr.add_geometry(renderer, min_comp, color=[1.0,0,1])
-
-    #_for i in range(num_cl_points)
+    start_time = time.time()
+    slices = []
 
+    for slice in slicer.extract_slices(points, normals, radii):
+        slices.append(slice)
+        if (slice.index % 10 == 0) and (slice.geometry != None):
+            graphics.add_geometry(slice.geometry, color=[1.0,0,1])
 
     end_time = time.time()
     elapse_time = end_time - start_time
-    time_per_cl_pt = elapse_time / num_cl_points
+    time_per_cl_pt = elapse_time / max(num_cl_points, 1)
     print('[extract_all_slices] Elapse time: {0:g}'.format(elapse_time))
     print('[extract_all_slices] time per cl point: {0:g}'.format(time_per_cl_pt))
-
+    return slices
 
 def extract_slice(**kwargs):
     '''Extract a slice at a picked point.
     '''
-    #print('[extract_slice] ')
     node_id = kwargs['node_id']
-    #print('[extract_slice] node_id: {0:s}'.format(str(node_id)))
-    node_id = 75 
+    if node_id == None:
+        return
 
     centerlines = kwargs['pick_geometry']
-    points = centerlines.GetPoints()
-    node_pt = points.GetPoint(node_id)
+    points, normals, radii = get_centerline_planes(centerlines)
+    node_pt = points[node_id]
+    normal = normals[node_id]
     print('[extract_slice] point: {0:s}'.format(str(node_pt)))
-    normal_data = centerlines.GetPointData().GetArray("CenterlineSectionNormal")
-    normal = [normal_data.GetComponent(node_id,i) for i in range(3)]
     print('[extract_slice] normal: {0:s}'.format(str(normal)))
 
     graphics = kwargs['graphics']
@@ -126,86 +133,152 @@ def extract_slice(**kwargs):
     pt2 = [ node_pt[i] + s*normal[i] for i in range(3) ]
     graphics.add_line(node_pt, pt2, color=[1.0, 0.0, 0.0], width=2)
 
-    mesh = kwargs['data']
-    mesh_points = mesh.GetPoints()
-    num_pts = mesh.GetNumberOfPoints()
-    #print('[extract_slice] mesh num pts: {0:d}'.format(num_pts))
-    plane_dist = mesh.GetPointData().GetArray("plane_dist")
+    slicer = kwargs['data']
+    radius = None if radii is None else radii[node_id]
+    slice = slicer.extract_slice(node_id, node_pt, normal, radius)
+    print('[extract_slice] Number of cells contoured: {0:d}'.format(slice.num_cells))
+    print('[extract_slice] Number of components: {0:d}'.format(slice.num_components))
+    if slice.geometry == None:
+        return
 
-    for i in range(num_pts):
-        pt = mesh_points.GetPoint(i)
-        d = sum( [ normal[j] * (pt[j] - node_pt[j])  for j in range(3) ] )
-        plane_dist.SetValue(i, d)
+    graphics.add_geometry(slice.iso_surface, color=[0.5, 0.5, 0.5], wire=True)
+    graphics.add_geometry(slice.geometry, color=[1.0,0,1])
 
-    iso_surf = extract_isosurface(mesh, "plane_dist", 0.0)
-    graphics.add_geometry(iso_surf, color=[0.5, 0.5, 0.5], wire=True)
+def get_results_files(results_dir):
+    '''Get the all_results_NNNNN.vtu files in a directory sorted by time step.
+    '''
+    results_files = []
+    for file_name in os.listdir(results_dir):
+        match = re.match(r"all_results_(\d+)\.vtu$", file_name)
+        if match:
+            results_files.append((int(match.group(1)), path.join(results_dir, file_name)))
+    if len(results_files) == 0:
+        raise Exception("No all_results_NNNNN.vtu files found in '{0:s}'.".format(results_dir))
+    return sorted(results_files)
+
+def read_results(file_name, array_names):
+    '''Read a results .vtu file with only the given point data arrays.
+    '''
+    reader = vtk.vtkXMLUnstructuredGridReader()
+    reader.SetFileName(file_name)
+    reader.UpdateInformation()
+    reader.GetPointDataArraySelection().DisableAllArrays()
+    reader.GetCellDataArraySelection().DisableAllArrays()
+    for name in array_names:
+        reader.GetPointDataArraySelection().EnableArray(name)
+    reader.Update()
+    mesh = reader.GetOutput()
 
-    radius_data = centerlines.GetPointData().GetArray("MaximumInscribedSphereRadius")
-    radius = radius_data.GetValue(node_id)
-    #print('[extract_slice] radius: {0:g}'.format(radius))
-
-    conn_filter = vtk.vtkPolyDataConnectivityFilter()
-    conn_filter.SetInputData(iso_surf)
-    conn_filter.SetExtractionModeToSpecifiedRegions()
-
-    components = []
-    boundary_faces = {}
-    min_d = 1e6
-    min_comp = None
-
-    rid = 0
-    center = 3*[0.0]
-    while True:
-        conn_filter.AddSpecifiedRegion(rid)
-        conn_filter.Update()
-        component = vtk.vtkPolyData()
-        component.DeepCopy(conn_filter.GetOutput())
-        if component.GetNumberOfCells() <= 0:
-            break
-
-        #print('\n[extract_slice] ---- rid {0:d} ----'.format(rid))
-        conn_filter.DeleteSpecifiedRegion(rid)
-
-        if rid == 0:
-            color = [1.0, 0.0, 0.0]
-        elif rid == 1:
-            color = [0.0, 1.0, 0.0]
-        else:
-            color = [0.0, 0.0, 1.0]
-
-        clean_filter = vtk.vtkCleanPolyData()
-        clean_filter.SetInputData(component)
-        clean_filter.Update();
-        component = clean_filter.GetOutput()
-
-        comp_points = component.GetPoints()
-        num_comp_points = component.GetNumberOfPoints()
-        num_comp_cells = component.GetNumberOfCells()
-
-        cx = 0.0
-        cy = 0.0
-        cz = 0.0
-        for i in range(num_comp_points):
-            pt = comp_points.GetPoint(i)
-            cx += pt[0]
-            cy += pt[1]
-            cz += pt[2]
-        center[0] = cx / num_comp_points
-        center[1] = cy / num_comp_points
-        center[2] = cz / num_comp_points
-        #components.append(component)
-        d = sum( [ (center[j]-node_pt[j])*(center[j]-node_pt[j])  for j in range(3) ] )
-        #print('[extract_slice] num_comp_cells: {0:d}'.format(num_comp_cells))
-        #print('[extract_slice] num_comp_points: {0:d}'.format(num_comp_points))
-        #print('[extract_slice] center: {0:s}'.format(str(center)))
-        #print('[extract_slice] d: {0:g}'.format(d))
-        if d < min_d:
-            min_d = d
-            min_comp = component
-        rid += 1
-
-    #print('[extract_slice] min_d: {0:g}'.format(min_d))
-    graphics.add_geometry(min_comp, color=[1.0,0,1])
+    for name in array_names:
+        if mesh.GetPointData().GetArray(name) is None:
+            raise Exception("No '{0:s}' point data array in '{1:s}'.".format(name, file_name))
+    return mesh
+
+def check_output_file(file_name):
+    '''Check that slice results can be written to a file before the results are sliced.
+    '''
+    file_extension = path.splitext(file_name)[1]
+    if file_extension in (".h5", ".hdf5"):
+        if importlib.util.find_spec("h5py") is None:
+            raise Exception("h5py is needed to write HDF5 files, use a .npz output file.")
+    elif file_extension != ".npz":
+        raise Exception("Unknown output file extension '{0:s}', use a .npz, .h5 or .hdf5 file.".format(file_extension))
+
+    directory = path.dirname(path.abspath(file_name))
+    if not path.isdir(directory):
+        raise Exception("The output file directory '{0:s}' does not exist.".format(directory))
+
+def write_slice_results(file_name, results):
+    '''Write slice results to a NumPy .npz file or an HDF5 file.
+    '''
+    file_extension = path.splitext(file_name)[1]
+    if file_extension in (".h5", ".hdf5"):
+        import h5py
+        with h5py.File(file_name, "w") as file:
+            for name, values in results.items():
+                if values.dtype.kind == "U":
+                    values = values.astype(h5py.string_dtype())
+                file.create_dataset(name, data=values)
+    else:
+        np.savez(file_name, **results)
+
+def integrate_results(args):
+    '''Compute the slice area, mean pressure and flux at each centerline point for each time step.
+
+       The slice weights are computed once from the first results file, the slice integrals for each
+       time step are then sparse matrix-vector products with its pressure and velocity arrays.
+    '''
+    check_output_file(args.output_file)
+    results_files = get_results_files(args.results_dir)
+    array_names = [args.pressure_name, args.velocity_name]
+    print('[integrate_results] Number of results files: {0:d}'.format(len(results_files)))
+
+    centerlines = read_centerlines(args.centerlines_file)
+    points, normals, radii = get_centerline_planes(centerlines)
+    num_cl_points = points.shape[0]
+    print('[integrate_results] Number of centerline points: {0:d}'.format(num_cl_points))
+
+    ## Extract the slices and compute their weights.
+    #
+    start_time = time.time()
+    mesh = read_results(results_files[0][1], array_names)
+    num_pts = mesh.GetNumberOfPoints()
+    if args.workers > 1:
+        slicer = SlicerPool(mesh, args.workers, args.radius_scale)
+    else:
+        slicer = Slicer(mesh, args.radius_scale)
+    slice_weights = SliceWeights(num_cl_points)
+    has_slice = np.zeros(num_cl_points, dtype=bool)
+
+    try:
+        for slice in slicer.extract_slices(points, normals, radii, weights=True):
+            if slice.geometry is None:
+                print('[integrate_results] No slice at centerline point {0:d}'.format(slice.index))
+                continue
+            slice_weights.add_slice(slice.index, *slice.weights)
+            has_slice[slice.index] = True
+    finally:
+        if args.workers > 1:
+            slicer.close()
+
+    print('[integrate_results] Slice weights time: {0:g}'.format(time.time() - start_time))
+
+    ## Integrate the results of each time step.
+    #
+    start_time = time.time()
+    num_steps = len(results_files)
+    unit_normals = normals / np.linalg.norm(normals, axis=1)[:,None]
+    area = np.where(has_slice, slice_weights.areas, np.nan)
+    pressure = np.full((num_steps, num_cl_points), np.nan)
+    flux = np.full((num_steps, num_cl_points), np.nan)
+
+    for i, (time_step, file_name) in enumerate(results_files):
+        if i != 0:
+            mesh = read_results(file_name, array_names)
+        if mesh.GetNumberOfPoints() != num_pts:
+            raise Exception("The mesh of '{0:s}' has {1:d} points, expected {2:d}.".format(file_name,
+              mesh.GetNumberOfPoints(), num_pts))
+        print('[integrate_results] Time step: {0:d}'.format(time_step))
+
+        point_data = mesh.GetPointData()
+        pressure_int = slice_weights.integrate(vtk_to_numpy(point_data.GetArray(args.pressure_name)))
+        velocity_int = slice_weights.integrate(vtk_to_numpy(point_data.GetArray(args.velocity_name)))
+        pressure[i, has_slice] = pressure_int[has_slice] / area[has_slice]
+        flux[i, has_slice] = np.sum(velocity_int * unit_normals, axis=1)[has_slice]
+
+    print('[integrate_results] Integration time: {0:g}'.format(time.time() - start_time))
+
+    results = {
+      "time_steps": np.array([time_step for time_step, _ in results_files]),
+      "points": points.astype(np.float64),
+      "normals": unit_normals,
+      "area": area,
+      "pressure": pressure,
+      "flux": flux,
+      "files": np.array([path.basename(file_name) for _, file_name in results_files])
+    }
+    write_slice_results(args.output_file, results)
+    print('[integrate_results] Results written to: {0:s}'.format(args.output_file))
 
 def extract_isosurface(mesh, name, iso_value):
     data = mesh.GetPointData().GetArray(name)
@@ -260,41 +333,42 @@ def read_centerlines(file_name):
     return geometry 
 
 def main():
+    args = parse_args()
+
+    if args.results_dir != None:
+        integrate_results(args)
+        return
 
     ## Create graphics interface.   
     graphics = Graphics()
 
-    file_name = 'centerlines.vtp'
-    centerlines = read_centerlines(file_name)
+    centerlines = read_centerlines(args.centerlines_file)
     graphics.add_geometry(centerlines, color=[0.0, 0.6, 0.0], line_width=3)
 
-    file_name = 'all_results_00500.vtu'
-    mesh, surface = read_mesh(file_name)
+    mesh, surface = read_mesh(args.results_file)
     #graphics.add_geometry(surface, color=[0.8, 0.8, 0.8], wire=True)
 
     num_pts = mesh.GetNumberOfPoints()
     print('[main] mesh num pts: {0:d}'.format(num_pts))
-    plane_dist = vtk.vtkDoubleArray()
-    plane_dist.SetName("plane_dist")
-    plane_dist.SetNumberOfComponents(1)
-    plane_dist.SetNumberOfTuples(num_pts)
-    for i in range(num_pts):
-        plane_dist.SetValue(i,0.0)
-    mesh.GetPointData().AddArray(plane_dist)
-
-    # extract_all_slices(renderer, centerlines, mesh)
+    slicer = Slicer(mesh, args.radius_scale)
+    slicer_pool = SlicerPool(mesh, args.workers, args.radius_scale) if args.workers > 1 else None
 
     ## Create a mouse interactor for selecting centerline points.
     picking_keys = ['c']
     event_table = None
     event_table = {
-        'c': (extract_slice, mesh),
+        'a': (extract_all_slices, slicer if slicer_pool is None else slicer_pool),
+        'c': (extract_slice, slicer),
     }
 
     graphics.init_picking(centerlines, picking_keys, event_table)
 
     ## Display window.
-    graphics.show()
+    try:
+        graphics.show()
+    finally:
+        if slicer_pool is not None:
+            slicer_pool.close()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,648 @@
+#!/usr/bin/env python
+
+'''
+This module is used to extract slices of a volume mesh on planes defined by centerline points and normals.
+
+Mesh cells are culled for each plane using their bounding spheres: a cell is a candidate if its bounding
+sphere intersects the plane and a sphere at the centerline point with radius radius_scale times the
+MaximumInscribedSphereRadius. The candidate cells are found using a static bounding box tree of the mesh
+cells (CellTree), the tree is searched for a batch of planes using NumPy. Only the candidate cells are 
+contoured, the slice is the contour component with the center nearest the centerline point. Contour 
+components are labeled using a single connectivity pass.
+
+If the selected component extends outside the culling sphere it may have been cut short so the culling
+radius is doubled and the slice extracted again.
+
+The weights used to integrate mesh point data over a slice are computed once from the slice geometry
+and stored in a SliceWeights object, the integrals of the data for all slices are then computed as a
+sparse matrix-vector product for each time step.
+
+Slices can be extracted in parallel using a SlicerPool. The mesh points, cells and point data arrays 
+are copied once into shared memory and each worker process creates a Slicer for the shared mesh. Ranges
+of centerline points are extracted by the workers, the slices are returned in centerline point order.
+
+Example:
+
+    from slicer import Slicer
+
+    slicer = Slicer(mesh)
+    for slice in slicer.extract_slices(points, normals, radii):
+        print(slice.index, slice.geometry.GetNumberOfPoints())
+'''
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import os
+import sys
+import numpy as np
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy, numpy_to_vtk, numpy_to_vtkIdTypeArray
+
+# The node matching and VTK array modules are in the node-matching directory of this repository.
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "node-matching", "python"))
+from node_matching import NodeMatcher
+from vtk_array_utils import get_cell_point_ids, create_cell_array, get_cell_types
+
+## The edges of linear 3D cells, the contour points of a cell are on its edges.
+cell_edges = {
+  vtk.VTK_TETRA: [(0,1), (1,2), (2,0), (0,3), (1,3), (2,3)],
+  vtk.VTK_HEXAHEDRON: [(0,1), (1,2), (2,3), (3,0), (4,5), (5,6), (6,7), (7,4), (0,4), (1,5), (2,6), (3,7)],
+  vtk.VTK_WEDGE: [(0,1), (1,2), (2,0), (3,4), (4,5), (5,3), (0,3), (1,4), (2,5)],
+  vtk.VTK_PYRAMID: [(0,1), (1,2), (2,3), (3,0), (0,4), (1,4), (2,4), (3,4)]
+}
+
+class Slice(object):
+    '''This class stores the slice extracted at a centerline point.
+
+    Attributes:
+        index (int): The index of the centerline point.
+        point (np.ndarray): The centerline point.
+        normal (np.ndarray): The unit normal of the slice plane.
+        radius (float): The radius of the culling sphere used to extract the slice.
+        num_cells (int): The number of candidate cells contoured.
+        cell_ids (np.ndarray): The IDs of the candidate cells contoured.
+        num_components (int): The number of contour components.
+        iso_surface (vtkPolyData): The contour of the candidate cells.
+        geometry (vtkPolyData): The contour component nearest the centerline point, None if the plane
+            does not cut the mesh.
+        weights (tuple): The mesh point IDs, weights and area used to integrate point data over the
+            slice if they were computed, see Slicer.get_slice_weights().
+    '''
+    def __init__(self, index, point, normal, radius):
+        self.index = index
+        self.point = point
+        self.normal = normal
+        self.radius = radius
+        self.num_cells = 0
+        self.cell_ids = None
+        self.num_components = 0
+        self.iso_surface = None
+        self.geometry = None
+        self.weights = None
+
+    def __getstate__(self):
+        '''Get the state of a slice for pickling.
+
+           The geometry is stored as NumPy arrays, the iso_surface is not kept.
+        '''
+        state = self.__dict__.copy()
+        state["iso_surface"] = None
+        if self.geometry is not None:
+            offsets, connectivity = get_cell_point_ids(self.geometry.GetPolys())
+            point_data = self.geometry.GetPointData()
+            arrays = [ (point_data.GetArray(i).GetName(), vtk_to_numpy(point_data.GetArray(i)).copy(), 
+              point_data.GetArray(i).GetDataType()) for i in range(point_data.GetNumberOfArrays()) ]
+            state["geometry"] = (vtk_to_numpy(self.geometry.GetPoints().GetData()).copy(), offsets.copy(), 
+              connectivity.copy(), arrays)
+        return state
+
+    def __setstate__(self, state):
+        '''Set the state of an unpickled slice.
+        '''
+        self.__dict__.update(state)
+        if self.geometry is not None:
+            points, offsets, connectivity, arrays = self.geometry
+            self.geometry = vtk.vtkPolyData()
+            self.geometry.SetPoints(vtk.vtkPoints())
+            self.geometry.GetPoints().SetData(numpy_to_vtk(points, deep=True))
+            self.geometry.SetPolys(create_cell_array(offsets, connectivity))
+            for name, values, data_type in arrays:
+                array = numpy_to_vtk(values, deep=True, array_type=data_type)
+                array.SetName(name)
+                self.geometry.GetPointData().AddArray(array)
+
+class SliceWeights(object):
+    '''This class stores the weights used to integrate mesh point data over the slices at centerline points.
+
+       The weights are a sparse matrix stored in coordinate format, the row of a slice gives the weight
+       of each mesh point in the integral over the slice. 
+    '''
+    def __init__(self, num_slices):
+        self.num_slices = num_slices
+        self.areas = np.zeros(num_slices)
+        self.row_list = []
+        self.column_list = []
+        self.weight_list = []
+        self.rows = None
+
+    def add_slice(self, row, point_ids, weights, area):
+        '''Add the weights of a slice.
+        '''
+        self.row_list.append(np.full(point_ids.shape[0], row, dtype=np.int64))
+        self.column_list.append(point_ids)
+        self.weight_list.append(weights)
+        self.areas[row] = area
+        self.rows = None
+
+    def integrate(self, values):
+        '''Integrate point data over the slices.
+
+           values is a (num_points,) or (num_points, num_components) array. The integrals are computed 
+           as a sparse matrix-vector product for each component.
+        '''
+        if self.rows is None:
+            self.rows = np.concatenate(self.row_list + [np.zeros(0, dtype=np.int64)])
+            self.columns = np.concatenate(self.column_list + [np.zeros(0, dtype=np.int64)])
+            self.weights = np.concatenate(self.weight_list + [np.zeros(0)])
+
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            return np.bincount(self.rows, weights=self.weights*values[self.columns], minlength=self.num_slices)
+
+        values = values[self.columns]
+        return np.column_stack([ np.bincount(self.rows, weights=self.weights*values[:,i], minlength=self.num_slices) 
+          for i in range(values.shape[1]) ])
+
+def spread_bits(values):
+    '''Spread the lower 10 bits of integers so there are two zero bits between each bit.
+    '''
+    values = (values | (values << 16)) & 0x030000FF
+    values = (values | (values << 8)) & 0x0300F00F
+    values = (values | (values << 4)) & 0x030C30C3
+    values = (values | (values << 2)) & 0x09249249
+    return values
+
+class CellTree(object):
+    '''This class is a static bounding box tree of mesh cells.
+
+       Cells are sorted by the Morton code of their centers and grouped into leaves of leaf_size cells. 
+       Each level of the tree groups branching nodes of the level below. The box of a node contains the 
+       bounding spheres of its cells. 
+    '''
+    def __init__(self, centers, radii, leaf_size=16, branching=8):
+        self.centers = centers
+        self.radii = radii
+        self.leaf_size = leaf_size
+        self.branching = branching
+        num_cells = centers.shape[0]
+
+        # Sort cells by the Morton code of their centers on a 1024^3 grid.
+        origin = centers.min(axis=0)
+        extent = max((centers.max(axis=0) - origin).max(), 1e-30)
+        cells = np.minimum(((centers - origin) / extent * 1024).astype(np.int64), 1023)
+        codes = spread_bits(cells[:,0]) | (spread_bits(cells[:,1]) << 1) | (spread_bits(cells[:,2]) << 2)
+        self.order = np.argsort(codes, kind='stable')
+
+        ## Create the node boxes a level at a time, the levels are stored root first.
+        box_min = (centers - radii[:,None])[self.order]
+        box_max = (centers + radii[:,None])[self.order]
+        starts = np.arange(0, num_cells, leaf_size)
+        self.levels = []
+
+        while True:
+            box_min = np.minimum.reduceat(box_min, starts, axis=0)
+            box_max = np.maximum.reduceat(box_max, starts, axis=0)
+            self.levels.insert(0, (box_min, box_max))
+            if box_min.shape[0] == 1:
+                break
+            starts = np.arange(0, box_min.shape[0], branching)
+
+    def find_cells(self, points, normals, radii):
+        '''Find the cells whose bounding spheres intersect each plane and the sphere of the given radius 
+           at the plane point. 
+
+           The (plane, node) pairs for all planes are tested a level at a time. Returns a list of sorted 
+           cell ID arrays.
+        '''
+        num_planes = points.shape[0]
+        if self.centers.shape[0] == 0:
+            return [np.zeros(0, dtype=np.int64) for i in range(num_planes)]
+
+        plane = np.arange(num_planes)
+        node = np.zeros(num_planes, dtype=np.int64)
+
+        for level, (box_min, box_max) in enumerate(self.levels):
+            if level != 0:
+                node = (node[:,None]*self.branching + np.arange(self.branching)).reshape(-1)
+                plane = np.repeat(plane, self.branching)
+                valid = node < box_min.shape[0]
+                node = node[valid]
+                plane = plane[valid]
+
+            lo = box_min[node]
+            hi = box_max[node]
+            p = points[plane]
+            n = normals[plane]
+            r = radii[plane]
+            point_dist = np.sum(np.maximum(np.maximum(lo - p, p - hi), 0.0)**2, axis=1)
+            plane_dist = np.abs(np.sum(n * ((lo + hi) / 2.0 - p), axis=1))
+            keep = (point_dist <= r*r) & (plane_dist <= np.sum(np.abs(n) * (hi - lo) / 2.0, axis=1))
+            node = node[keep]
+            plane = plane[keep]
+
+        ## Test the bounding spheres of the cells of the leaves found.
+        num_cells = self.centers.shape[0]
+        index = (node[:,None]*self.leaf_size + np.arange(self.leaf_size)).reshape(-1)
+        plane = np.repeat(plane, self.leaf_size)
+        valid = index < num_cells
+        cells = self.order[index[valid]]
+        plane = plane[valid]
+
+        c = self.centers[cells]
+        cell_radii = self.radii[cells]
+        p = points[plane]
+        keep = np.abs(np.sum(normals[plane] * (c - p), axis=1)) <= cell_radii
+        keep &= np.sum((c - p)**2, axis=1) <= (radii[plane] + cell_radii)**2
+        cells = cells[keep]
+        plane = plane[keep]
+
+        order = np.lexsort((cells, plane))
+        cells = cells[order]
+        bounds = np.searchsorted(plane[order], np.arange(num_planes+1))
+        return [cells[bounds[i]:bounds[i+1]] for i in range(num_planes)]
+
+class Slicer(object):
+    '''This class is used to extract slices of a volume mesh.
+    '''
+    # The name of the point data array giving the distance to a slice plane.
+    PLANE_DIST = "plane_dist"
+
+    def __init__(self, mesh, radius_scale=2.0):
+        self.mesh = mesh
+        self.radius_scale = radius_scale
+
+        self.mesh_points = vtk_to_numpy(mesh.GetPoints().GetData())
+        self.points = self.mesh_points.astype(np.float64, copy=False)
+        self.offsets, self.connectivity = get_cell_point_ids(mesh.GetCells())
+        self.cell_types = get_cell_types(mesh)
+        self.point_data = mesh.GetPointData()
+        self.num_cells = self.cell_types.shape[0]
+
+        ## Compute the cell bounding spheres.
+        #
+        # The sphere centers are the centers of the cell bounding boxes.
+        cell_points = self.points[self.connectivity]
+        starts = self.offsets[:-1]
+        bbox_min = np.minimum.reduceat(cell_points, starts, axis=0)
+        bbox_max = np.maximum.reduceat(cell_points, starts, axis=0)
+        self.cell_centers = (bbox_min + bbox_max) / 2.0
+        sizes = np.diff(self.offsets)
+        dist = np.sum((cell_points - np.repeat(self.cell_centers, sizes, axis=0))**2, axis=1)
+        self.cell_radii = np.sqrt(np.maximum.reduceat(dist, starts))
+
+        self.cell_tree = CellTree(self.cell_centers, self.cell_radii)
+
+    def get_candidate_cells(self, points, normals, radii):
+        '''Get the candidate cells for each plane.
+
+           A cell is a candidate if its bounding sphere intersects the plane and the sphere of the given
+           radius at the plane point. Returns a list of cell ID arrays.
+        '''
+        return self.cell_tree.find_cells(points, normals, radii)
+
+    def contour_cells(self, cell_ids, point, normal):
+        '''Contour the plane distance for the given cells.
+        '''
+        sizes = self.offsets[cell_ids+1] - self.offsets[cell_ids]
+        offsets = np.zeros(cell_ids.shape[0]+1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        index = np.repeat(self.offsets[cell_ids] - offsets[:-1], sizes) + np.arange(offsets[-1])
+        point_ids, connectivity = np.unique(self.connectivity[index], return_inverse=True)
+
+        points = vtk.vtkPoints()
+        points.SetData(numpy_to_vtk(self.mesh_points[point_ids], deep=True))
+        types = numpy_to_vtk(np.ascontiguousarray(self.cell_types[cell_ids]), deep=True, array_type=vtk.VTK_UNSIGNED_CHAR)
+        grid = vtk.vtkUnstructuredGrid()
+        grid.SetPoints(points)
+        grid.SetCells(types, create_cell_array(offsets, connectivity.reshape(-1)))
+
+        # Copy the point data arrays so they are interpolated to the slice.
+        for i in range(self.point_data.GetNumberOfArrays()):
+            array = self.point_data.GetArray(i)
+            if (array is None) or (array.GetName() == self.PLANE_DIST):
+                continue
+            values = numpy_to_vtk(np.ascontiguousarray(vtk_to_numpy(array)[point_ids]), deep=True,
+              array_type=array.GetDataType())
+            values.SetName(array.GetName())
+            grid.GetPointData().AddArray(values)
+
+        plane_dist = numpy_to_vtk((self.points[point_ids] - point).dot(normal), deep=True)
+        plane_dist.SetName(self.PLANE_DIST)
+        grid.GetPointData().AddArray(plane_dist)
+        grid.GetPointData().SetActiveScalars(self.PLANE_DIST)
+
+        contour = vtk.vtkContourGrid()
+        contour.SetInputData(grid)
+        contour.SetValue(0, 0.0)
+        contour.Update()
+        return contour.GetOutput()
+
+    def get_nearest_component(self, iso_surface, point):
+        '''Get the connected component of a contour with the center nearest a point.
+
+           The components are labeled with a single connectivity pass. Returns the component and the 
+           number of components.
+        '''
+        conn_filter = vtk.vtkPolyDataConnectivityFilter()
+        conn_filter.SetInputData(iso_surface)
+        conn_filter.SetExtractionModeToAllRegions()
+        conn_filter.ColorRegionsOn()
+        conn_filter.Update()
+        regions = conn_filter.GetOutput()
+        num_regions = conn_filter.GetNumberOfExtractedRegions()
+
+        ## Find the region with the center nearest the point.
+        #
+        # The center of a region is the average of the points used by its cells.
+        points = vtk_to_numpy(regions.GetPoints().GetData())
+        point_regions = vtk_to_numpy(regions.GetPointData().GetArray("RegionId"))
+        used = point_regions >= 0
+        counts = np.bincount(point_regions[used], minlength=num_regions)
+        centers = np.column_stack([ np.bincount(point_regions[used], weights=points[used,i], minlength=num_regions) 
+          for i in range(3) ]) / np.maximum(counts, 1)[:,None]
+        nearest = np.argmin(np.sum((centers - point)**2, axis=1))
+
+        ## Create the component from the cells of the region.
+        #
+        # The points of a cell are in the same region.
+        offsets, connectivity = get_cell_point_ids(regions.GetPolys())
+        cell_ids = np.nonzero(point_regions[connectivity[offsets[:-1]]] == nearest)[0]
+        sizes = offsets[cell_ids+1] - offsets[cell_ids]
+        comp_offsets = np.zeros(cell_ids.shape[0]+1, dtype=np.int64)
+        np.cumsum(sizes, out=comp_offsets[1:])
+        index = np.repeat(offsets[cell_ids] - comp_offsets[:-1], sizes) + np.arange(comp_offsets[-1])
+        point_ids, comp_connectivity = np.unique(connectivity[index], return_inverse=True)
+
+        comp_points = vtk.vtkPoints()
+        comp_points.SetData(numpy_to_vtk(np.ascontiguousarray(points[point_ids]), deep=True, 
+          array_type=regions.GetPoints().GetDataType()))
+        component = vtk.vtkPolyData()
+        component.SetPoints(comp_points)
+        component.SetPolys(create_cell_array(comp_offsets, comp_connectivity.reshape(-1)))
+
+        point_data = regions.GetPointData()
+        for i in range(point_data.GetNumberOfArrays()):
+            array = point_data.GetArray(i)
+            if (array is None) or (array.GetName() == "RegionId"):
+                continue
+            values = numpy_to_vtk(np.ascontiguousarray(vtk_to_numpy(array)[point_ids]), deep=True,
+              array_type=array.GetDataType())
+            values.SetName(array.GetName())
+            component.GetPointData().AddArray(values)
+
+        return component, num_regions
+
+    def extract_slice(self, index, point, normal, radius=None, cell_ids=None):
+        '''Extract the slice at a centerline point.
+
+           radius is the MaximumInscribedSphereRadius at the point, if it is None then all of the cells 
+           cut by the plane are contoured. cell_ids are the candidate cells if they have already been found.
+        '''
+        point = np.asarray(point, dtype=np.float64)
+        normal = np.asarray(normal, dtype=np.float64)
+        normal = normal / np.linalg.norm(normal)
+        radius = np.inf if radius is None else self.radius_scale * radius
+
+        while True:
+            slice = Slice(index, point, normal, radius)
+            if cell_ids is None:
+                cell_ids = self.get_candidate_cells(point[None,:], normal[None,:], np.array([radius]))[0]
+            slice.num_cells = cell_ids.shape[0]
+            slice.cell_ids = cell_ids
+            if slice.num_cells == 0:
+                return slice
+
+            slice.iso_surface = self.contour_cells(cell_ids, point, normal)
+            if slice.iso_surface.GetNumberOfCells() == 0:
+                return slice
+            slice.geometry, slice.num_components = self.get_nearest_component(slice.iso_surface, point)
+
+            # The component may be cut short if it extends outside the culling sphere.
+            comp_points = vtk_to_numpy(slice.geometry.GetPoints().GetData())
+            max_dist = np.sqrt(np.max(np.sum((comp_points - point)**2, axis=1)))
+            if (max_dist <= radius) or (slice.num_cells == self.num_cells):
+                return slice
+
+            radius *= 2.0
+            cell_ids = None
+
+    def get_slice_weights(self, slice):
+        '''Get the weights used to integrate mesh point data over a slice.
+
+           A slice point is interpolated from the two mesh points of the cut cell edge it is on. The 
+           integral of linearly interpolated data over a slice triangle is its area times the average 
+           of its point values. Returns the mesh point IDs, their weights and the slice area. The integral
+           of point data over the slice is np.sum(weights * values[point_ids]).
+        '''
+        if slice.geometry is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0), 0.0
+
+        ## Find the cut edges of the contoured cells.
+        #
+        # A point is inside the contour if its plane distance is >= 0, as in vtkContourGrid. Only the 
+        # edges of cells with points on both sides of the plane are checked.
+        #
+        edge_list = []
+        slice_cell_types = self.cell_types[slice.cell_ids]
+        for cell_type in np.unique(slice_cell_types):
+            if cell_type not in cell_edges:
+                raise Exception("Slice weights can't be computed for VTK cell type {0:d}.".format(cell_type))
+            edges = np.array(cell_edges[cell_type])
+            starts = self.offsets[slice.cell_ids[slice_cell_types == cell_type]]
+            cell_point_ids = self.connectivity[starts[:,None] + np.arange(edges.max()+1)]
+            inside = (self.points[cell_point_ids] - slice.point).dot(slice.normal) >= 0.0
+            cell_point_ids = cell_point_ids[np.any(inside, axis=1) & ~np.all(inside, axis=1)]
+            edge_list.append(np.column_stack((cell_point_ids[:,edges[:,0]].ravel(), cell_point_ids[:,edges[:,1]].ravel())))
+        edges = np.sort(np.concatenate(edge_list), axis=1)
+
+        # Cut edges shared by cells are found once using a key computed from their point IDs.
+        dist = (self.points[edges] - slice.point).dot(slice.normal)
+        cut = (dist[:,0] >= 0.0) != (dist[:,1] >= 0.0)
+        edges = edges[cut]
+        _, unique_edges = np.unique(edges[:,0]*self.points.shape[0] + edges[:,1], return_index=True)
+        edges = edges[unique_edges]
+        dist = dist[cut][unique_edges]
+        t = dist[:,0] / (dist[:,0] - dist[:,1])
+        edge_vectors = self.points[edges[:,1]] - self.points[edges[:,0]]
+        edge_points = self.points[edges[:,0]] + t[:,None]*edge_vectors
+
+        ## Find the cut edge of each slice point.
+        #
+        slice_points = vtk_to_numpy(slice.geometry.GetPoints().GetData()).astype(np.float64)
+        tolerance = 1e-3 * np.median(np.linalg.norm(edge_vectors, axis=1))
+        index = NodeMatcher(edge_points, tolerance).find(slice_points)
+        if np.any(index == -1):
+            raise Exception("Slice {0:d}: {1:d} slice points are not on cut cell edges.".format(slice.index,
+              np.count_nonzero(index == -1)))
+
+        ## Triangulate the slice polygons as fans and compute the triangle areas.
+        #
+        offsets, connectivity = get_cell_point_ids(slice.geometry.GetPolys())
+        num_tris = np.diff(offsets) - 2
+        first = np.repeat(offsets[:-1], num_tris)
+        k = np.arange(num_tris.sum()) - np.repeat(np.cumsum(num_tris) - num_tris, num_tris)
+        tris = np.column_stack((connectivity[first], connectivity[first+k+1], connectivity[first+k+2]))
+        tri_points = slice_points[tris]
+        areas = 0.5 * np.linalg.norm(np.cross(tri_points[:,1] - tri_points[:,0], tri_points[:,2] - tri_points[:,0]), axis=1)
+
+        ## Distribute the triangle weights to the mesh points of the cut edges.
+        #
+        point_weights = np.bincount(tris.ravel(), weights=np.repeat(areas/3.0, 3), minlength=slice_points.shape[0])
+        edges = edges[index]
+        t = t[index]
+        point_ids = np.concatenate((edges[:,0], edges[:,1]))
+        weights = np.concatenate(((1.0 - t)*point_weights, t*point_weights))
+
+        return point_ids, weights, areas.sum()
+
+    def extract_slices(self, points, normals, radii=None, indices=None, batch_size=64, weights=False):
+        '''Extract the slices at centerline points.
+
+           radii are the MaximumInscribedSphereRadius values at the points, if not given then all
+           of the cells cut by a plane are contoured. The slices for the points given by indices
+           (default all points) are returned in order by a generator. If weights is True then the 
+           weights of each slice with geometry are computed.
+        '''
+        if indices is None:
+            indices = np.arange(points.shape[0])
+        points = np.asarray(points, dtype=np.float64)[indices]
+        normals = np.asarray(normals, dtype=np.float64)[indices]
+        normals = normals / np.linalg.norm(normals, axis=1)[:,None]
+        if radii is not None:
+            radii = np.asarray(radii, dtype=np.float64)[indices]
+            cull_radii = self.radius_scale * radii
+        else:
+            cull_radii = np.full(indices.shape[0], np.inf)
+
+        for start in range(0, indices.shape[0], batch_size):
+            end = min(start+batch_size, indices.shape[0])
+            candidates = self.get_candidate_cells(points[start:end], normals[start:end], cull_radii[start:end])
+            for i, cell_ids in zip(range(start, end), candidates):
+                radius = None if radii is None else radii[i]
+                slice = self.extract_slice(indices[i], points[i], normals[i], radius, cell_ids)
+                if weights and (slice.geometry is not None):
+                    slice.weights = self.get_slice_weights(slice)
+                yield slice
+
+## The Slicer of a SlicerPool worker process.
+worker_slicer = None
+
+def init_worker(shared_arrays, point_data_types, radius_scale):
+    '''Create the Slicer of a worker process for a mesh stored in shared memory.
+
+       The VTK arrays of the mesh use the shared memory, they are not copied.
+    '''
+    global worker_slicer
+    blocks = []
+    arrays = {}
+    for name, (block_name, shape, dtype) in shared_arrays.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+    mesh = vtk.vtkUnstructuredGrid()
+    mesh.SetPoints(vtk.vtkPoints())
+    mesh.GetPoints().SetData(numpy_to_vtk(arrays["points"], deep=False))
+    cells = vtk.vtkCellArray()
+    if hasattr(cells, "GetOffsetsArray"):
+        cells.SetData(numpy_to_vtkIdTypeArray(arrays["offsets"], deep=False), 
+          numpy_to_vtkIdTypeArray(arrays["connectivity"], deep=False))
+    else:
+        cells = create_cell_array(arrays["offsets"], arrays["connectivity"])
+    mesh.SetCells(numpy_to_vtk(arrays["cell_types"], deep=False, array_type=vtk.VTK_UNSIGNED_CHAR), cells)
+
+    for name, data_type in point_data_types.items():
+        array = numpy_to_vtk(arrays["point_data/" + name], deep=False, array_type=data_type)
+        array.SetName(name)
+        mesh.GetPointData().AddArray(array)
+
+    worker_slicer = Slicer(mesh, radius_scale)
+    # The shared memory blocks must stay open while the mesh is used.
+    worker_slicer.shared_memory_blocks = blocks
+
+def extract_worker_slices(points, normals, radii, indices, weights):
+    '''Extract the slices for a range of centerline points in a worker process.
+    '''
+    return list(worker_slicer.extract_slices(points, normals, radii, indices, weights=weights))
+
+class SlicerPool(object):
+    '''This class is used to extract slices in parallel using a pool of worker processes.
+
+       The mesh points, cells and point data arrays are copied into shared memory when the pool is 
+       created. Centerline points are divided into ranges of range_size points, the default gives 
+       each worker about four ranges.
+
+       The pool must be closed to free the shared memory, it can be used in a 'with' statement 
+       to close it when the statement exits.
+    '''
+    def __init__(self, mesh, num_workers, radius_scale=2.0, range_size=None):
+        self.num_workers = num_workers
+        self.radius_scale = radius_scale
+        self.range_size = range_size
+        self.blocks = []
+        self.shared_arrays = {}
+        self.executor = None
+
+        try:
+            offsets, connectivity = get_cell_point_ids(mesh.GetCells())
+            self.add_shared_array("points", vtk_to_numpy(mesh.GetPoints().GetData()))
+            self.add_shared_array("offsets", offsets)
+            self.add_shared_array("connectivity", connectivity)
+            self.add_shared_array("cell_types", get_cell_types(mesh).astype(np.uint8, copy=False))
+
+            point_data = mesh.GetPointData()
+            self.point_data_types = {}
+            for i in range(point_data.GetNumberOfArrays()):
+                array = point_data.GetArray(i)
+                if array is None:
+                    continue
+                self.add_shared_array("point_data/" + array.GetName(), vtk_to_numpy(array))
+                self.point_data_types[array.GetName()] = array.GetDataType()
+
+            self.executor = ProcessPoolExecutor(max_workers=num_workers, initializer=init_worker, 
+              initargs=(self.shared_arrays, self.point_data_types, radius_scale))
+        except:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_shared_array(self, name, values):
+        '''Copy an array into a new shared memory block.
+        '''
+        values = np.ascontiguousarray(values)
+        block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[...] = values
+        self.blocks.append(block)
+        self.shared_arrays[name] = (block.name, values.shape, values.dtype.str)
+
+    def extract_slices(self, points, normals, radii=None, indices=None, weights=False):
+        '''Extract the slices at centerline points.
+
+           The arguments are the same as those of Slicer.extract_slices(). The slices are returned 
+           in order by a generator as the ranges of centerline points are finished.
+        '''
+        if indices is None:
+            indices = np.arange(points.shape[0])
+        range_size = self.range_size
+        if range_size is None:
+            range_size = max(1, -(-indices.shape[0] // (4*self.num_workers)))
+
+        ranges = [ indices[start:start+range_size] for start in range(0, indices.shape[0], range_size) ]
+        range_points = [ np.asarray(points)[ids] for ids in ranges ]
+        range_normals = [ np.asarray(normals)[ids] for ids in ranges ]
+        range_radii = [ None if radii is None else np.asarray(radii)[ids] for ids in ranges ]
+        range_indices = [ np.arange(ids.shape[0]) for ids in ranges ]
+
+        results = self.executor.map(extract_worker_slices, range_points, range_normals, range_radii, 
+          range_indices, [weights]*len(ranges))
+
+        for ids, slices in zip(ranges, results):
+            for slice in slices:
+                slice.index = ids[slice.index]
+                yield slice
+
+    def close(self):
+        '''Shut down the worker processes and free the shared memory.
+        '''
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
@@ -1,12 +1,21 @@
 '''
 This script is used to check the fluid-solid interace surfaces.  
 
+Usage:
+
+    check-interfaces.py MESH1.vtp MESH2.vtp [TOLERANCE]
+
+Nodes are matched by coordinates, TOLERANCE is the distance within which nodes match (default 0.0, exact match).
 '''
-from collections import defaultdict 
 import os
 import sys
+import numpy as np
 import vtk
-from math import sqrt
+from vtk.util.numpy_support import vtk_to_numpy
+
+# The node matching module is in the node-matching directory of this repository.
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "node-matching", "python"))
+from node_matching import NodeMatcher
 
 def add_mesh_geom(reader, mesh, renderer):
     ''' Add mesh to renderer.
@@ -33,155 +42,63 @@ def add_mesh_geom(reader, mesh, renderer):
     renderer.AddActor(actor)
 
 
-def check_nodes(mesh1, mesh2):
+def get_points(mesh):
+    '''Get the points of a mesh as a NumPy array.
+    '''
+    if mesh.GetNumberOfPoints() == 0:
+        return np.zeros((0,3))
+    return vtk_to_numpy(mesh.GetPoints().GetData())
+
+def check_nodes(mesh1, mesh2, tolerance=0.0):
+    '''Check that the nodes of mesh 2 match the nodes of mesh 1.
+    '''
     num_points1 = mesh1.GetNumberOfPoints()
-    points1 = mesh1.GetPoints()
-    num_cells1 = mesh1.GetNumberOfCells()
-    num_points2 = mesh2.GetNumberOfPoints()
-    points2 = mesh2.GetPoints()
-    num_cells2 = mesh2.GetNumberOfCells()
 
     ## Check nodal coordinates.
     #
-    pt = 3*[0.0]
-    max_x = -1e9
-    max_y = -1e9
-    max_z = -1e9
-    min_x = 1e9
-    min_y = 1e9
-    min_z = 1e9
-    for i in range(num_points1):
-        points1.GetPoint(i, pt)
-        x = pt[0]
-        y = pt[1]
-        z = pt[2]
-        if x < min_x:
-            min_x = x 
-        elif x > max_x:
-            max_x = x 
-        if y < min_y:
-            min_y = y 
-        elif y > max_y:
-            max_y = y 
-        if z < min_z:
-            min_z = z 
-        elif z > max_z:
-            max_z = z 
-    #_for i in range(num_points):
-
-    point_hash = defaultdict(list)
-    num_dupe_points = 0
-    for i in range(num_points1):
-        points1.GetPoint(i, pt)
-        x = pt[0]
-        y = pt[1]
-        z = pt[2]
-        xs = (x-min_x) / (max_x-min_x)
-        ys = (y-min_y) / (max_y-min_y)
-        zs = (z-min_z) / (max_z-min_z)
-        ih = xs*num_points1
-        jh = ys*num_points1
-        kh = zs*num_points1
-        index = int(ih + jh + kh)
-        pts = point_hash[index]
-        if len(pts) == 0:
-            point_hash[index].append([pt[0], pt[1], pt[2]])
-        else:
-            found_pt = False
-            for hpt in pts:
-                dx = hpt[0] - pt[0]
-                dy = hpt[1] - pt[1]
-                dz = hpt[2] - pt[2]
-                d = dx*dx + dy*dy + dz*dz
-                if d == 0.0:
-                    found_pt = True
-                    num_dupe_points += 1
-                    break
-            #_for hpt in pts
-            if not found_pt:
-                point_hash[index].append([pt[0], pt[1], pt[2]])
-    #_for i in range(num_points)
-
-    for i in range(num_points2):
-        points2.GetPoint(i, pt)
-        x = pt[0]
-        y = pt[1]
-        z = pt[2]
-        xs = (x-min_x) / (max_x-min_x)
-        ys = (y-min_y) / (max_y-min_y)
-        zs = (z-min_z) / (max_z-min_z)
-        ih = xs*num_points1
-        jh = ys*num_points1
-        kh = zs*num_points1
-        index = int(ih + jh + kh)
-        pts = point_hash[index]
-        if len(pts) == 0:
-            point_hash[index].append([pt[0], pt[1], pt[2]])
-        else:
-            found_pt = False
-            for hpt in pts:
-                dx = hpt[0] - pt[0]
-                dy = hpt[1] - pt[1]
-                dz = hpt[2] - pt[2]
-                d = dx*dx + dy*dy + dz*dz
-                if d == 0.0:
-                    found_pt = True
-                    num_dupe_points += 1
-                    break
-            #_for hpt in pts
-            if not found_pt:
-                point_hash[index].append([pt[0], pt[1], pt[2]])
-    #_for i in range(num_points)
-    if (num_dupe_points != num_points2):
+    matcher = NodeMatcher(get_points(mesh1), tolerance)
+    matches = matcher.match(get_points(mesh2))
+    print("Number of matched nodes: {0:d}".format(matches.pairs.shape[0]))
+    print("Number of duplicate nodes: mesh 1: {0:d}  mesh 2: {1:d}".format(matches.num_duplicates, matches.num_query_duplicates))
+
+    if matches.unmatched.shape[0] != 0:
         print("ERROR: Coordinates don't match.")
+        print("Number of unmatched mesh 2 nodes: {0:d}".format(matches.unmatched.shape[0]))
     else:
         print("Coordinates match.")
 
     ## Check nodal IDs.
     #
-    node_id_map = defaultdict(int)
-    node_coord_map = defaultdict(list)
     node_ids1 = mesh1.GetPointData().GetArray('GlobalNodeID')
-    for i in range(num_points1):
-        nid = node_ids1.GetValue(i)
-        points1.GetPoint(i, pt)
-        node_id_map[nid] += 1
-        node_coord_map[nid].append([pt[0], pt[1], pt[2]])
-        #print("Point {0:d}: {1:d}  {2:s}".format(i, nid, str(pt)))
-
     node_ids2 = mesh2.GetPointData().GetArray('GlobalNodeID')
-    for i in range(num_points2):
-        nid = node_ids2.GetValue(i)
-        points2.GetPoint(i, pt)
-        node_id_map[nid] += 1
-        if len(node_coord_map[nid]) != 0:
-            cpt = node_coord_map[nid][0]
-            d = sqrt(sum([(cpt[j]-pt[j])*(cpt[j]-pt[j]) for j in range(3)]))
-        node_coord_map[nid].append([pt[0], pt[1], pt[2]])
-        #print("Point {0:d}: {1:d}  {2:s}".format(i, id, str(pts[0])))
-        #print("Point {0:d}: {1:d}  {2:s}".format(i, nid, str(pt)))
-        #pts = node_coord_map[id]
-        #print("      {0:s}".format(str(pts[0])))
-
-    if len(node_id_map) != num_points1:
+    if (node_ids1 is None) or (node_ids2 is None):
+        print("No GlobalNodeID data, node IDs are not checked.")
+        return
+
+    node_ids1 = vtk_to_numpy(node_ids1)
+    node_ids2 = vtk_to_numpy(node_ids2)
+    node_ids, counts = np.unique(np.concatenate((node_ids1, node_ids2)), return_counts=True)
+
+    if node_ids.shape[0] != num_points1:
         print("ERROR: Nodel IDs don't match.")
     else:
         print("Nodel IDs match.")
 
-    num_dupe = 0
-    for nid, count in node_id_map.items():
-        if count != 1:
-            pts = node_coord_map[nid]
-            #print("Node id {0:d}: number: {1:d}".format(nid, count))
-            #print("    {0:s}: ".format(str(pts[0])))
-            #print("    {0:s}: ".format(str(pts[1])))
-            num_dupe += 1
-    #_for nid, count in node_id_map.items()
+    num_diff_ids = np.count_nonzero(node_ids1[matches.pairs[:,0]] != node_ids2[matches.pairs[:,1]])
+    if num_diff_ids != 0:
+        print("ERROR: {0:d} matched nodes have different IDs.".format(num_diff_ids))
+
+    num_dupe = np.count_nonzero(counts != 1)
     print("Mesh 1 and mesh 2 share {0:d} nodes.".format(num_dupe))
 
 
 if __name__ == '__main__':
 
+    # Nodes within the optional tolerance are matched.
+    tolerance = 0.0
+    if len(sys.argv) > 3:
+        tolerance = float(sys.argv[3])
+
     ## Read meshes.
     #
     print("")
@@ -225,7 +142,7 @@ if __name__ == '__main__':
 
     ## Check for duplicate nodes.
     #
-    check_nodes(mesh1, mesh2)
+    check_nodes(mesh1, mesh2, tolerance)
 
     #add_interface_points(node_coord_map, renderer)
 
@@ -4,34 +4,39 @@ This script is used to extract regions from an sv .vtu file.
 The extracted regions are written to a file.
 
 The nodes shared by the regions are displayed as red points.
+
+A mesh is written for each ModelRegionID. Regions are extracted and the nodes shared by 
+regions are found using NumPy arrays, there are no loops over cells or points.
+
+Usage:
+
+    extract-regions.py VOLUME_MESH.vtu
 '''
-from collections import defaultdict 
+from collections import OrderedDict
 import os
 import sys
+import numpy as np
 import vtk
+from vtk.util.numpy_support import vtk_to_numpy, numpy_to_vtk
+
+# The node matching and VTK array modules are in the node-matching directory of this repository.
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "node-matching", "python"))
+from node_matching import NodeMatcher
+from vtk_array_utils import get_cell_point_ids, create_cell_array, get_cell_types, take_array
 
-def add_interface_points(node_coord_map, renderer):
+def add_interface_points(interface_points, renderer):
     '''
     Add interface points to renderer.
     '''
     print("")
     print("Add interface points ...")
-    points = vtk.vtkPoints()
-    vertices = vtk.vtkCellArray()
-    num_pts = 0
-
-    for id in node_coord_map: 
-        pts = node_coord_map[id]
-        if len(pts) != 1:
-            pid = points.InsertNextPoint(pts[0])
-            vertices.InsertNextCell(1)
-            vertices.InsertCellPoint(pid)
-            #print("Interface point:  {0:s}: ".format(str(pts[0])))
-            #print("Point {0:d}: {1:s}".format(id, str(pts[0])))
-            num_pts += 1
-    #_for id in node_coord_map
+    num_pts = interface_points.shape[0]
     print("Number of interface points: {0:d}".format(num_pts))
 
+    points = vtk.vtkPoints()
+    points.SetData(numpy_to_vtk(np.ascontiguousarray(interface_points, dtype=np.float64), deep=True))
+    vertices = create_cell_array(np.arange(num_pts+1), np.arange(num_pts))
+
     points_pd = vtk.vtkPolyData()
     points_pd.SetPoints(points)
     points_pd.SetVerts(vertices)
@@ -86,17 +91,82 @@ def add_mesh_geom(reader, mesh, renderer):
     #actor.GetProperty().SetPointSize(5)
     renderer.AddActor(actor)
 
-def get_region_mesh(mesh, region_id): 
+def get_region_meshes(mesh):
+    '''
+    Extract a mesh for each ModelRegionID.
+
+    The cells are sorted by region ID once and each region mesh is created from a slice of 
+    the sorted cells. As with vtkThreshold the points of a region keep their original order.
+
+    Returns a dict of region meshes and a dict of the mesh point IDs used by each region.
+    '''
+    region_ids = vtk_to_numpy(mesh.GetCellData().GetArray('ModelRegionID'))
+    offsets, connectivity = get_cell_point_ids(mesh.GetCells())
+    cell_types = get_cell_types(mesh)
+    num_points = mesh.GetNumberOfPoints()
+    mesh_points = vtk_to_numpy(mesh.GetPoints().GetData())
+    point_data = mesh.GetPointData()
+    cell_data = mesh.GetCellData()
+
+    order = np.argsort(region_ids, kind='stable')
+    sorted_region_ids = region_ids[order]
+    regions, starts = np.unique(sorted_region_ids, return_index=True)
+    ends = np.append(starts[1:], order.shape[0])
+
+    region_meshes = OrderedDict()
+    region_point_ids = OrderedDict()
+
+    for region_id, start, end in zip(regions, starts, ends):
+        cell_ids = order[start:end]
+        sizes = offsets[cell_ids+1] - offsets[cell_ids]
+        region_offsets = np.zeros(cell_ids.shape[0]+1, dtype=np.int64)
+        np.cumsum(sizes, out=region_offsets[1:])
+        index = np.repeat(offsets[cell_ids] - region_offsets[:-1], sizes) + np.arange(region_offsets[-1])
+        region_connectivity = connectivity[index]
+
+        used = np.zeros(num_points, dtype=bool)
+        used[region_connectivity] = True
+        point_ids = np.nonzero(used)[0]
+        point_map = np.cumsum(used) - 1
+
+        points = vtk.vtkPoints()
+        points.SetData(numpy_to_vtk(np.ascontiguousarray(mesh_points[point_ids]), deep=True, 
+          array_type=mesh.GetPoints().GetDataType()))
+
+        types = numpy_to_vtk(np.ascontiguousarray(cell_types[cell_ids]), deep=True, array_type=vtk.VTK_UNSIGNED_CHAR)
+        region_mesh = vtk.vtkUnstructuredGrid()
+        region_mesh.SetPoints(points)
+        region_mesh.SetCells(types, create_cell_array(region_offsets, point_map[region_connectivity]))
+
+        for i in range(point_data.GetNumberOfArrays()):
+            if point_data.GetArray(i) is not None:
+                region_mesh.GetPointData().AddArray(take_array(point_data.GetArray(i), point_ids))
+        for i in range(cell_data.GetNumberOfArrays()):
+            if cell_data.GetArray(i) is not None:
+                region_mesh.GetCellData().AddArray(take_array(cell_data.GetArray(i), cell_ids))
+
+        region_meshes[int(region_id)] = region_mesh
+        region_point_ids[int(region_id)] = point_ids
+
+    return region_meshes, region_point_ids
+
+def get_interface_nodes(mesh, region_point_ids):
     '''
-    Extract a mesh region from a mesh using a region ID.
+    Get the nodes shared by regions.
+
+    Returns the GlobalNodeIDs of the nodes used by more than one region and their coordinates.
     '''
-    thresholder = vtk.vtkThreshold()
-    thresholder.SetInputData(mesh);
-    thresholder.SetInputArrayToProcess(0,0,0,1,"ModelRegionID");
-    thresholder.ThresholdBetween(region_id, region_id);
-    thresholder.Update();
-    return thresholder.GetOutput()
-#_get_region_mesh(mesh, region_id)
+    node_ids = vtk_to_numpy(mesh.GetPointData().GetArray('GlobalNodeID'))
+    region_node_ids = [ np.unique(node_ids[point_ids]) for point_ids in region_point_ids.values() ]
+    ids, counts = np.unique(np.concatenate(region_node_ids), return_counts=True)
+    interface_ids = ids[counts > 1]
+
+    # Get the coordinates of the first node with each interface ID.
+    order = np.argsort(node_ids, kind='stable')
+    first = order[np.searchsorted(node_ids[order], interface_ids)]
+    interface_points = vtk_to_numpy(mesh.GetPoints().GetData())[first]
+
+    return interface_ids, interface_points
 
 def write_mesh(file_base_name, mesh, region_id): 
     file_name = file_base_name + "-mesh-" + str(region_id) + ".vtu"
@@ -120,151 +190,47 @@ if __name__ == '__main__':
     mesh = reader.GetOutput()
 
     num_points = mesh.GetNumberOfPoints()
-    points = mesh.GetPoints()
     print("Number of points: {0:d}".format(num_points))
 
     num_cells = mesh.GetNumberOfCells()
     print("Number of cells: {0:d}".format(num_cells))
-    cells = mesh.GetCells()
 
     ## Get the cells for each region.
     #
     print("")
     print("Count the cells for each region ...")
-    model_ids = mesh.GetCellData().GetArray('ModelRegionID')
-    regions = defaultdict(list)
-    for cell_id in range(num_cells):
-        value = model_ids.GetValue(cell_id)
-        regions[value].append(cell_id)
-    print("Number of regions: {0:d}".format(len(regions)))
-    for region_id, cells in regions.items(): 
-        print("Region {0:d}: number of cells: {1:d}".format(region_id, len(cells)))
+    model_ids = vtk_to_numpy(mesh.GetCellData().GetArray('ModelRegionID'))
+    regions, region_num_cells = np.unique(model_ids, return_counts=True)
+    print("Number of regions: {0:d}".format(regions.shape[0]))
+    for region_id, count in zip(regions, region_num_cells): 
+        print("Region {0:d}: number of cells: {1:d}".format(int(region_id), int(count)))
 
     ## Check for duplicate nodes.
-    pt = 3*[0.0]
-    max_x = -1e9
-    max_y = -1e9
-    max_z = -1e9
-    min_x = 1e9
-    min_y = 1e9
-    min_z = 1e9
-    for i in range(num_points):
-        points.GetPoint(i, pt)
-        x = pt[0]
-        y = pt[1]
-        z = pt[2]
-        if x < min_x:
-            min_x = x 
-        elif x > max_x:
-            max_x = x 
-        if y < min_y:
-            min_y = y 
-        elif y > max_y:
-            max_y = y 
-        if z < min_z:
-            min_z = z 
-        elif z > max_z:
-            max_z = z 
-    #_for i in range(num_points):
-
-    point_hash = defaultdict(list)
-    num_dupe_points = 0
-    for i in range(num_points):
-        points.GetPoint(i, pt)
-        x = pt[0]
-        y = pt[1]
-        z = pt[2]
-        xs = (x-min_x) / (max_x-min_x)
-        ys = (y-min_y) / (max_y-min_y)
-        zs = (z-min_z) / (max_z-min_z)
-        ih = xs*num_points 
-        jh = ys*num_points 
-        kh = zs*num_points 
-        index = int(ih + jh + kh)
-        pts = point_hash[index]
-        if len(pts) == 0:
-            point_hash[index].append([pt[0], pt[1], pt[2]])
-        else:
-            found_pt = False
-            for hpt in pts:
-                dx = hpt[0] - pt[0]
-                dy = hpt[1] - pt[1]
-                dz = hpt[2] - pt[2]
-                d = dx*dx + dy*dy + dz*dz
-                if d == 0.0:
-                    found_pt = True
-                    num_dupe_points += 1
-                    break
-            #_for hpt in pts
-            if not found_pt:
-                point_hash[index].append([pt[0], pt[1], pt[2]])
-    #_for i in range(num_points)
-    print("Number of duplicate points: {0:d}".format(num_dupe_points))
-
-    ## Get mesh for region 1.
-    #
-    print("")
-    print("========== Region 1 mesh ==========")
-    mesh_1 = get_region_mesh(mesh, 1) 
-    write_mesh(file_base_name, mesh_1, 1) 
-    #
-    num_points_1 = mesh_1.GetNumberOfPoints()
-    points_1 = mesh_1.GetPoints()
-    print("Number of points: {0:d}".format(num_points_1))
-    #
-    num_cells_1 = mesh_1.GetNumberOfCells()
-    print("Number of cells: {0:d}".format(num_cells_1))
-    cells_1 = mesh_1.GetCells()
-    #
-    node_id_map = defaultdict(int)
-    node_coord_map = defaultdict(list)
-    node_ids_1 = mesh_1.GetPointData().GetArray('GlobalNodeID')
-    pt = 3*[0.0]
-    for i in range(num_points_1):
-        nid = node_ids_1.GetValue(i)
-        points_1.GetPoint(i, pt)
-        node_id_map[nid] += 1
-        node_coord_map[nid].append([pt[0], pt[1], pt[2]])
-        #print("Point {0:d}: {1:d}  {2:s}".format(i, nid, str(pt)))
-
-    ## Get mesh for region 2.
-    #
-    print("")
-    print("========== Region 2 mesh ==========")
-    mesh_2 = get_region_mesh(mesh, 2) 
-    write_mesh(file_base_name, mesh_2, 2) 
-    #
-    num_points_2 = mesh_2.GetNumberOfPoints()
-    points_2 = mesh_2.GetPoints()
-    print("Number of points: {0:d}".format(num_points_2))
-    #
-    num_cells_2 = mesh_2.GetNumberOfCells()
-    print("Number of cells: {0:d}".format(num_cells_2))
-    cells_2 = mesh_2.GetCells()
+    matcher = NodeMatcher(vtk_to_numpy(mesh.GetPoints().GetData()))
+    print("Number of duplicate points: {0:d}".format(matcher.num_duplicates))
+
+    ## Get and write the mesh for each region.
     #
-    node_ids_2 = mesh_2.GetPointData().GetArray('GlobalNodeID')
-    for i in range(num_points_2):
-        nid = node_ids_2.GetValue(i)
-        points_2.GetPoint(i, pt)
-        node_id_map[nid] += 1
-        node_coord_map[nid].append([pt[0], pt[1], pt[2]])
-        #print("Point {0:d}: {1:d}  {2:s}".format(i, id, str(pts[0])))
-        #print("Point {0:d}: {1:d}  {2:s}".format(i, nid, str(pt)))
-        #pts = node_coord_map[id]
-        #print("      {0:s}".format(str(pts[0])))
-
-    num_dupe = 0
-    for nid, count in node_id_map.items(): 
-        if count != 1:
-            pts = node_coord_map[nid]
-            #print("Node id {0:d}: number: {1:d}".format(nid, count))
-            #print("    {0:s}: ".format(str(pts[0])))
-            #print("    {0:s}: ".format(str(pts[1])))
-            num_dupe += 1
-    print("Region 1 and 2 share {0:d} nodes.".format(num_dupe))
-
-    ## Write meshes.
+    region_meshes, region_point_ids = get_region_meshes(mesh)
+
+    for region_id, region_mesh in region_meshes.items():
+        print("")
+        print("========== Region {0:d} mesh ==========".format(region_id))
+        write_mesh(file_base_name, region_mesh, region_id) 
+        print("Number of points: {0:d}".format(region_mesh.GetNumberOfPoints()))
+        print("Number of cells: {0:d}".format(region_mesh.GetNumberOfCells()))
+
+    ## Get the nodes shared by regions.
     #
+    interface_ids, interface_points = get_interface_nodes(mesh, region_point_ids)
+    node_ids = vtk_to_numpy(mesh.GetPointData().GetArray('GlobalNodeID'))
+    region_list = list(region_point_ids.keys())
+
+    for i, region_1 in enumerate(region_list):
+        for region_2 in region_list[i+1:]:
+            shared = np.intersect1d(node_ids[region_point_ids[region_1]], node_ids[region_point_ids[region_2]])
+            print("Region {0:d} and {1:d} share {2:d} nodes.".format(region_1, region_2, shared.shape[0]))
+    print("Number of nodes shared by regions: {0:d}".format(interface_ids.shape[0]))
 
     ## Show mesh.
     #
@@ -277,13 +243,10 @@ if __name__ == '__main__':
 
     add_mesh_geom(reader, mesh, renderer)
 
-    add_interface_points(node_coord_map, renderer)
+    add_interface_points(interface_points, renderer)
 
     # Create a trackball interacter to transoform the geometry using the mouse.
     interactor = vtk.vtkRenderWindowInteractor()
     interactor.SetInteractorStyle(vtk.vtkInteractorStyleTrackballCamera())
     interactor.SetRenderWindow(renderer_win)
     interactor.Start()
-
-
-
@@ -5,11 +5,88 @@
    Usage:
 
        create-wall-props.py mesh-complete.mesh.vtu walls_combined.vtp
+           [ --rule z-midplane | region | centerline | reference ]
+           [ --region-array REGION_ARRAY ]
+           [ --region-values ID:THICKNESS:MODULUS [ID:THICKNESS:MODULUS ...] ]
+           [ --centerlines CENTERLINES ]
+           [ --distance-values DISTANCE:THICKNESS:MODULUS [DISTANCE:THICKNESS:MODULUS ...] ]
+           [ --reference REFERENCE_MESH ]
+           [ --reference-array REFERENCE_ARRAY ]
+           [ --output-file OUTPUT_FILE ]
 
+   where the rule used to set the wall properties of the volume mesh nodes on the wall surface is
+
+       z-midplane - Nodes above and below the z midplane of the volume mesh are given different
+           thickness and elastic modulus values (default).
+
+       region - The values are given for each REGION_ARRAY ID (default ModelFaceID) of the wall
+           surface cells, a node shared by regions is given the values of the largest ID.
+
+       centerline - The values are linearly interpolated from the DISTANCE:THICKNESS:MODULUS table using
+           the distance from a node to the nearest point of the CENTERLINES .vtp file.
+
+       reference - The values are sampled from the REFERENCE_ARRAY point data (default wallproperty) of the
+           REFERENCE_MESH .vtu or .vtp file using the nearest reference mesh node.
+
+   The volume mesh with the wallproperty array is written to OUTPUT_FILE (default wallprop.vtu).
+
+   The wall nodes are found using the GlobalNodeID arrays of the volume and surface meshes and
+   all of the rules are evaluated for NumPy arrays of nodes.
 '''
+import argparse
 import os
 import sys
+import numpy as np
 import vtk
+from vtk.util.numpy_support import vtk_to_numpy, numpy_to_vtk
+
+# The node matching module is in the node-matching directory of this repository.
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "node-matching", "python"))
+from node_matching import find_nearest
+
+## The number of components of the wallproperty array, the first two are thickness and elastic modulus.
+NUM_WALL_PROPERTY_COMPONENTS = 6
+
+class Args(object):
+    '''This class defines the command line arguments.
+    '''
+    VOLUME_MESH = "volume_mesh"
+    SURFACE_MESH = "surface_mesh"
+    RULE = "rule"
+    REGION_ARRAY = "region_array"
+    REGION_VALUES = "region_values"
+    CENTERLINES = "centerlines"
+    DISTANCE_VALUES = "distance_values"
+    REFERENCE = "reference"
+    REFERENCE_ARRAY = "reference_array"
+    OUTPUT_FILE = "output_file"
+
+def cmd(name):
+    '''Create an argparse command argument.
+    '''
+    return "--" + name.replace("_", "-")
+
+def parse_args():
+    '''Parse command-line arguments.
+    '''
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(Args.VOLUME_MESH, help="The volume mesh (.vtu) file.")
+    parser.add_argument(Args.SURFACE_MESH, help="The wall surface mesh (.vtp) file.")
+    parser.add_argument(cmd(Args.RULE), help="The rule used to set wall properties.", default="z-midplane",
+      choices=list(wall_property_rules.keys()))
+    parser.add_argument(cmd(Args.REGION_ARRAY), help="The surface cell data array giving the wall regions.",
+      default="ModelFaceID")
+    parser.add_argument(cmd(Args.REGION_VALUES), help="The values for each region, ID:THICKNESS:MODULUS.", nargs="+")
+    parser.add_argument(cmd(Args.CENTERLINES), help="The centerlines (.vtp) file.")
+    parser.add_argument(cmd(Args.DISTANCE_VALUES), help="The values at distances from the centerlines, DISTANCE:THICKNESS:MODULUS.",
+      nargs="+")
+    parser.add_argument(cmd(Args.REFERENCE), help="The reference mesh (.vtu or .vtp) file the values are sampled from.")
+    parser.add_argument(cmd(Args.REFERENCE_ARRAY), help="The reference mesh point data array the values are sampled from.",
+      default="wallproperty")
+    parser.add_argument(cmd(Args.OUTPUT_FILE), help="The file the volume mesh is written to.", default="wallprop.vtu")
+
+    return parser.parse_args()
 
 def write_volume_mesh(mesh, file_name):
     writer = vtk.vtkXMLUnstructuredGridWriter()
@@ -32,88 +109,174 @@ def read_surface_mesh(file_name):
     mesh = reader.GetOutput()
     return mesh
 
-def add_wall_property_array(volume_mesh, surface_mesh):
+def get_points(mesh):
+    '''Get the points of a mesh as a NumPy array.
+    '''
+    if mesh.GetNumberOfPoints() == 0:
+        return np.zeros((0,3))
+    return vtk_to_numpy(mesh.GetPoints().GetData())
+
+def get_array(data, name, file_name):
+    '''Get a data array as a NumPy array.
+    '''
+    array = data.GetArray(name)
+    if array is None:
+        raise Exception("No '{0:s}' data array in '{1:s}'.".format(name, file_name))
+    return vtk_to_numpy(array)
+
+def parse_values(values, option):
+    '''Parse a list of KEY:THICKNESS:MODULUS values into an (N,3) array.
+    '''
+    if not values:
+        raise Exception("No values given with the {0:s} option.".format(cmd(option)))
+    try:
+        table = np.array([ [float(v) for v in value.split(":")] for value in values ])
+    except ValueError:
+        table = None
+    if (table is None) or (table.ndim != 2) or (table.shape[1] != 3):
+        raise Exception("The {0:s} values must be given as KEY:THICKNESS:MODULUS.".format(cmd(option)))
+    return table
+
+def get_wall_nodes(volume_mesh, surface_mesh):
+    '''Get the indices of the volume mesh nodes on the wall surface.
+
+       Returns the volume mesh node indices and the index of the surface node with the same GlobalNodeID.
+    '''
+    vol_point_ids = get_array(volume_mesh.GetPointData(), "GlobalNodeID", "volume mesh")
+    surf_point_ids = get_array(surface_mesh.GetPointData(), "GlobalNodeID", "surface mesh")
+
+    vol_index = np.nonzero(np.isin(vol_point_ids, surf_point_ids))[0]
+    order = np.argsort(surf_point_ids, kind='stable')
+    surf_index = order[np.searchsorted(surf_point_ids[order], vol_point_ids[vol_index])]
+
+    return vol_index, surf_index
+
+def z_midplane_values(args, volume_mesh, surface_mesh, vol_index, surf_index):
+    '''Set the wall property values of nodes above and below the z midplane of the volume mesh.
+    '''
+    vol_points = get_points(volume_mesh)
+    zmin = vol_points[:,2].min()
+    zmax = vol_points[:,2].max()
+    z_middle = (zmax + zmin) / 2.0
+
+    values = np.zeros((vol_index.shape[0], 2))
+    above = vol_points[vol_index,2] > z_middle
+    values[above] = [0.115445, 3.47979e+06]
+    values[~above] = [0.271, 1e+10]
+    return values
+
+def region_values(args, volume_mesh, surface_mesh, vol_index, surf_index):
+    '''Set the wall property values of nodes using the region IDs of the wall surface cells.
+    '''
+    table = parse_values(args.region_values, Args.REGION_VALUES)
+    cell_regions = get_array(surface_mesh.GetCellData(), args.region_array, "surface mesh")
+
+    # Set the region of each surface node to the largest region ID of the cells using it.
+    cells = surface_mesh.GetPolys()
+    offsets = vtk_to_numpy(cells.GetOffsetsArray())
+    connectivity = vtk_to_numpy(cells.GetConnectivityArray())
+    node_regions = np.full(surface_mesh.GetNumberOfPoints(), np.iinfo(np.int64).min, dtype=np.int64)
+    np.maximum.at(node_regions, connectivity, np.repeat(cell_regions.astype(np.int64), np.diff(offsets)))
+    regions = node_regions[surf_index]
+
+    missing = np.setdiff1d(np.unique(regions), table[:,0].astype(np.int64))
+    if missing.shape[0] != 0:
+        raise Exception("No values given for {0:s} IDs: {1:s}.".format(args.region_array,
+          ", ".join([str(i) for i in missing])))
+
+    region_ids = table[:,0].astype(np.int64)
+    order = np.argsort(region_ids)
+    rows = order[np.searchsorted(region_ids[order], regions)]
+    return table[rows,1:]
+
+def centerline_values(args, volume_mesh, surface_mesh, vol_index, surf_index):
+    '''Interpolate the wall property values of nodes from their distance to the centerlines.
+    '''
+    if args.centerlines is None:
+        raise Exception("No centerlines file given with the {0:s} option.".format(cmd(Args.CENTERLINES)))
+    table = parse_values(args.distance_values, Args.DISTANCE_VALUES)
+    table = table[np.argsort(table[:,0])]
+
+    centerline_points = get_points(read_surface_mesh(args.centerlines))
+    points = get_points(volume_mesh)[vol_index]
+    nearest = find_nearest(centerline_points, points)
+    distances = np.linalg.norm(points - centerline_points[nearest], axis=1)
+    print("Centerline distance range: {0:g} {1:g}".format(distances.min(), distances.max()))
+
+    values = np.zeros((vol_index.shape[0], 2))
+    values[:,0] = np.interp(distances, table[:,0], table[:,1])
+    values[:,1] = np.interp(distances, table[:,0], table[:,2])
+    return values
+
+def reference_values(args, volume_mesh, surface_mesh, vol_index, surf_index):
+    '''Sample the wall property values of nodes from the nearest node of a reference mesh.
+    '''
+    if args.reference is None:
+        raise Exception("No reference mesh file given with the {0:s} option.".format(cmd(Args.REFERENCE)))
+    if os.path.splitext(args.reference)[1] == ".vtu":
+        reference_mesh = read_volume_mesh(args.reference)
+    else:
+        reference_mesh = read_surface_mesh(args.reference)
+
+    reference_values = get_array(reference_mesh.GetPointData(), args.reference_array, args.reference)
+    reference_values = reference_values.reshape(reference_values.shape[0], -1)[:,:NUM_WALL_PROPERTY_COMPONENTS]
+    nearest = find_nearest(get_points(reference_mesh), get_points(volume_mesh)[vol_index])
+    return reference_values[nearest]
+
+## The functions used to set the wall property values for each rule.
+#
+#  The functions return an array of the first components of the wallproperty values of the volume mesh nodes vol_index.
+#
+wall_property_rules = {
+  "z-midplane": z_midplane_values,
+  "region": region_values,
+  "centerline": centerline_values,
+  "reference": reference_values
+}
+
+def add_wall_property_array(volume_mesh, surface_mesh, args):
     num_vol_points = volume_mesh.GetNumberOfPoints()
-    vol_points = volume_mesh.GetPoints()
-    vol_point_ids = volume_mesh.GetPointData().GetArray("GlobalNodeID")
     print("Number of volume points: {0:d}".format(num_vol_points))
 
-    xmin = ymin = zmin = 1e6
-    xmax = ymax = zmax = -1e6
-
-    for i in range(num_vol_points):
-        point = vol_points.GetPoint(i)
-        if point[0] < xmin: 
-           xmin = point[0] 
-        if point[0] > xmax: 
-           xmax = point[0] 
-
-        if point[1] < ymin: 
-           ymin = point[1] 
-        if point[1] > ymax: 
-           ymax = point[1] 
-
-        if point[2] < zmin: 
-           zmin = point[2] 
-        if point[2] > zmax: 
-           zmax = point[2] 
-
-    print("Volume mesh extent: ")
-    print("  xmin: {0:g}  xmax: {1:g}".format(xmin, xmax))
-    print("  ymin: {0:g}  ymax: {1:g}".format(ymin, ymax))
-    print("  zmin: {0:g}  zmax: {1:g}".format(zmin, zmax))
-    z_middle = (zmax + zmin) / 2.0
+    vol_points = get_points(volume_mesh)
+    if num_vol_points != 0:
+        pmin = vol_points.min(axis=0)
+        pmax = vol_points.max(axis=0)
+        print("Volume mesh extent: ")
+        print("  xmin: {0:g}  xmax: {1:g}".format(pmin[0], pmax[0]))
+        print("  ymin: {0:g}  ymax: {1:g}".format(pmin[1], pmax[1]))
+        print("  zmin: {0:g}  zmax: {1:g}".format(pmin[2], pmax[2]))
 
     num_surf_points = surface_mesh.GetNumberOfPoints()
-    surf_points = surface_mesh.GetPoints()
-    surf_point_ids = surface_mesh.GetPointData().GetArray("GlobalNodeID")
     print("Number of surface points: {0:d}".format(num_surf_points))
 
-    node_id_map = set()
-    for i in range(num_surf_points):
-        nid = surf_point_ids.GetValue(i)
-        node_id_map.add(nid)
+    vol_index, surf_index = get_wall_nodes(volume_mesh, surface_mesh)
+
+    values = np.zeros((num_vol_points, NUM_WALL_PROPERTY_COMPONENTS))
+    rule_values = wall_property_rules[args.rule](args, volume_mesh, surface_mesh, vol_index, surf_index)
+    values[vol_index,:rule_values.shape[1]] = rule_values
 
-    wall_property = vtk.vtkDoubleArray()
+    print("Added {0:d} wall prop values.".format(vol_index.shape[0]))
+
+    wall_property = numpy_to_vtk(values, deep=True, array_type=vtk.VTK_DOUBLE)
     wall_property.SetName("wallproperty")
-    wall_property.SetNumberOfComponents(6)
-    wall_property.SetNumberOfTuples(num_vol_points)
-
-    n = 0
-    for i in range(num_vol_points):
-        nid = vol_point_ids.GetValue(i)
-        point = vol_points.GetPoint(i)
-        value = 6*[0.0]
-        if nid in node_id_map:
-            if point[2] > z_middle:
-                value[0] = 0.115445 
-                value[1] = 3.47979e+06
-            else:
-                value[0] = 0.271 
-                value[1] = 1e+10
-            n += 1
-        wall_property.SetTuple(i, value)
-
-    print("Added {0:d} wall prop values.".format(n))
 
     new_volume_mesh = vtk.vtkUnstructuredGrid()
-    new_volume_mesh.DeepCopy(volume_mesh)
+    new_volume_mesh.ShallowCopy(volume_mesh)
     new_volume_mesh.GetPointData().AddArray(wall_property)
 
-    return new_volume_mesh 
+    return new_volume_mesh
 
 if __name__ == '__main__':
 
+    args = parse_args()
+
     # Read volume mesh.
-    file_name = sys.argv[1]
-    volume_mesh = read_volume_mesh(file_name)
+    volume_mesh = read_volume_mesh(args.volume_mesh)
 
     # Read surface mesh.
-    file_name = sys.argv[2]
-    surface_mesh = read_surface_mesh(file_name)
-
-    new_volume_mesh = add_wall_property_array(volume_mesh, surface_mesh)
-
-    write_volume_mesh(new_volume_mesh, "wallprop.vtu")
+    surface_mesh = read_surface_mesh(args.surface_mesh)
 
+    new_volume_mesh = add_wall_property_array(volume_mesh, surface_mesh, args)
 
+    write_volume_mesh(new_volume_mesh, args.output_file)